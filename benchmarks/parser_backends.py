@@ -0,0 +1,76 @@
+#!/usr/bin/python
+"""Compare the tokenizer and pyparsing backends of the Parser.
+
+Usage: parser_backends.py [--repeat N] [<file.def> ...]
+
+Without files a large synthetic definition file is used.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import argparse
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.parser import _grammar
+from cleanroom.tokenizer import tokenize
+
+
+def _synthetic_definition(commands: int) -> str:
+    lines = ['based_on type-base']
+    for i in range(commands):
+        lines.append('pacman ' + '\n    '.join('package-{}-{}'.format(i, p)
+                                               for p in range(40)))
+        lines.append('# Comment {}'.format(i))
+        lines.append('create /etc/file{} <<<<line 1\nline 2\n'
+                     '  indented line 3>>>> mode=0o644'.format(i))
+        lines.append('set KEY_{} "some \\"quoted\\" value"'.format(i))
+    return '\n'.join(lines) + '\n'
+
+
+def _pyparsing(data: str) -> None:
+    _grammar().parseString(data, parseAll=True)
+
+
+def _tokenizer(data: str) -> None:
+    tokenize(data, '<benchmark>')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--commands', type=int, default=250,
+                        help='Size of the synthetic definition file.')
+    parser.add_argument('files', nargs='*')
+    args = parser.parse_args()
+
+    inputs = []
+    for f in args.files:
+        with open(f, 'r') as fd:
+            inputs.append((f, fd.read()))
+    if not inputs:
+        inputs.append(('<synthetic>', _synthetic_definition(args.commands)))
+
+    _grammar()  # Do not measure grammar generation
+
+    for (name, data) in inputs:
+        print('{} ({} bytes, {} lines):'
+              .format(name, len(data), data.count('\n')))
+        results = {}
+        for (backend, func) in (('pyparsing', _pyparsing),
+                                ('tokenizer', _tokenizer)):
+            results[backend] = min(timeit.repeat(lambda: func(data),
+                                                 repeat=args.repeat,
+                                                 number=1))
+            print('    {:10} {:8.2f}ms'.format(backend,
+                                               results[backend] * 1000))
+        print('    speedup    {:8.1f}x'
+              .format(results['pyparsing'] / results['tokenizer']))
+
+
+if __name__ == '__main__':
+    main()
@@ -28,7 +28,6 @@ class Binaries(Enum):
     SBSIGN = auto()
     OBJCOPY = auto()
     MKSQUASHFS = auto()
-    VERITYSETUP = auto()
     TAR = auto()
     USERMOD = auto()
     USERADD = auto()
@@ -41,6 +40,15 @@ class Binaries(Enum):
     QEMU_IMG = auto()
     QEMU_NBD = auto()
     MKFS_VFAT = auto()
+    MKFS_EROFS = auto()
+    MCOPY = auto()
+    MMD = auto()
+    MKSWAP = auto()
+
+
+# Binaries that are only needed for some features:
+_OPTIONAL_BINARIES = (Binaries.MKFS_EROFS, Binaries.MCOPY, Binaries.MMD,
+                      Binaries.MKSWAP)
 
 
 def _check_for_binary(binary: str) -> str:
@@ -80,6 +88,9 @@ def _find_binaries() -> typing.Dict[Binaries, str]:
         Binaries.QEMU_IMG: _check_for_binary('/usr/bin/qemu-img'),
         Binaries.QEMU_NBD: _check_for_binary('/usr/bin/qemu-nbd'),
         Binaries.MKFS_VFAT: _check_for_binary('/usr/bin/mkfs.vfat'),
+        Binaries.MKFS_EROFS: _check_for_binary('/usr/bin/mkfs.erofs'),
+        Binaries.MCOPY: _check_for_binary('/usr/bin/mcopy'),
+        Binaries.MMD: _check_for_binary('/usr/bin/mmd'),
     }
     os_binaries: typing.Dict[Binaries, str] = {}
     distribution = _get_distribution()
@@ -89,13 +100,13 @@ def _find_binaries() -> typing.Dict[Binaries, str]:
             Binaries.APT_GET: _check_for_binary('/usr/bin/apt-get'),
             Binaries.DPKG: _check_for_binary('/usr/bin/dpkg'),
             Binaries.DEBOOTSTRAP: _check_for_binary('/usr/sbin/debootstrap'),
-            Binaries.VERITYSETUP: _check_for_binary('/usr/sbin/veritysetup'),
+            Binaries.MKSWAP: _check_for_binary('/usr/sbin/mkswap'),
         }
     elif distribution == "arch" or distribution == "archlinux":
         os_binaries = {
             Binaries.PACMAN: _check_for_binary('/usr/bin/pacman'),
             Binaries.PACMAN_KEY: _check_for_binary('/usr/bin/pacman-key'),
-            Binaries.VERITYSETUP: _check_for_binary('/usr/bin/veritysetup'),
+            Binaries.MKSWAP: _check_for_binary('/usr/bin/mkswap'),
         }
     else:
         fail("Unsupported Linux flavor (detected was \"{}\").".format(distribution))
@@ -116,6 +127,8 @@ class BinaryManager:
         for b in self._binaries.items():
             if b[1]:
                 debug('{} found: {}...'.format(b[0], b[1]))
+            elif b[0] in _OPTIONAL_BINARIES:
+                debug('{} not found (optional).'.format(b[0]))
             else:
                 warn('{} not found.'.format(b[0]))
                 passed = False
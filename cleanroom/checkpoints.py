@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Checkpoints taken while generating a system.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .helper.btrfs import BtrfsHelper
+from .printer import debug, trace, verbose
+from .systemcontext import SystemContext
+
+import os
+import os.path
+import typing
+
+
+_EXPENSIVE_COMMANDS = ('based_on', 'debootstrap', 'pacman', 'pacstrap',)
+
+
+def _is_expensive(command: str) -> bool:
+    return command in _EXPENSIVE_COMMANDS or command.startswith('pkg_')
+
+
+class Checkpoints:
+    """Snapshots of a scratch directory after commands were executed.
+
+    A checkpoint is keyed by the rolling input hash of the ExecObjects
+    that were executed before it was taken, so a checkpoint is reused
+    exactly when the commands leading up to it did not change.
+
+    Modes: "none" (take no checkpoints), "expensive" (take checkpoints
+    after commands installing software) and "all" (take checkpoints after
+    every command)."""
+
+    MODES = ('none', 'expensive', 'all',)
+
+    def __init__(self, btrfs_helper: BtrfsHelper, directory: str, *,
+                 mode: str = 'expensive') -> None:
+        """Constructor."""
+        assert mode in Checkpoints.MODES
+        self._btrfs_helper = btrfs_helper
+        self._directory = directory
+        self._mode = mode
+
+    def _system_directory(self, system_name: str) -> str:
+        return os.path.join(self._directory, system_name)
+
+    def _checkpoint_directory(self, system_name: str, prefix_hash: str) -> str:
+        return os.path.join(self._system_directory(system_name), prefix_hash)
+
+    def should_create(self, command: str) -> bool:
+        """Check whether a checkpoint should get taken after command."""
+        if self._mode == 'all':
+            return True
+        if self._mode == 'expensive':
+            return _is_expensive(command)
+        return False
+
+    def find(self, system_name: str,
+             prefix_hashes: typing.Sequence[str]) -> int:
+        """Find the longest prefix with a checkpoint.
+
+        Return the index of the last ExecObject covered by the checkpoint
+        or -1 if there is no usable checkpoint."""
+        for index in range(len(prefix_hashes) - 1, -1, -1):
+            checkpoint = self._checkpoint_directory(system_name,
+                                                    prefix_hashes[index])
+            if os.path.isfile(os.path.join(checkpoint, 'state.bin')):
+                return index
+        return -1
+
+    def create(self, system_context: SystemContext, prefix_hash: str) -> None:
+        """Take a checkpoint of the scratch directory."""
+        if not os.path.isdir(system_context.fs_directory):
+            return
+
+        checkpoint = self._checkpoint_directory(system_context.system_name,
+                                                prefix_hash)
+        if os.path.isdir(checkpoint):
+            return
+
+        debug('Creating checkpoint {} for "{}".'
+              .format(prefix_hash, system_context.system_name))
+        os.makedirs(self._system_directory(system_context.system_name),
+                    exist_ok=True)
+
+        partial = checkpoint + '.partial'
+        if os.path.isdir(partial):
+            self._btrfs_helper.delete_subvolume_recursive(partial)
+        self._btrfs_helper.create_subvolume(partial)
+
+        for (source, name) in ((system_context.fs_directory, 'fs'),
+                               (system_context.meta_directory, 'meta'),
+                               (system_context.boot_directory, 'boot')):
+            self._btrfs_helper.create_snapshot(source,
+                                               os.path.join(partial, name),
+                                               read_only=True)
+        system_context.save_state(os.path.join(partial, 'state.bin'))
+
+        os.rename(partial, checkpoint)
+
+    def restore(self, system_context: SystemContext, prefix_hash: str) -> None:
+        """Restore the scratch directory from a checkpoint."""
+        checkpoint = self._checkpoint_directory(system_context.system_name,
+                                                prefix_hash)
+        verbose('Resuming "{}" from checkpoint {}.'
+                .format(system_context.system_name, prefix_hash))
+
+        if not os.path.isdir(system_context.scratch_directory):
+            self._btrfs_helper.create_subvolume(
+                system_context.scratch_directory)
+
+        for (target, name) in ((system_context.fs_directory, 'fs'),
+                               (system_context.meta_directory, 'meta'),
+                               (system_context.boot_directory, 'boot')):
+            self._btrfs_helper.create_snapshot(os.path.join(checkpoint, name),
+                                               target)
+        self._btrfs_helper.create_subvolume(system_context.cache_directory)
+
+        system_context.restore_state(os.path.join(checkpoint, 'state.bin'))
+
+    def prune(self, system_name: str,
+              prefix_hashes: typing.Sequence[str]) -> None:
+        """Remove all checkpoints of a system that are not in prefix_hashes."""
+        system_directory = self._system_directory(system_name)
+        if not os.path.isdir(system_directory):
+            return
+
+        with os.scandir(system_directory) as it:
+            for entry in it:
+                if entry.name in prefix_hashes:
+                    continue
+                trace('Removing outdated checkpoint {}.'.format(entry.path))
+                self._btrfs_helper.delete_subvolume_recursive(entry.path)
@@ -13,6 +13,7 @@ from __future__ import annotations
 from .binarymanager import Binaries
 from .exceptions import GenerateError, ParseError
 from .execobject import ExecObject
+from .hookrunner import HookPaths, run_hooks, static_prefix
 from .location import Location
 from .printer import fail, h3, success, verbose
 from .systemcontext import SystemContext
@@ -23,6 +24,10 @@ from string import Template
 import typing
 
 
+# The chroot helper mounts these when running something inside the system:
+_CHROOT_PATHS = ('/dev', '/proc', '/sys', '/run', '/tmp', '/etc/resolv.conf')
+
+
 def stringify(command: str, args: typing.Tuple[typing.Any, ...],
               kwargs: typing.Mapping[str, typing.Any]):
     args_str = ' "' + '" "'.join(map(lambda a: str(a), args)) + '"' \
@@ -101,6 +106,15 @@ class Command:
         """Maybe implement this, but this default should be ok."""
         return None
 
+    def hook_paths(self, *args: typing.Any, **kwargs: typing.Any) \
+            -> HookPaths:
+        """Maybe implement this: Paths in the system the command touches.
+
+        Glob patterns are fine. Hooks with known paths may run concurrently
+        with other hooks touching different paths. The default (None)
+        makes the command run on its own."""
+        return None
+
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
         """Implement this!"""
@@ -117,9 +131,12 @@ class Command:
 
     def _add_hook(self, location: Location, system_context: SystemContext,
                   hook_name: str, command: str,
-                  *args: typing.Any, **kwargs: typing.Any) \
+                  *args: typing.Any, hook_paths: HookPaths = None,
+                  **kwargs: typing.Any) \
             -> None:
-        """Add a hook."""
+        """Add a hook.
+
+        hook_paths overrides the paths the command declares for itself."""
         command_info = self._service('command_manager').command(command)
         if not command_info:
             raise ParseError('Command "{}" not found.'.format(command))
@@ -129,7 +146,8 @@ class Command:
                                 ExecObject(location=location,
                                            command=command,
                                            args=args,
-                                           kwargs=kwargs))
+                                           kwargs=kwargs,
+                                           paths=hook_paths))
 
     def _run_hooks(self, system_context: SystemContext, hook_name: str) \
             -> None:
@@ -139,14 +157,32 @@ class Command:
 
         h3('Running "{}" hooks.'.format(hook_name))
 
-        for hook in system_context.hooks(hook_name):
-            command_info \
-                = self._service('command_manager').command(hook.command)
-            if not command_info:
+        command_manager = self._service('command_manager')
+        hooks = system_context.hooks(hook_name)
+        for hook in hooks:
+            if not command_manager.command(hook.command):
                 raise GenerateError('Command "{}" not found.'
                                     .format(hook.command))
-            command_info.execute_func(hook.location, system_context,
-                                      *hook.args, **hook.kwargs)
+
+        def execute(hook: ExecObject) -> None:
+            command_manager.command(hook.command).execute_func(
+                hook.location, system_context, *hook.args, **hook.kwargs)
+
+        def paths(hook: ExecObject) -> HookPaths:
+            if 'work_directory' in hook.kwargs:
+                return None  # Changes the working directory of the process
+            hook_paths = hook.paths if hook.paths is not None \
+                else command_manager.command(hook.command).hook_paths_func(
+                    *hook.args, **hook.kwargs)
+            if hook_paths is None:
+                return None
+            if hook.kwargs.get('inside', False):
+                hook_paths = (*hook_paths, *_CHROOT_PATHS)
+            return tuple(os.path.realpath(system_context.file_name(
+                static_prefix(str(p)))) for p in hook_paths)
+
+        run_hooks(hooks, execute, paths=paths,
+                  jobs=command_manager.hook_jobs)
 
         success('Hooks "{}" were run successfully.'.format(hook_name),
                 verbosity=1)
@@ -7,11 +7,14 @@
 
 from .command import Command, stringify
 from .exceptions import PreflightError
+from .inputhash import hash_file, hash_tree
 from .location import Location
 from .printer import debug, h2, success, trace
+from .profiler import Profiler
 from .systemcontext import SystemContext
 
 import collections
+import hashlib
 import importlib.util
 import inspect
 import os
@@ -22,7 +25,7 @@ CommandInfo = collections.namedtuple('CommandInfo',
                                      ['name', 'syntax_string', 'help_string',
                                       'file_name',
                                       'dependency_func', 'validate_func',
-                                      'execute_func'])
+                                      'execute_func', 'hook_paths_func'])
 
 
 class CommandManager:
@@ -34,6 +37,8 @@ class CommandManager:
         self._search_directories = command_directories
         self._services_to_propagate = services
         self._services_to_propagate['command_manager'] = self
+        self._digest = ''
+        self._profiler: typing.Optional[Profiler] = None
         self._find_commands(*command_directories)
 
     def print_commands(self) -> None:
@@ -61,6 +66,33 @@ class CommandManager:
             -> typing.Optional[CommandInfo]:
         return self._commands.get(name, None)
 
+    def digest(self) -> str:
+        """Hash of the source and helper files of all known commands."""
+        if not self._digest:
+            digest = hashlib.sha256()
+            for name in sorted(self._commands.keys()):
+                file_name = self._commands[name].file_name
+                digest.update(name.encode('utf-8') + b'\0')
+                if os.path.isfile(file_name):
+                    hash_file(digest, file_name)
+                hash_tree(digest, os.path.join(os.path.dirname(file_name),
+                                               'helper', name))
+            self._digest = digest.hexdigest()
+            trace('Commands digest: {}.'.format(self._digest))
+        return self._digest
+
+    def set_profiler(self, profiler: typing.Optional[Profiler]) -> None:
+        """Measure all executed commands with profiler."""
+        self._profiler = profiler
+
+    @property
+    def hook_jobs(self) -> int:
+        """Number of hooks to run concurrently.
+
+        Resource usage can not be attributed to concurrently running
+        hooks, so they run one by one while profiling."""
+        return 1 if self._profiler else os.cpu_count() or 1
+
     def _add_command(self, name: str, file_name: str, command: typing.Any) \
             -> None:
         def __validate_func(cmd: Command, location: Location,
@@ -86,7 +118,12 @@ class CommandManager:
                            *args: typing.Any, **kwargs: typing.Any) -> None:
             cmd_str = stringify(cmd.name, args, kwargs)
             trace('{}: Executing {}.'.format(location, cmd_str))
-            command(location, system_context, *args, **kwargs)
+            if self._profiler:
+                with self._profiler.measure(system_context.system_name,
+                                            cmd.name, location):
+                    command(location, system_context, *args, **kwargs)
+            else:
+                command(location, system_context, *args, **kwargs)
             success('{}: Executed {}.'.format(location, cmd_str), verbosity=2)
 
         self._commands[name] \
@@ -99,7 +136,8 @@ class CommandManager:
                           validate_func=lambda loc, *args, **kwargs:
                               __validate_func(command, loc, *args, **kwargs),
                           execute_func=lambda loc, sc, *args, **kwargs:
-                              __execute_func(command, loc, sc, *args, **kwargs))
+                              __execute_func(command, loc, sc, *args, **kwargs),
+                          hook_paths_func=command.hook_paths)
 
     def _find_commands_in_directory(self, directory: str) -> None:
         for f in os.listdir(directory):
@@ -5,6 +5,7 @@
 """
 
 from cleanroom.command import Command
+from cleanroom.hookrunner import HookPaths
 from cleanroom.location import Location
 from cleanroom.printer import debug
 from cleanroom.systemcontext import SystemContext
@@ -27,6 +28,13 @@ class StripDocumentationHookCommand(Command):
         """Validate arguments."""
         self._validate_no_arguments(location, *args, **kwargs)
 
+    def hook_paths(self, *args: typing.Any, **kwargs: typing.Any) \
+            -> HookPaths:
+        """Paths touched when run as hook."""
+        return ('/usr/share/doc', '/usr/share/gtk-doc/html',
+                '/usr/share/help', '/usr/share/man', '/usr/share/info',
+                '/usr/bin/man', '/usr/bin/info')
+
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
         """Execute command."""
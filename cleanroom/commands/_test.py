@@ -5,7 +5,10 @@
 """
 
 from cleanroom.command import Command
-from cleanroom.helper.run import run, report_completed_process
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.testrunner import (TestResult, output, passed,
+                                         run_tests, slowest, write_json,
+                                         write_junit)
 from cleanroom.location import Location
 from cleanroom.printer import debug, fail, h2, info, msg, success, trace
 from cleanroom.systemcontext import SystemContext
@@ -15,6 +18,9 @@ import os.path
 import typing
 
 
+_DEFAULT_TIMEOUT = 0  # No limit
+
+
 def _environment(system_context: SystemContext) -> typing.Mapping[str, str]:
     """Generate environment for the system tests."""
     result = {k: str(v) for k, v in system_context.substitutions.items()}
@@ -40,21 +46,49 @@ def _find_tests(system_context: SystemContext) -> typing.Generator[str, None, No
         yield test
 
 
+def _int_setting(location: Location, system_context: SystemContext,
+                 kwargs: typing.Mapping[str, typing.Any],
+                 key: str, substitution: str, default: int, *,
+                 minimum: int) -> int:
+    """Get a setting from kwargs, a substitution or the default."""
+    value = kwargs.get(key, system_context.substitution(substitution))
+    if value is None:
+        return default
+    error = GenerateError('"{}" is not a valid value for {} (or {}).'
+                          .format(value, key, substitution),
+                          location=location)
+    try:
+        result = int(value)
+    except ValueError:
+        raise error from None
+    if result < minimum:
+        raise error
+    return result
+
+
 class _TestCommand(Command):
     """The _test Command."""
 
     def __init__(self, **services: typing.Any) -> None:
         """Constructor."""
-        super().__init__('_test',
+        super().__init__('_test', syntax='[jobs=<CPUS>] [timeout=0]',
                          help_string='Implicitly run to test images.\n\n'
                          'Note: Will run all executable files in the '
                          '"test" subdirectory of the systems directory and '
-                         'will pass the system name as first argument.',
+                         'will pass the system name as first argument.\n'
+                         'Up to jobs tests run at the same time, tests '
+                         'taking longer than timeout seconds fail (0, the '
+                         'default, for no limit). TEST_JOBS and TEST_TIMEOUT '
+                         'substitutions change the defaults. JUnit and '
+                         'JSON results and '
+                         'logs of all tests are written into the '
+                         '"test_results" meta directory.',
                          file=__file__, **services)
 
     def validate(self, location: Location,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
-        self._validate_no_arguments(location, *args, **kwargs)
+        self._validate_no_args(location, *args)
+        self._validate_kwargs(location, ('jobs', 'timeout',), **kwargs)
 
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
@@ -63,14 +97,47 @@ class _TestCommand(Command):
            .format(system_context.system_name),
            verbosity=2)
         env = _environment(system_context)
+        jobs = _int_setting(location, system_context, kwargs, 'jobs',
+                            'TEST_JOBS', os.cpu_count() or 1, minimum=1)
+        timeout = _int_setting(location, system_context, kwargs, 'timeout',
+                               'TEST_TIMEOUT', _DEFAULT_TIMEOUT, minimum=0)
+        results_directory = os.path.join(system_context.meta_directory,
+                                         'test_results')
 
-        for test in _find_tests(system_context):
-            debug('Running test {}...'.format(test))
-            test_result = run(test, system_context.system_name,
-                              env=env, returncode=None,
-                              work_directory=system_context.fs_directory)
-            if test_result.returncode == 0:
-                success('Test "{}"'.format(test), verbosity=3)
+        def report(result: TestResult) -> None:
+            if passed(result):
+                success('Test "{}" ({:.2f}s)'.format(result.name,
+                                                     result.duration),
+                        verbosity=3)
             else:
-                report_completed_process(msg, test_result)
-                fail('Test "{}"'.format(test))
+                info('Test "{}" failed{}.'.format(
+                    result.name, ' (timed out after {}s)'.format(timeout)
+                    if result.timed_out else ''))
+
+        tests = list(_find_tests(system_context))
+        debug('Running {} tests with {} jobs...'.format(len(tests), jobs))
+        results = run_tests(tests, system_context.system_name, env=env,
+                            work_directory=system_context.fs_directory,
+                            log_directory=os.path.join(results_directory,
+                                                       'logs'),
+                            jobs=jobs, timeout=timeout, on_result=report)
+
+        write_junit(results, os.path.join(results_directory, 'junit.xml'),
+                    suite_name=system_context.system_name)
+        write_json(results, os.path.join(results_directory, 'results.json'))
+
+        if results:
+            msg('Slowest tests: {}.'.format(', '.join(
+                '{} ({:.2f}s)'.format(r.name, r.duration)
+                for r in slowest(results))))
+
+        failed = [r for r in results if not passed(r)]
+        for result in failed:
+            msg('Output of failed test "{}":'.format(result.name))
+            for line in output(result).split('\n'):
+                msg('    {}'.format(line))
+        if failed:
+            fail('{} of {} tests failed: {} (results in "{}").'.format(
+                len(failed), len(results),
+                ', '.join('"{}"'.format(r.name) for r in failed),
+                results_directory))
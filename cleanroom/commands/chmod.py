@@ -6,6 +6,7 @@
 
 
 from cleanroom.command import Command
+from cleanroom.hookrunner import HookPaths
 from cleanroom.helper.file import chmod
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
@@ -29,6 +30,11 @@ class ChmodCommand(Command):
                                           '"{}" takes a mode and one '
                                           'or more files.', *args, **kwargs)
 
+    def hook_paths(self, *args: typing.Any, **kwargs: typing.Any) \
+            -> HookPaths:
+        """Paths touched when run as hook."""
+        return args[1:]
+
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
         """Execute command."""
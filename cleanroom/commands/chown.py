@@ -6,6 +6,7 @@
 
 
 from cleanroom.command import Command
+from cleanroom.hookrunner import HookPaths
 from cleanroom.helper.file import chown
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
@@ -30,6 +31,11 @@ class ChownCommand(Command):
                                      '"{}" takes one or more files.', *args)
         self._validate_kwargs(location, ('user', 'group', 'recursive',), **kwargs)
 
+    def hook_paths(self, *args: typing.Any, **kwargs: typing.Any) \
+            -> HookPaths:
+        """Paths touched when run as hook (users and groups get read)."""
+        return (*args, '/etc/passwd', '/etc/group')
+
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
         """Execute command."""
@@ -8,34 +8,61 @@
 from cleanroom.binarymanager import Binaries
 from cleanroom.command import Command
 from cleanroom.exceptions import GenerateError
+from cleanroom.helper.datacopy import concatenate, copy_file
+from cleanroom.helper.efikernel import create_unified_kernel
+from cleanroom.helper.packagecache import PackageCache
 from cleanroom.helper.run import run
 from cleanroom.location import Location
 from cleanroom.systemcontext import SystemContext
-from cleanroom.printer import debug
+from cleanroom.printer import debug, info
 
 from glob import glob
+import hashlib
+import os
 import os.path
 import tempfile
 import typing
 
 
+# Change this when the image layout changes, to invalidate cached images:
+_CACHE_VERSION = b'1'
+
+
 def _create_initrd(directory: str, *files: str) -> str:
     target = os.path.join(directory, 'initrd')
-    with open(target, "wb") as target_file:
-        for f in files:
-            with open(f, 'rb') as source_file:
-                target_file.write(source_file.read())
+    fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC,
+                 0o644)
+    try:
+        concatenate(fd, 0, *files)
+    finally:
+        os.close(fd)
     return target
 
 
+def _cmdline_data(cmdline: str) -> bytes:
+    return cmdline.encode('utf-8') + b'\0\0'
+
+
 def _create_cmdline_file(directory: str, cmdline: str) -> str:
     target = os.path.join(directory, 'cmdline')
     with open(target, "wb") as cmdline_file:
-        cmdline_file.write(cmdline.encode('utf-8'))
-        cmdline_file.write(b'\0\0')
+        cmdline_file.write(_cmdline_data(cmdline))
     return target
 
 
+def _cache_key(cmdline: str, *files: str) -> str:
+    """Hash the contents of all files going into the EFI kernel."""
+    digest = hashlib.sha256(_CACHE_VERSION)
+    digest.update(b'\0' + _cmdline_data(cmdline))
+    for f in files:
+        with open(f, 'rb') as fd:
+            digest.update(b'\0' + str(os.fstat(fd.fileno()).st_size)
+                          .encode('ascii') + b'\0')
+            for chunk in iter(lambda: fd.read(1024 * 1024), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
 def _get_initrd_parts(location: Location, path: str) -> typing.List[str]:
     if not path:
         raise GenerateError('No initrd-parts directory.', location=location)
@@ -59,7 +86,7 @@ class CreateEfiKernelCommand(Command):
         super().__init__('create_efi_kernel',
                          syntax='<EFI_KERNEL> kernel=<KERNEL> '
                          'initrd_directory=<INITRD_PARTS_DIRECTORY> '
-                         'commandline=<KERNEL_COMMANDLINE>',
+                         'commandline=<KERNEL_COMMANDLINE> [cache=True]',
                          help_string='Create a efi kernel with built-in initrd.',
                          file=__file__, **services)
 
@@ -70,7 +97,8 @@ class CreateEfiKernelCommand(Command):
                                                'image to create.',
                                   *args)
         self._validate_kwargs(location,
-                              ('kernel', 'initrd_directory', 'commandline'),
+                              ('kernel', 'initrd_directory', 'commandline',
+                               'cache'),
                               **kwargs)
         self._require_kwargs(location,
                              ('kernel', 'initrd_directory', 'commandline'),
@@ -107,21 +135,59 @@ class CreateEfiKernelCommand(Command):
         debug('{}: osrelease: {}.'.format(self.name, osrelease_file))
         debug('{}: efistub  : {}.'.format(self.name, efistub))
 
-        self._validate_files(kernel, *initrd_files, osrelease_file, efistub)
+        self._validate_files(location, kernel, *initrd_files,
+                             osrelease_file, efistub)
+
+        package_cache = PackageCache(system_context.package_cache_directory) \
+            if system_context.package_cache_directory \
+            and kwargs.get('cache', True) else None
+        if not package_cache:
+            self._create(output, kernel=kernel, initrd_files=initrd_files,
+                         cmdline=cmdline_input, osrelease=osrelease_file,
+                         efistub=efistub)
+            return
+
+        key = _cache_key(cmdline_input, efistub, kernel, osrelease_file,
+                         *initrd_files)
+        cached = os.path.join(package_cache.subdirectory('efi-kernels'),
+                              key + '.efi')
+        with package_cache.locked(exclusive=False):
+            if os.path.isfile(cached):
+                info('Reusing cached EFI kernel {}.'.format(key))
+                copy_file(cached, output)
+                os.utime(cached)  # Mark as used for eviction
+                return
+
+        self._create(output, kernel=kernel, initrd_files=initrd_files,
+                     cmdline=cmdline_input, osrelease=osrelease_file,
+                     efistub=efistub)
+        with package_cache.locked(exclusive=True):
+            debug('Caching EFI kernel {}.'.format(key))
+            copy_file(output, cached + '.tmp')
+            os.replace(cached + '.tmp', cached)
+
+    def _create(self, output: str, *, kernel: str,
+                initrd_files: typing.List[str], cmdline: str,
+                osrelease: str, efistub: str) -> None:
+        if create_unified_kernel(output, efistub,
+                                 [('.osrel', [osrelease]),
+                                  ('.cmdline', _cmdline_data(cmdline)),
+                                  ('.linux', [kernel]),
+                                  ('.initrd', initrd_files)]):
+            return
+
+        debug('Falling back to objcopy to create EFI kernel.')
         with tempfile.TemporaryDirectory() as tmp:
             initrd = _create_initrd(tmp, *initrd_files)
-            cmdline = _create_cmdline_file(tmp, cmdline_input)
+            cmdline_file = _create_cmdline_file(tmp, cmdline)
 
             run(self._binary(Binaries.OBJCOPY),
-                '--add-section', '.osrel={}'.format(osrelease_file),
+                '--add-section', '.osrel={}'.format(osrelease),
                 '--change-section-vma', '.osrel=0x20000',
-                '--add-section', '.cmdline={}'.format(cmdline),
+                '--add-section', '.cmdline={}'.format(cmdline_file),
                 '--change-section-vma', '.cmdline=0x30000',
                 '--add-section', '.linux={}'.format(kernel),
                 '--change-section-vma', '.linux=0x40000',
                 '--add-section', '.initrd={}'.format(initrd),
                 '--change-section-vma', '.initrd=0x3000000',
                 efistub, output)
-
-            os.remove(initrd)
-            os.remove(cmdline)
@@ -280,6 +280,7 @@ class CreateInitrdCommand(Command):
                                      
                                      # squashfs:
                                      add_module squashfs
+                                     add_module erofs?
                                      
                                      # /var setup
                                      if test -e "/usr/lib/systemd/system/sysroot-var.mount" ; then
@@ -35,7 +35,9 @@ class EnsureHwdbCommand(Command):
         location.set_description('Update HWDB')
         self._add_hook(location, system_context,
                        'export', 'run', '/usr/bin/systemd-hwdb',
-                       '--usr', 'update', inside=True)
+                       '--usr', 'update', inside=True,
+                       hook_paths=('/usr/bin/systemd-hwdb', '/usr/lib/udev',
+                                   '/etc/udev'))
         location.set_description('Remove HWDB data')
         self._add_hook(location, system_context,
                        'export', 'remove', '/usr/bin/systemd-hwdb')
@@ -34,7 +34,9 @@ class EnsureLdconfigCommand(Command):
 
         location.set_description('Run ldconfig')
         self._add_hook(location, system_context,
-                       'export', 'run', '/usr/bin/ldconfig', '-X', inside=True)
+                       'export', 'run', '/usr/bin/ldconfig', '-X', inside=True,
+                       hook_paths=('/usr/bin/ldconfig', '/usr/lib', '/etc/ld.so.conf',
+                                   '/etc/ld.so.conf.d', '/etc/ld.so.cache'))
         location.set_description('Remove ldconfig data')
         # self._add_hook(location, system_context,
         #                'export', 'remove', '/usr/bin/ldconfig')
@@ -11,15 +11,18 @@ from cleanroom.exceptions import GenerateError, ParseError
 from cleanroom.location import Location
 from cleanroom.helper.file import exists
 from cleanroom.helper.run import run
+from cleanroom.helper.verity import create_verity
 from cleanroom.systemcontext import SystemContext
 import cleanroom.helper.disk as disk
 from cleanroom.imager import ExtraPartition, create_image, \
                              parse_extra_partitions
-from cleanroom.printer import debug, h2, info, verbose
+from cleanroom.printer import debug, h2, info, msg, verbose
 
 
+import os
 import os.path
 import shutil
+import time
 import typing
 
 
@@ -45,38 +48,64 @@ def _size_extend(file: str) -> None:
     if to_add == 0:
         return
 
-    with open(file, 'ab') as f:
-        f.write(b'\0' * to_add)
+    # Extend with a hole: It reads as zeros and is not copied into images.
+    os.truncate(file, size + to_add)
 
 
-def _create_dmverity(target_directory: str, squashfs_file: str, *,
-                     timestamp: str, veritysetup_command: str) \
-        -> typing.Tuple[str, str, str]:
+_SQUASHFS_COMPRESSION_LEVEL = 15
+_SQUASHFS_BLOCK_SIZE = '128K'
+
+# (compression level, block size) combinations tried by squashfs_benchmark:
+_SQUASHFS_BENCHMARK_SETTINGS = ((3, '128K'), (3, '1M'), (15, '128K'),
+                                (15, '1M'), (19, '1M'),)
+
+
+def _squashfs_options(*, processors: int, compression_level: int,
+                      block_size: str, sort_file: str) -> typing.List[str]:
+    options = ['-comp', 'zstd', '-processors', str(processors),
+               '-Xcompression-level', str(compression_level),
+               '-b', block_size]
+    if sort_file:
+        options += ['-sort', sort_file]
+    return options
+
+
+# erofs compressions that take a compression level:
+_EROFS_LEVELED_COMPRESSIONS = ('lz4hc', 'zstd',)
+
+
+def _erofs_options(*, workers: int, compression: str,
+                   compression_level: int) -> typing.List[str]:
+    return ['-z', '{},{}'.format(compression, compression_level)
+            if compression_level else compression,
+            '--workers={}'.format(workers)]
+
+
+def _erofs_exclude_options(fs_directory: str) -> typing.List[str]:
+    """Exclude everything but usr from an erofs image of fs_directory.
+
+    mkfs.erofs has no equivalent of mksquashfs' -keep-as-directory."""
+    return ['--exclude-path={}'.format(e)
+            for e in sorted(os.listdir(fs_directory)) if e != 'usr']
+
+
+def _create_dmverity(target_directory: str, root_file: str, *,
+                     timestamp: str) -> typing.Tuple[str, str, str]:
     verity_file = os.path.join(target_directory, 'vrty_{}'
                                .format(timestamp))
-    result = run(veritysetup_command, 'format', squashfs_file, verity_file)
+    (uuid, root_hash) = create_verity(root_file, verity_file)
 
     _size_extend(verity_file)
 
-    root_hash = None
-    uuid = None
-    for line in result.stdout.split('\n'):
-        if line.startswith('Root hash:'):
-            root_hash = line[10:].strip()
-        if line.startswith('UUID:'):
-            uuid = line[10:].strip()
-
-    assert root_hash is not None
-    assert uuid is not None
     return verity_file, uuid, root_hash
 
 
 def _setup_kernel_commandline(base_cmdline: str,
-                              squashfs_device: str, verity_device: str,
+                              root_device: str, verity_device: str,
                               root_hash: str) -> str:
     cmdline = ' '.join((base_cmdline,
                         'systemd.verity=yes',
-                        'systemd.verity_root_data={}'.format(squashfs_device),
+                        'systemd.verity_root_data={}'.format(root_device),
                         'systemd.verity_root_hash={}'.format(verity_device),
                         'roothash={}'.format(root_hash),
                         'FOO'))
@@ -123,16 +152,38 @@ class ExportCommand(Command):
 
         self._skip_validation = False
 
+        self._squashfs_processors = 1
+        self._squashfs_compression_level = _SQUASHFS_COMPRESSION_LEVEL
+        self._squashfs_block_size = _SQUASHFS_BLOCK_SIZE
+        self._squashfs_sort_file = ''
+        self._squashfs_benchmark = False
+
+        self._root_fs = 'squashfs'
+        self._erofs_workers = 1
+        self._erofs_compression = 'lz4hc'
+        self._erofs_compression_level = 0
+
         super().__init__('export',
-                         syntax='REPOSITORY '
-                                '[efi_key=<KEY>] [efi_cert=<CERT>] '
-                                '[efi_size=0M] [swap_size=0M] '
-                                '[extra_partitions=p1,p2,...] '
-                                '[image_format=(raw|qcow2)] '
-                                '[repository_compression=zstd] '
-                                '[repository_compression_level=5] '
-                                '[skip_validation=False] '
-                                '[usr_only=True]',
+                         syntax=('REPOSITORY '
+                                 '[efi_key=<KEY>] [efi_cert=<CERT>] '
+                                 '[efi_size=0M] [swap_size=0M] '
+                                 '[extra_partitions=p1,p2,...] '
+                                 '[image_format=(raw|qcow2)] '
+                                 '[repository_compression=zstd] '
+                                 '[repository_compression_level=5] '
+                                 '[skip_validation=False] '
+                                 '[root_fs=(squashfs|erofs)] '
+                                 '[squashfs_processors=<CPUS>] '
+                                 '[squashfs_compression_level={}] '
+                                 '[squashfs_block_size={}] '
+                                 '[squashfs_sort_file=<FILE>] '
+                                 '[squashfs_benchmark=False] '
+                                 '[erofs_workers=<CPUS>] '
+                                 '[erofs_compression=(lz4|lz4hc|zstd)] '
+                                 '[erofs_compression_level=<LEVEL>] '
+                                 '[usr_only=True]')
+                         .format(_SQUASHFS_COMPRESSION_LEVEL,
+                                 _SQUASHFS_BLOCK_SIZE),
                          help_string='Export a filesystem image.',
                          file=__file__, **services)
 
@@ -147,7 +198,15 @@ class ExportCommand(Command):
                                          'image_format',
                                          'repository_compression',
                                          'repository_compression_level',
-                                         'skip_validation', 'usr_only'),
+                                         'skip_validation', 'root_fs',
+                                         'squashfs_processors',
+                                         'squashfs_compression_level',
+                                         'squashfs_block_size',
+                                         'squashfs_sort_file',
+                                         'squashfs_benchmark',
+                                         'erofs_workers', 'erofs_compression',
+                                         'erofs_compression_level',
+                                         'usr_only'),
                               **kwargs)
 
         if 'key' in kwargs:
@@ -174,6 +233,51 @@ class ExportCommand(Command):
                              .format(repo_compression),
                              location=location)
 
+        root_fs = kwargs.get('root_fs', 'squashfs')
+        if root_fs not in ('squashfs', 'erofs',):
+            raise ParseError('"{}" is not a supported root filesystem.'
+                             .format(root_fs), location=location)
+
+        for key in ('squashfs_processors', 'erofs_workers'):
+            processors = kwargs.get(key, 1)
+            if not isinstance(processors, int) or processors < 1:
+                raise ParseError('"{}" is not a valid number of processors.'
+                                 .format(processors), location=location)
+
+        erofs_compression = kwargs.get('erofs_compression', 'lz4hc')
+        if erofs_compression not in ('lz4', 'lz4hc', 'zstd',):
+            raise ParseError('"{}" is not a supported erofs compression.'
+                             .format(erofs_compression), location=location)
+        erofs_compression_level = kwargs.get('erofs_compression_level', 0)
+        if not isinstance(erofs_compression_level, int) \
+                or erofs_compression_level < 0:
+            raise ParseError('"{}" is not a valid compression level.'
+                             .format(erofs_compression_level),
+                             location=location)
+        if erofs_compression_level \
+                and erofs_compression not in _EROFS_LEVELED_COMPRESSIONS:
+            raise ParseError('erofs compression "{}" has no compression '
+                             'levels.'.format(erofs_compression),
+                             location=location)
+
+        compression_level = kwargs.get('squashfs_compression_level',
+                                       _SQUASHFS_COMPRESSION_LEVEL)
+        if not isinstance(compression_level, int) \
+                or not 1 <= compression_level <= 22:
+            raise ParseError('"{}" is not a valid zstd compression level.'
+                             .format(compression_level), location=location)
+
+        block_size = kwargs.get('squashfs_block_size', _SQUASHFS_BLOCK_SIZE)
+        try:
+            block_size_bytes = disk.byte_size(block_size)
+        except ValueError:
+            block_size_bytes = 0
+        if not 4096 <= block_size_bytes <= 1024 * 1024 \
+                or block_size_bytes & (block_size_bytes - 1):
+            raise ParseError('"{}" is not a valid squashfs block size '
+                             '(4K to 1M, a power of 2).'
+                             .format(block_size), location=location)
+
     def _setup(self, *args, **kwargs):
         self._key = kwargs.get('efi_key', '')
         self._cert = kwargs.get('efi_cert', '')
@@ -194,6 +298,23 @@ class ExportCommand(Command):
 
         self._usr_only = kwargs.get('usr_only', True)
 
+        self._squashfs_processors = kwargs.get('squashfs_processors',
+                                               os.cpu_count() or 1)
+        self._squashfs_compression_level \
+            = kwargs.get('squashfs_compression_level',
+                         _SQUASHFS_COMPRESSION_LEVEL)
+        self._squashfs_block_size = str(kwargs.get('squashfs_block_size',
+                                                   _SQUASHFS_BLOCK_SIZE))
+        self._squashfs_sort_file = kwargs.get('squashfs_sort_file', '')
+        self._squashfs_benchmark = kwargs.get('squashfs_benchmark', False)
+
+        self._root_fs = kwargs.get('root_fs', 'squashfs')
+        self._erofs_workers = kwargs.get('erofs_workers',
+                                         os.cpu_count() or 1)
+        self._erofs_compression = kwargs.get('erofs_compression', 'lz4hc')
+        self._erofs_compression_level \
+            = kwargs.get('erofs_compression_level', 0)
+
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: typing.Any, **kwargs: typing.Any) -> None:
         """Execute command."""
@@ -250,10 +371,10 @@ class ExportCommand(Command):
 
     def _create_complete_kernel(self, location: Location,
                                 system_context: SystemContext,
-                                base_cmdline: str, squashfs_device: str,
+                                base_cmdline: str, root_device: str,
                                 verity_device: str, root_hash: str,
                                 target_directory: str) -> str:
-        full_cmdline = _setup_kernel_commandline(base_cmdline, squashfs_device,
+        full_cmdline = _setup_kernel_commandline(base_cmdline, root_device,
                                                  verity_device, root_hash)
         kernel_name = _kernel_name(system_context)
 
@@ -275,31 +396,36 @@ class ExportCommand(Command):
                            system_context: SystemContext, *,
                            has_kernel: bool) \
             -> typing.Tuple[str, str, str, str]:
-        squashfs_file = self._create_squashfs(system_context,
+        if self._root_fs == 'erofs':
+            root_file = self._create_erofs(system_context,
+                                           system_context.cache_directory)
+        else:
+            if self._squashfs_benchmark:
+                self._benchmark_squashfs(system_context,
+                                         system_context.cache_directory)
+            root_file = self._create_squashfs(system_context,
                                               system_context.cache_directory)
         (verity_file, verity_uuid, root_hash) \
-            = _create_dmverity(system_context.cache_directory, squashfs_file,
-                               timestamp=system_context.timestamp,
-                               veritysetup_command=self._binary(
-                                   Binaries.VERITYSETUP))
+            = _create_dmverity(system_context.cache_directory, root_file,
+                               timestamp=system_context.timestamp)
 
         verity_device = 'UUID={}'.format(verity_uuid)
-        squashfs_device \
+        root_device \
             = 'PARTLABEL={}'.format(_root_part_label(system_context))
 
         cmdline = system_context.substitution('KERNEL_CMDLINE', '')
         cmdline = ' '.join((cmdline, 'systemd.volatile=true',
-                            'rootfstype=squashfs')).strip()
+                            'rootfstype={}'.format(self._root_fs))).strip()
 
         kernel_file = ''
         if has_kernel:
             kernel_file = \
                 self._create_complete_kernel(location, system_context,
-                                             cmdline, squashfs_device,
+                                             cmdline, root_device,
                                              verity_device, root_hash,
                                              system_context.cache_directory)
 
-        return kernel_file, squashfs_file, verity_file, root_hash
+        return kernel_file, root_file, verity_file, root_hash
 
     def create_export_directory(self, system_context: SystemContext) -> str:
         """Return the root directory."""
@@ -327,7 +453,15 @@ class ExportCommand(Command):
                      verity_partition=self._verity_partition,
                      root_hash=self._root_hash,
                      flock_command=self._binary(Binaries.FLOCK),
-                     sfdisk_command=self._binary(Binaries.SFDISK))
+                     sfdisk_command=self._binary(Binaries.SFDISK),
+                     root_fs_type=self._root_fs,
+                     boot_loader_file=system_context.file_name(
+                         '/usr/lib/systemd/boot/efi/systemd-bootx64.efi'),
+                     qemu_img_command=self._binary(Binaries.QEMU_IMG),
+                     mkfs_vfat_command=self._binary(Binaries.MKFS_VFAT),
+                     mcopy_command=self._binary(Binaries.MCOPY),
+                     mmd_command=self._binary(Binaries.MMD),
+                     mkswap_command=self._binary(Binaries.MKSWAP))
 
         return export_volume
 
@@ -371,15 +505,68 @@ class ExportCommand(Command):
                          target_directory: str) -> str:
         squash_file = os.path.join(target_directory,
                                    _root_part_label(system_context))
-        target_directory = 'usr' if self._usr_only else '.'
+        self._run_mksquashfs(system_context, squash_file,
+                             compression_level=self
+                             ._squashfs_compression_level,
+                             block_size=self._squashfs_block_size)
+        _size_extend(squash_file)
+        return squash_file
+
+    def _run_mksquashfs(self, system_context: SystemContext,
+                        squash_file: str, *,
+                        compression_level: int, block_size: str) -> None:
+        source_directory = 'usr' if self._usr_only else '.'
         target_args = ['-keep-as-directory'] if self._usr_only else []
-        run(self._binary(Binaries.MKSQUASHFS), target_directory,
+        sort_file = os.path.join(system_context.systems_definition_directory,
+                                 self._squashfs_sort_file) \
+            if self._squashfs_sort_file else ''
+        run(self._binary(Binaries.MKSQUASHFS), source_directory,
             squash_file, *target_args,
-            '-comp', 'zstd', '-noappend', '-no-exports',
-            '-noI', '-noD', '-noF', '-noX', '-processors', '1',
+            '-noappend', '-no-exports',
+            '-noI', '-noD', '-noF', '-noX',
+            *_squashfs_options(processors=self._squashfs_processors,
+                               compression_level=compression_level,
+                               block_size=block_size,
+                               sort_file=sort_file),
             work_directory=system_context.fs_directory)
-        _size_extend(squash_file)
-        return squash_file
+
+    def _create_erofs(self, system_context: SystemContext,
+                      target_directory: str) -> str:
+        mkfs_erofs = self._binary(Binaries.MKFS_EROFS)
+        if not mkfs_erofs:
+            raise GenerateError('mkfs.erofs is needed for root_fs=erofs.')
+
+        erofs_file = os.path.join(target_directory,
+                                  _root_part_label(system_context))
+        exclude_args = _erofs_exclude_options(system_context.fs_directory) \
+            if self._usr_only else []
+        run(mkfs_erofs,
+            *_erofs_options(workers=self._erofs_workers,
+                            compression=self._erofs_compression,
+                            compression_level=self._erofs_compression_level),
+            *exclude_args, erofs_file, '.',
+            work_directory=system_context.fs_directory)
+        _size_extend(erofs_file)
+        return erofs_file
+
+    def _benchmark_squashfs(self, system_context: SystemContext,
+                            target_directory: str) -> None:
+        """Report image size and time taken for some squashfs settings."""
+        h2('Benchmarking squashfs settings ({} processors).'
+           .format(self._squashfs_processors))
+        benchmark_file = os.path.join(target_directory, 'squashfs_benchmark')
+        msg('{:>5}  {:>10}  {:>10}  {:>12}'
+            .format('Level', 'Block size', 'Time [s]', 'Size [MiB]'))
+        for (compression_level, block_size) in _SQUASHFS_BENCHMARK_SETTINGS:
+            start = time.monotonic()
+            self._run_mksquashfs(system_context, benchmark_file,
+                                 compression_level=compression_level,
+                                 block_size=block_size)
+            duration = time.monotonic() - start
+            msg('{:>5}  {:>10}  {:>10.2f}  {:>12.1f}'
+                .format(compression_level, block_size, duration,
+                        os.path.getsize(benchmark_file) / 1024 / 1024))
+            os.remove(benchmark_file)
 
     def _run_all_exportcommand_hooks(self, system_context: SystemContext) \
             -> None:
@@ -6,10 +6,12 @@
 
 
 from cleanroom.command import Command
+from cleanroom.hookrunner import HookPaths
 from cleanroom.location import Location
 from cleanroom.helper.file import remove
 from cleanroom.systemcontext import SystemContext
 
+import os
 import typing
 
 
@@ -19,7 +21,8 @@ class RemoveCommand(Command):
     def __init__(self, **services: typing.Any) -> None:
         """Constructor."""
         super().__init__('remove',
-                         syntax='<FILE_LIST> [force=True] [recursive=True] [outside=False]',
+                         syntax='<FILE_LIST> [force=True] [recursive=True] '
+                                '[outside=False] [jobs=<CPUS>]',
                          help_string='remove files within the system.', file=__file__,
                          **services)
 
@@ -29,9 +32,16 @@ class RemoveCommand(Command):
         self._validate_args_at_least(location, 1,
                                      '"{}" needs at least one file or '
                                      'directory to remove.', *args)
-        self._validate_kwargs(location, ('force', 'recursive', 'outside'), **kwargs)
+        self._validate_kwargs(location,
+                              ('force', 'recursive', 'outside', 'jobs'),
+                              **kwargs)
+
+    def hook_paths(self, *args: str, **kwargs: typing.Any) -> HookPaths:
+        """Paths touched when run as hook."""
+        return None if kwargs.get('outside', False) else args
 
     def __call__(self, location: Location, system_context: SystemContext,
                  *args: str, **kwargs: typing.Any) -> None:
         """Execute command."""
-        remove(system_context, *args, **kwargs)
+        jobs = kwargs.pop('jobs', os.cpu_count() or 1)
+        remove(system_context, *args, jobs=jobs, **kwargs)
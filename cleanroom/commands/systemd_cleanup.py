@@ -7,12 +7,12 @@
 
 from cleanroom.command import Command
 from cleanroom.exceptions import GenerateError
+from cleanroom.helper.datacopy import copy_file
 from cleanroom.location import Location
 from cleanroom.printer import trace
 from cleanroom.systemcontext import SystemContext
 
 import os.path
-import shutil
 import typing
 
 
@@ -140,7 +140,7 @@ def _move_file(location, old_base, new_base, path):
                             .format(new_path, path),
                             location=location)
 
-    shutil.copyfile(path, new_path)
+    copy_file(path, new_path, metadata=True)
 
 
 class SystemdCleanupCommand(Command):
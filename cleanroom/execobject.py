@@ -8,5 +8,8 @@
 import collections
 
 
+# paths are the paths a hook touches (None if unknown), see hookrunner.py.
 ExecObject = collections.namedtuple('ExecObject',
-                                    ['location', 'command', 'args', 'kwargs'])
+                                    ['location', 'command', 'args', 'kwargs',
+                                     'paths'],
+                                    defaults=(None,))
@@ -5,15 +5,36 @@
 """
 
 
+from .checkpoints import Checkpoints
 from .commandmanager import CommandManager
 from .execobject import ExecObject
-from .printer import success
+from .printer import success, trace, verbose
 from .systemcontext import SystemContext
 
 import os
 import typing
 
 
+def _pacman_batch_key(exec_obj: ExecObject) -> typing.Optional[typing.Tuple]:
+    """Return what pacman commands need to share to get batched (or None)."""
+    if exec_obj.command != 'pacman' or exec_obj.kwargs.get('remove', False):
+        return None
+    return (exec_obj.kwargs.get('overwrite', ''),
+            exec_obj.kwargs.get('assume_installed', None))
+
+
+def _batch_end(exec_obj_list: typing.List[ExecObject], start: int) -> int:
+    """Return the end of the run of batchable pacman commands at start."""
+    key = _pacman_batch_key(exec_obj_list[start])
+    end = start + 1
+    if key is None:
+        return end
+    while end < len(exec_obj_list) \
+            and _pacman_batch_key(exec_obj_list[end]) == key:
+        end += 1
+    return end
+
+
 class Executor:
     """Run a list of ExecObjects on a system."""
 
@@ -22,8 +43,16 @@ class Executor:
                  systems_definition_directory: str,
                  command_manager: CommandManager,
                  repository_base_directory: str,
-                 timestamp: str) \
+                 timestamp: str,
+                 checkpoints: typing.Optional[Checkpoints] = None,
+                 package_cache_directory: str = '',
+                 package_proxy_url: str = '',
+                 batch_pacman: bool = True) \
             -> None:
+        """Constructor.
+
+        With batch_pacman consecutive pacman commands installing packages
+        with the same options are run as one pacman transaction."""
         assert scratch_directory
         assert systems_definition_directory
 
@@ -32,22 +61,90 @@ class Executor:
         self._command_manager = command_manager
         self._timestamp = timestamp
         self._repository_base_directory = repository_base_directory
+        self._checkpoints = checkpoints
+        self._package_cache_directory = package_cache_directory
+        self._package_proxy_url = package_proxy_url
+        self._batch_pacman = batch_pacman
 
     def run(self, system_name: str, base_system_name: typing.Optional[str],
             exec_obj_list: typing.List[ExecObject],
-            storage_directory: str) -> None:
-        """Run the command_list for the system the executor was set up for."""
+            storage_directory: str, *,
+            prefix_hashes: typing.Optional[typing.List[str]] = None) -> None:
+        """Run the command_list for the system the executor was set up for.
+
+        prefix_hashes are the input hashes of all prefixes of exec_obj_list.
+        They are used to find and take checkpoints."""
+        checkpoints = self._checkpoints if prefix_hashes else None
+        assert not checkpoints \
+            or len(prefix_hashes) == len(exec_obj_list)
+
         with SystemContext(system_name=system_name,
                            base_system_name=base_system_name or '',
                            scratch_directory=self._scratch_directory,
                            systems_definition_directory=self._systems_definition_directory,
                            storage_directory=storage_directory,
                            repository_base_directory=self._repository_base_directory,
-                           timestamp=self._timestamp) as system_context:
-            for exec_obj in exec_obj_list:
-                os.chdir(system_context.systems_definition_directory)
-                command = self._command_manager.command(exec_obj.command)
-                assert command
-                command.execute_func(exec_obj.location, system_context,
-                                     *exec_obj.args, **exec_obj.kwargs)
+                           timestamp=self._timestamp,
+                           package_cache_directory=self._package_cache_directory,
+                           package_proxy_url=self._package_proxy_url) \
+                as system_context:
+            start = 0
+            if checkpoints:
+                # Never resume after the last command: that stores the system.
+                resume = checkpoints.find(system_name, prefix_hashes[:-1])
+                if resume >= 0:
+                    checkpoints.restore(system_context, prefix_hashes[resume])
+                    start = resume + 1
+
+            last = len(exec_obj_list) - 1
+            index = start
+            while index <= last:
+                end = _batch_end(exec_obj_list, index) \
+                    if self._batch_pacman else index + 1
+                if end - index > 1:
+                    self._execute_pacman_batch(system_context,
+                                               exec_obj_list[index:end])
+                else:
+                    self._execute(system_context, exec_obj_list[index])
+
+                done = end - 1
+                if checkpoints and done < last \
+                        and checkpoints.should_create(
+                            exec_obj_list[done].command):
+                    checkpoints.create(system_context, prefix_hashes[done])
+                index = end
+
+            if checkpoints:
+                checkpoints.prune(system_name, prefix_hashes)
         success('System {} created successfully.'.format(system_name))
+
+    def _execute(self, system_context: SystemContext,
+                 exec_obj: ExecObject) -> None:
+        os.chdir(system_context.systems_definition_directory)
+        command = self._command_manager.command(exec_obj.command)
+        assert command
+        command.execute_func(exec_obj.location, system_context,
+                             *exec_obj.args, **exec_obj.kwargs)
+
+    def _execute_pacman_batch(self, system_context: SystemContext,
+                              batch: typing.List[ExecObject]) -> None:
+        """Install the packages of all pacman commands in batch at once.
+
+        If that fails, the commands are run one by one again, so that the
+        error gets reported at the location of the failing command."""
+        packages: typing.List[str] = []
+        for exec_obj in batch:
+            packages += [p for p in exec_obj.args if p not in packages]
+        trace('Batching pacman commands at {}.'
+              .format(', '.join(str(e.location) for e in batch)))
+
+        try:
+            self._execute(system_context,
+                          ExecObject(location=batch[0].location,
+                                     command='pacman', args=tuple(packages),
+                                     kwargs=batch[0].kwargs))
+        except Exception as e:
+            verbose('Batched pacman transaction failed ({}), running '
+                    'commands one by one.'.format(e))
+            for exec_obj in batch:
+                self._execute(system_context, exec_obj)
@@ -7,12 +7,12 @@
 
 
 from cleanroom.printer import trace, verbose
+from cleanroom.helper.datacopy import copy_tree
 import cleanroom.helper.disk as disk
 import cleanroom.helper.mount as mount
 
 import os
 from shutil import chown, copyfile
-from distutils.dir_util import copy_tree
 import subprocess
 import sys
 from tempfile import TemporaryDirectory
@@ -173,9 +173,11 @@ def execute_with_system_mounted(to_execute: typing.Callable[[str, str], None],
             with mount.Mount(device.device(1), os.path.join(tempdir, 'EFI'),
                              fs_type='vfat', options='ro') as efi:
                 verbose('Mounting root filesystem...')
+                device.wait_for_device_node(partition=2)
+                # No fs_type: The root filesystem is squashfs or erofs.
                 with mount.Mount(device.device(2),
                                  os.path.join(tempdir, 'root'),
-                                 fs_type='squashfs', options='ro') as root:
+                                 options='ro') as root:
 
                     verbose('Executing with EFI "{}" and root "{}".'
                             .format(efi, root))
@@ -7,17 +7,29 @@
 
 from __future__ import annotations
 
+from .checkpoints import Checkpoints
 from .commandmanager import CommandManager
 from .exceptions import CleanRoomError, GenerateError
+from .execobject import ExecObject
 from .executor import Executor
-from .printer import fail, h1, success, verbose, Printer
+from .helper.archlinux.packageproxy import PackageProxy
+from .helper.packagecache import PackageCache
+from .inputhash import InputHasher
+from .printer import debug, fail, h1, info, success, verbose, Printer
+from .profiler import Profiler
 from .systemsmanager import SystemsManager
 from .workdir import WorkDir
 
+import contextlib
 import datetime
+import multiprocessing
+import multiprocessing.connection
 import os
 import os.path
+import sys
+import tempfile
 import traceback
+import typing
 
 
 class Generator:
@@ -61,16 +73,200 @@ class Generator:
                          work_directory: WorkDir,
                          command_manager: CommandManager,
                          repository_base_directory: str = '',
-                         ignore_errors: bool = False) -> None:
-        """Generate all systems in the dependency tree."""
+                         ignore_errors: bool = False,
+                         jobs: int = 1,
+                         checkpoint_mode: str = 'none',
+                         package_cache_size: int = 0,
+                         profile_file: str = '',
+                         batch_pacman: bool = True,
+                         package_proxy_upstream: str = '') -> None:
+        """Generate all systems in the dependency tree.
 
-        exe = Executor(scratch_directory=work_directory.scratch_directory,
-                       systems_definition_directory=self._systems_manager
-                       .systems_definition_directory,
-                       command_manager=command_manager,
-                       repository_base_directory=repository_base_directory,
-                       timestamp=datetime.datetime.now()
-                       .strftime('%Y%m%d.%H%M'))
+        package_cache_size is the size in bytes the shared package cache is
+        trimmed to after generation (0 to keep everything).
+
+        If profile_file is set, resource usage of all executed commands is
+        written into that file and summarized.
+
+        batch_pacman runs consecutive pacman commands in one transaction.
+
+        If package_proxy_upstream is set, pacman downloads all packages
+        through a local caching proxy in front of that mirror."""
+        if profile_file:
+            with tempfile.TemporaryDirectory(prefix='clrm_profile_') \
+                    as profile_directory:
+                profiler = Profiler(profile_directory)
+                command_manager.set_profiler(profiler)
+                try:
+                    self._generate_systems(
+                        work_directory=work_directory,
+                        command_manager=command_manager,
+                        repository_base_directory=repository_base_directory,
+                        ignore_errors=ignore_errors, jobs=jobs,
+                        checkpoint_mode=checkpoint_mode,
+                        package_cache_size=package_cache_size,
+                        profiler=profiler, batch_pacman=batch_pacman,
+                        package_proxy_upstream=package_proxy_upstream)
+                finally:
+                    command_manager.set_profiler(None)
+                    profiler.write_report(profile_file)
+        else:
+            self._generate_systems(
+                work_directory=work_directory,
+                command_manager=command_manager,
+                repository_base_directory=repository_base_directory,
+                ignore_errors=ignore_errors, jobs=jobs,
+                checkpoint_mode=checkpoint_mode,
+                package_cache_size=package_cache_size,
+                profiler=None, batch_pacman=batch_pacman,
+                package_proxy_upstream=package_proxy_upstream)
+
+    def _generate_systems(self, *,
+                          work_directory: WorkDir,
+                          command_manager: CommandManager,
+                          repository_base_directory: str,
+                          ignore_errors: bool,
+                          jobs: int,
+                          checkpoint_mode: str,
+                          package_cache_size: int,
+                          profiler: typing.Optional[Profiler],
+                          batch_pacman: bool,
+                          package_proxy_upstream: str) -> None:
+        timestamp = datetime.datetime.now().strftime('%Y%m%d.%H%M')
+        package_cache = PackageCache(work_directory.package_cache_directory,
+                                     max_size=package_cache_size)
+        package_cache_stats = package_cache.stats()
+        input_hashes = self._calculate_input_hashes(command_manager)
+        checkpoints = None
+        if checkpoint_mode != 'none':
+            checkpoints = Checkpoints(work_directory.btrfs_helper,
+                                      work_directory.checkpoint_directory,
+                                      mode=checkpoint_mode)
+
+        with PackageProxy(package_proxy_upstream,
+                          package_directory=package_cache
+                          .subdirectory('pacman'),
+                          database_directory=package_cache
+                          .subdirectory('pacman-databases')) \
+                if package_proxy_upstream \
+                else contextlib.nullcontext() as package_proxy:
+            package_proxy_url = package_proxy.url if package_proxy else ''
+            if jobs > 1:
+                (failed_systems, total_systems) \
+                    = self._generate_in_parallel(
+                        work_directory=work_directory,
+                        command_manager=command_manager,
+                        repository_base_directory=repository_base_directory,
+                        timestamp=timestamp, input_hashes=input_hashes,
+                        checkpoints=checkpoints, profiler=profiler,
+                        batch_pacman=batch_pacman,
+                        package_proxy_url=package_proxy_url,
+                        ignore_errors=ignore_errors, jobs=jobs)
+            else:
+                (failed_systems, total_systems) \
+                    = self._generate_sequentially(
+                        work_directory=work_directory,
+                        command_manager=command_manager,
+                        repository_base_directory=repository_base_directory,
+                        timestamp=timestamp, input_hashes=input_hashes,
+                        checkpoints=checkpoints, profiler=profiler,
+                        batch_pacman=batch_pacman,
+                        package_proxy_url=package_proxy_url,
+                        ignore_errors=ignore_errors)
+
+        package_cache.evict()
+        self._report_package_cache(package_cache_stats, package_cache.stats())
+
+        if failed_systems == 0:
+            success('All systems generated successfully.')
+        else:
+            fail('{} of {} systems failed during generation phase.'
+                 .format(failed_systems, total_systems))
+
+    def _executor(self, *, scratch_directory: str,
+                  command_manager: CommandManager,
+                  repository_base_directory: str,
+                  timestamp: str,
+                  checkpoints: typing.Optional[Checkpoints],
+                  package_cache_directory: str,
+                  package_proxy_url: str,
+                  batch_pacman: bool) -> Executor:
+        return Executor(scratch_directory=scratch_directory,
+                        systems_definition_directory=self._systems_manager
+                        .systems_definition_directory,
+                        command_manager=command_manager,
+                        repository_base_directory=repository_base_directory,
+                        timestamp=timestamp,
+                        checkpoints=checkpoints,
+                        package_cache_directory=package_cache_directory,
+                        package_proxy_url=package_proxy_url,
+                        batch_pacman=batch_pacman)
+
+    @staticmethod
+    def _report_package_cache(before: typing.Dict[str, int],
+                              after: typing.Dict[str, int]) -> None:
+        def mib(size: int) -> str:
+            return '{:.1f}MiB'.format(size / 1024 / 1024)
+
+        info('Package cache: {} packages ({}), downloaded {} ({}), '
+             'evicted {} ({}).'
+             .format(after['files'], mib(after['bytes']),
+                     after['downloaded_files'] - before['downloaded_files'],
+                     mib(after['downloaded_bytes']
+                         - before['downloaded_bytes']),
+                     after['evicted_files'] - before['evicted_files'],
+                     mib(after['evicted_bytes'] - before['evicted_bytes'])))
+
+    def _calculate_input_hashes(self, command_manager: CommandManager) \
+            -> typing.Dict[str, typing.List[str]]:
+        hasher = InputHasher(systems_definition_directory=self
+                             ._systems_manager.systems_definition_directory,
+                             commands_digest=command_manager.digest())
+        input_hashes: typing.Dict[str, typing.List[str]] = {}
+        for (system_name, base_system_name, exec_obj_list, _) \
+                in self._systems_manager.walk_systems_forest():
+            base_hash = input_hashes[base_system_name][-1] \
+                if base_system_name else ''
+            input_hashes[system_name] \
+                = hasher.system_hashes(system_name, base_hash, exec_obj_list)
+        return input_hashes
+
+    @staticmethod
+    def _is_up_to_date(work_directory: WorkDir, system_name: str,
+                       input_hash: str) -> bool:
+        """Check storage for the system, removing outdated versions."""
+        if not os.path.isdir(os.path.join(work_directory.storage_directory,
+                                          system_name)):
+            return False
+        if work_directory.storage_input_hash(system_name) == input_hash:
+            return True
+
+        verbose('Inputs of "{}" changed, removing it from storage.'
+                .format(system_name))
+        work_directory.clear_storage_entry(system_name)
+        return False
+
+    def _generate_sequentially(self, *,
+                               work_directory: WorkDir,
+                               command_manager: CommandManager,
+                               repository_base_directory: str,
+                               timestamp: str,
+                               input_hashes: typing.Dict[str,
+                                                         typing.List[str]],
+                               checkpoints: typing.Optional[Checkpoints],
+                               profiler: typing.Optional[Profiler],
+                               batch_pacman: bool,
+                               package_proxy_url: str,
+                               ignore_errors: bool) -> typing.Tuple[int, int]:
+        exe = self._executor(scratch_directory=work_directory.scratch_directory,
+                             command_manager=command_manager,
+                             repository_base_directory=repository_base_directory,
+                             timestamp=timestamp,
+                             checkpoints=checkpoints,
+                             package_cache_directory=work_directory
+                             .package_cache_directory,
+                             package_proxy_url=package_proxy_url,
+                             batch_pacman=batch_pacman)
 
         failed_systems = 0
         total_systems = 0
@@ -81,20 +277,160 @@ class Generator:
 
             h1('Generate "{}"'.format(system_name))
             try:
-                if os.path.isdir(os.path.join(work_directory.storage_directory,
-                                              system_name)):
+                input_hash = input_hashes[system_name][-1]
+                if self._is_up_to_date(work_directory, system_name,
+                                       input_hash):
                     verbose('Already in storage, skipping.')
                 else:
                     work_directory.clear_scratch_directory()
 
                     exe.run(system_name, base_system_name, exec_obj_list,
-                            storage_directory=work_directory.storage_directory)
+                            storage_directory=work_directory.storage_directory,
+                            prefix_hashes=input_hashes[system_name])
+                    work_directory.set_storage_input_hash(system_name,
+                                                          input_hash)
             except Exception as e:
                 self._report_error(system_name, e, ignore_errors=ignore_errors)
                 failed_systems += 1
+            finally:
+                if profiler:
+                    profiler.save(system_name)
 
-        if failed_systems == 0:
-            success('All systems generated successfully.')
-        else:
-            fail('{} of {} systems failed during generation phase.'
-                 .format(failed_systems, total_systems))
+        return failed_systems, total_systems
+
+    def _run_job(self, job: int, system_name: str,
+                 base_system_name: typing.Optional[str],
+                 exec_obj_list: typing.List[ExecObject], *,
+                 work_directory: WorkDir,
+                 command_manager: CommandManager,
+                 repository_base_directory: str,
+                 timestamp: str,
+                 checkpoints: typing.Optional[Checkpoints],
+                 profiler: typing.Optional[Profiler],
+                 batch_pacman: bool,
+                 package_proxy_url: str,
+                 prefix_hashes: typing.List[str]) -> None:
+        """Generate one system in a forked worker process."""
+        h1('Generate "{}" (job {})'.format(system_name, job))
+        try:
+            work_directory.clear_scratch_directory(job)
+
+            exe = self._executor(
+                scratch_directory=work_directory.job_scratch_directory(job),
+                command_manager=command_manager,
+                repository_base_directory=repository_base_directory,
+                timestamp=timestamp,
+                checkpoints=checkpoints,
+                package_cache_directory=work_directory.package_cache_directory,
+                package_proxy_url=package_proxy_url,
+                batch_pacman=batch_pacman)
+            exe.run(system_name, base_system_name, exec_obj_list,
+                    storage_directory=work_directory.storage_directory,
+                    prefix_hashes=prefix_hashes)
+            work_directory.set_storage_input_hash(system_name,
+                                                  prefix_hashes[-1])
+        except Exception as e:
+            self._report_error(system_name, e, ignore_errors=True)
+            sys.exit(1)
+        finally:
+            if profiler:
+                profiler.save(system_name)
+            if job > 0:
+                work_directory.remove_job_scratch_directory(job)
+
+    def _generate_in_parallel(self, *,
+                              work_directory: WorkDir,
+                              command_manager: CommandManager,
+                              repository_base_directory: str,
+                              timestamp: str,
+                              input_hashes: typing.Dict[str,
+                                                        typing.List[str]],
+                              checkpoints: typing.Optional[Checkpoints],
+                              profiler: typing.Optional[Profiler],
+                              batch_pacman: bool,
+                              package_proxy_url: str,
+                              ignore_errors: bool,
+                              jobs: int) -> typing.Tuple[int, int]:
+        """Generate sibling systems concurrently.
+
+        Every system is generated in a forked process with a scratch
+        directory of its own. A system is started as soon as its base
+        system is in storage."""
+        context = multiprocessing.get_context('fork')
+
+        pending = [(system_name, base_system_name, exec_obj_list)
+                   for (system_name, base_system_name, exec_obj_list, _)
+                   in self._systems_manager.walk_systems_forest()]
+        total_systems = len(pending)
+
+        free_jobs = list(range(jobs))
+        running: typing.Dict[int, typing.Tuple[typing.Any, str, int]] = {}
+        generated: typing.Set[str] = set()
+        failed: typing.Set[str] = set()
+
+        while pending or running:
+            for entry in list(pending):
+                if failed and not ignore_errors:
+                    break  # Do not start anything new, just wait.
+
+                (system_name, base_system_name, exec_obj_list) = entry
+                if base_system_name and base_system_name in failed:
+                    pending.remove(entry)
+                    fail('Skipping "{}": base system "{}" failed.'
+                         .format(system_name, base_system_name),
+                         force_exit=False)
+                    failed.add(system_name)
+                    continue
+                if base_system_name and base_system_name not in generated:
+                    continue  # Base system is not in storage yet.
+                input_hash = input_hashes[system_name][-1]
+                if self._is_up_to_date(work_directory, system_name,
+                                       input_hash):
+                    pending.remove(entry)
+                    verbose('"{}" already in storage, skipping.'
+                            .format(system_name))
+                    generated.add(system_name)
+                    continue
+                if not free_jobs:
+                    break
+
+                pending.remove(entry)
+                job = free_jobs.pop(0)
+                process = context.Process(
+                    target=self._run_job,
+                    name='clrm-{}'.format(system_name),
+                    args=(job, system_name, base_system_name, exec_obj_list),
+                    kwargs={'work_directory': work_directory,
+                            'command_manager': command_manager,
+                            'repository_base_directory':
+                                repository_base_directory,
+                            'timestamp': timestamp,
+                            'checkpoints': checkpoints,
+                            'profiler': profiler,
+                            'batch_pacman': batch_pacman,
+                            'package_proxy_url': package_proxy_url,
+                            'prefix_hashes': input_hashes[system_name]})
+                process.start()
+                debug('Started job {} for "{}" (pid {}).'
+                      .format(job, system_name, process.pid))
+                running[process.sentinel] = (process, system_name, job)
+
+            if not running:
+                assert not pending or (failed and not ignore_errors)
+                break
+
+            for sentinel in multiprocessing.connection.wait(
+                    list(running.keys())):
+                (process, system_name, job) = running.pop(sentinel)
+                process.join()
+                free_jobs.append(job)
+                if process.exitcode == 0:
+                    generated.add(system_name)
+                else:
+                    failed.add(system_name)
+
+        if failed and not ignore_errors:
+            raise GenerateError('Generation of "{}" failed.'
+                                .format('", "'.join(sorted(failed))))
+
+        return len(failed), total_systems
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""A local caching proxy for pacman repositories.
+
+The proxy serves packages and repository databases over HTTP on
+localhost and fetches whatever it does not have from an upstream mirror.
+Packages are stored flat in a directory, so that the shared package cache
+can be used as store: pacman then finds everything the proxy fetched in
+its cache directory.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ...printer import debug, trace, warn
+
+import asyncio
+import os
+import os.path
+import shutil
+import threading
+import typing
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+_DATABASE_SUFFIXES = ('.db', '.db.sig', '.files', '.files.sig')
+_PREFETCH_PATH = '/_prefetch'
+_CHUNK_SIZE = 1024 * 1024
+# The proxy answers a prefetch request once all packages are downloaded:
+_PREFETCH_TIMEOUT = 30 * 60
+
+
+def _is_database(name: str) -> bool:
+    return name.endswith(_DATABASE_SUFFIXES)
+
+
+def _split_path(path: str) -> typing.Optional[typing.Tuple[str, str, str]]:
+    """Split /<repo>/<arch>/<file> (or return None)."""
+    parts = path.split('/')
+    if len(parts) != 4 or parts[0] \
+            or any(not p or p.startswith('.') for p in parts[1:]):
+        return None
+    return parts[1], parts[2], parts[3]
+
+
+def _download(url: str, target: str) -> bool:
+    """Download url into target. Return False if that fails."""
+    temporary = '{}.part-{}-{}'.format(target, os.getpid(),
+                                       threading.get_ident())
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        if '://' in url:
+            with urllib.request.urlopen(url, timeout=60) as response, \
+                    open(temporary, 'wb') as f:
+                shutil.copyfileobj(response, f, _CHUNK_SIZE)
+        else:
+            shutil.copyfile(url, temporary)
+        os.replace(temporary, target)
+    except (OSError, urllib.error.URLError) as e:
+        trace('Failed to fetch "{}": {}.'.format(url, e))
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        return False
+    trace('Fetched "{}".'.format(url))
+    return True
+
+
+def proxy_config(config: str, proxy_url: str) -> str:
+    """Point all repositories in the pacman config at proxy_url.
+
+    Repositories with local (file://) servers are left alone."""
+    server = 'Server = {}/$repo/$arch'.format(proxy_url)
+    result: typing.List[str] = []
+    section: typing.List[str] = []
+
+    def flush() -> None:
+        is_local = any(line.strip().replace(' ', '')
+                       .startswith('Server=file://') for line in section)
+        if not section or section[0].strip() == '[options]' or is_local:
+            result.extend(section)
+            return
+        result.append(section[0])
+        result.append(server)
+        result.extend(line for line in section[1:]
+                      if line.strip().partition('=')[0].strip()
+                      not in ('Server', 'Include'))
+
+    for line in config.split('\n'):
+        if line.strip().startswith('['):
+            flush()
+            section = []
+        if section or line.strip().startswith('['):
+            section.append(line)
+        else:
+            result.append(line)
+    flush()
+    return '\n'.join(result)
+
+
+def prefetch(proxy_url: str, urls: typing.Iterable[str]) -> bool:
+    """Have the proxy fetch all urls (as printed by "pacman -Sp").
+
+    URLs that do not point to the proxy are ignored. Return False if
+    prefetching failed, pacman then has to download the packages."""
+    paths = [urllib.parse.urlsplit(u).path for u in urls
+             if u.startswith(proxy_url + '/')]
+    if not paths:
+        return True
+    debug('Prefetching {} packages.'.format(len(paths)))
+    request = urllib.request.Request(proxy_url + _PREFETCH_PATH,
+                                     data='\n'.join(paths).encode('utf-8'),
+                                     method='POST')
+    try:
+        with urllib.request.urlopen(request,
+                                    timeout=_PREFETCH_TIMEOUT) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        warn('Failed to prefetch: {}'.format(e.read().decode('utf-8')))
+        return False
+    except (OSError, urllib.error.URLError) as e:
+        warn('Failed to prefetch: {}'.format(e))
+        return False
+    return True
+
+
+class PackageProxy:
+    """Caching HTTP proxy for pacman repositories, running in a thread.
+
+    upstream is the mirror to fetch from. It is either a URL or a local
+    directory and may contain $repo and $arch like pacman's Server
+    setting. Without $repo, "$repo/os/$arch" is appended.
+
+    Databases are fetched from upstream once per proxy lifetime (falling
+    back to the stored version if upstream is not reachable), packages
+    only when they are not in package_directory yet."""
+
+    def __init__(self, upstream: str, *, package_directory: str,
+                 database_directory: str, jobs: int = 8) -> None:
+        """Constructor."""
+        assert upstream
+        if '$repo' not in upstream:
+            upstream = upstream.rstrip('/') + '/$repo/os/$arch'
+        self._upstream = upstream
+        self._package_directory = package_directory
+        self._database_directory = database_directory
+        self._jobs = jobs
+
+        self._refreshed: typing.Set[str] = set()
+        self._locks: typing.Dict[str, asyncio.Lock] = {}
+
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._thread: typing.Optional[threading.Thread] = None
+        self._port = 0
+        self._error: typing.Optional[BaseException] = None
+
+    @property
+    def url(self) -> str:
+        assert self._port
+        return 'http://127.0.0.1:{}'.format(self._port)
+
+    def __enter__(self) -> typing.Any:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.stop()
+
+    def start(self) -> None:
+        assert self._thread is None
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(ready,),
+                                        name='clrm-package-proxy',
+                                        daemon=True)
+        self._thread.start()
+        ready.wait()
+        if not self._port:
+            self._thread.join()
+            self._thread = None
+            assert self._error
+            raise self._error
+        debug('Package proxy for "{}" listening on {}.'
+              .format(self._upstream, self.url))
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        assert self._loop
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+        debug('Package proxy stopped.')
+
+    def _serve(self, ready: threading.Event) -> None:
+        try:
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, '127.0.0.1', 0))
+            self._port = server.sockets[0].getsockname()[1]
+        except BaseException as e:
+            self._error = e
+            if self._loop:
+                self._loop.close()
+            return
+        finally:
+            ready.set()
+
+        try:
+            self._loop.run_forever()
+        finally:
+            server.close()
+            # Drop idle keep-alive connections:
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                self._loop.run_until_complete(
+                    asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.run_until_complete(server.wait_closed())
+            self._loop.close()
+
+    def _upstream_url(self, repo: str, arch: str, name: str) -> str:
+        base = self._upstream.replace('$repo', repo).replace('$arch', arch)
+        if '://' in base:
+            return base.rstrip('/') + '/' + urllib.parse.quote(name)
+        return os.path.join(base, name)
+
+    async def _fetch(self, path: str) -> typing.Optional[str]:
+        """Return the local file for path, fetching it if necessary."""
+        parts = _split_path(path)
+        if parts is None:
+            return None
+        (repo, arch, name) = parts
+        if _is_database(name):
+            local = os.path.join(self._database_directory, repo, arch, name)
+            refresh = path not in self._refreshed
+        else:
+            local = os.path.join(self._package_directory, name)
+            refresh = False
+
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            if refresh or not os.path.exists(local):
+                fetched = await asyncio.get_running_loop().run_in_executor(
+                    None, _download, self._upstream_url(repo, arch, name),
+                    local)
+                if fetched and refresh:
+                    self._refreshed.add(path)
+                elif not fetched and refresh and os.path.exists(local):
+                    trace('Serving stored "{}".'.format(path))
+        return local if os.path.exists(local) else None
+
+    async def _prefetch(self, paths: typing.List[str]) -> typing.List[str]:
+        """Fetch paths concurrently, return the paths that failed."""
+        semaphore = asyncio.Semaphore(self._jobs)
+
+        async def fetch(path: str) -> typing.Optional[str]:
+            async with semaphore:
+                return await self._fetch(path)
+
+        results = await asyncio.gather(*(fetch(p) for p in paths))
+        return [p for (p, r) in zip(paths, results) if r is None]
+
+    async def _handle(self, reader: asyncio.StreamReader,
+                      writer: asyncio.StreamWriter) -> None:
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError,
+                asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader: asyncio.StreamReader,
+                              writer: asyncio.StreamWriter) -> bool:
+        """Answer one request. Return whether to keep the connection."""
+        request_line = await reader.readline()
+        if not request_line:
+            return False
+        (method, target, version) = request_line.decode('latin-1').split()
+        headers: typing.Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            (key, _, value) = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(
+            int(headers.get('content-length', '0')))
+        keep_alive = version == 'HTTP/1.1' \
+            and headers.get('connection', '').lower() != 'close'
+        path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+
+        if method == 'POST' and path == _PREFETCH_PATH:
+            failed = await self._prefetch(
+                [p for p in body.decode('utf-8').split('\n') if p])
+            await self._send(writer, 502 if failed else 200,
+                             '\n'.join(failed).encode('utf-8'),
+                             keep_alive=keep_alive)
+        elif method in ('GET', 'HEAD'):
+            local = await self._fetch(path)
+            if local is None:
+                await self._send(writer, 404, b'', keep_alive=keep_alive)
+            else:
+                await self._send_file(writer, local,
+                                      with_body=method == 'GET',
+                                      keep_alive=keep_alive)
+        else:
+            await self._send(writer, 405, b'', keep_alive=False)
+            return False
+        return keep_alive
+
+    @staticmethod
+    def _headers(status: int, length: int, keep_alive: bool) -> bytes:
+        reason = {200: 'OK', 404: 'Not Found', 405: 'Method Not Allowed',
+                  502: 'Bad Gateway'}[status]
+        return ('HTTP/1.1 {} {}\r\nContent-Length: {}\r\n'
+                'Connection: {}\r\n\r\n'
+                .format(status, reason, length,
+                        'keep-alive' if keep_alive else 'close')
+                .encode('latin-1'))
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int,
+                    body: bytes, *, keep_alive: bool) -> None:
+        writer.write(self._headers(status, len(body), keep_alive) + body)
+        await writer.drain()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, local: str, *,
+                         with_body: bool, keep_alive: bool) -> None:
+        with open(local, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            writer.write(self._headers(200, size, keep_alive))
+            if with_body:
+                while True:
+                    chunk = f.read(_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+            await writer.drain()
@@ -9,13 +9,18 @@ from ...binarymanager import Binaries
 from ...printer import debug, info
 from ...systemcontext import SystemContext
 from ..btrfs import BtrfsHelper
+from ..datacopy import copy_file, copy_tree
+from ..packagecache import PackageCache
 from ..run import run
 from ..mount import umount_all, mount
+from .packageproxy import prefetch, proxy_config
 
+import contextlib
 import os
 import os.path
 import shutil
 import stat
+import subprocess
 import typing
 
 
@@ -59,13 +64,24 @@ def _base_cache_directory(system_context: SystemContext, internal: bool = False)
         if internal else system_context.cache_directory
 
 
+def _package_cache(system_context: SystemContext) \
+        -> typing.Optional[PackageCache]:
+    if not system_context.package_cache_directory:
+        return None
+    return PackageCache(system_context.package_cache_directory)
+
+
 def _cache_directory(system_context: SystemContext, internal: bool = False) -> str:
-    """Return the host location of the pacman GPG configuration."""
+    """Return the host location of the pacman package cache."""
+    package_cache = _package_cache(system_context)
+    if package_cache:
+        return package_cache.subdirectory('pacman')
     return os.path.join(_base_cache_directory(system_context, internal), 'pacman')
 
 
 def _log(system_context: SystemContext, internal: bool = False) -> str:
-    return os.path.join(_cache_directory(system_context, internal), 'log')
+    return os.path.join(_base_cache_directory(system_context, internal),
+                        'pacman', 'log')
 
 
 def _setup_directories(system_context: SystemContext, internal: bool) -> None:
@@ -80,8 +96,9 @@ def _setup_directories(system_context: SystemContext, internal: bool) -> None:
     os.makedirs(_hooks_directory(system_context, internal))
     debug('Hook directory created.')
 
-    cache = _cache_directory(system_context, internal)
-    if not os.path.isdir(cache):
+    for cache in (_cache_directory(system_context, internal),
+                  os.path.dirname(_log(system_context, internal))):
+        if not os.path.isdir(cache):
             os.makedirs(cache)
     debug('Cache directory created.')
 
@@ -94,9 +111,30 @@ def _sanity_check(system_context: SystemContext) -> None:
     assert stat.S_ISCHR(mode)
 
 
+def _effective_config_file(system_context: SystemContext,
+                           internal: bool = False) -> str:
+    """Return the config to run pacman with.
+
+    With a package proxy that is a copy of the config with all
+    repositories pointing to the proxy."""
+    config_file = _config_file(system_context, internal)
+    if not system_context.package_proxy_url:
+        return config_file
+
+    proxy_config_file = os.path.join(system_context.meta_directory,
+                                     'pacman.proxy.conf')
+    with open(config_file, 'r') as f:
+        config = f.read()
+    os.makedirs(system_context.meta_directory, exist_ok=True)
+    with open(proxy_config_file, 'w') as f:
+        f.write(proxy_config(config, system_context.package_proxy_url))
+    return proxy_config_file
+
+
 def _pacman_args(system_context: SystemContext, installed_pacman: bool = False) \
         -> typing.List[str]:
-    return ['--config', _config_file(system_context, internal=installed_pacman),
+    return ['--config', _effective_config_file(system_context,
+                                               internal=installed_pacman),
             '--root', _fs_directory(system_context),
             '--cachedir', _cache_directory(system_context, internal=installed_pacman),
             '--dbpath', _db_directory(system_context, internal=installed_pacman),
@@ -144,13 +182,30 @@ def _unmount_directories_if_needed(root_dir, *, pacman_in_filesystem=False):
 
 def _run_pacman(system_context: SystemContext, *args: str,
                 pacman_command: str, pacman_in_filesystem: bool,
-                **kwargs) -> None:
+                **kwargs) -> subprocess.CompletedProcess:
     _sanity_check(system_context)
 
     all_args = _pacman_args(system_context, pacman_in_filesystem) + list(args)
-    run(pacman_command, *all_args,
-        work_directory=system_context.systems_definition_directory,
-        timeout=600, **kwargs)
+    return run(pacman_command, *all_args,
+               work_directory=system_context.systems_definition_directory,
+               timeout=600, **kwargs)
+
+
+def _prefetch(system_context: SystemContext, *packages: str,
+              assume_installed: str, pacman_command: str,
+              pacman_in_filesystem: bool) -> None:
+    """Have the package proxy fetch all packages pacman will download."""
+    action = ['-Sp', '--needed']
+    if assume_installed:
+        action += ['--assume-installed', assume_installed]
+    result = _run_pacman(system_context, *action, *packages,
+                         pacman_command=pacman_command,
+                         pacman_in_filesystem=pacman_in_filesystem,
+                         returncode=None)
+    if result.returncode == 0:  # Otherwise let pacman report the problem
+        if not prefetch(system_context.package_proxy_url,
+                        result.stdout.split('\n')):
+            debug('Prefetching failed, pacman downloads the packages.')
 
 
 def pacstrap(system_context: SystemContext, *packages: str, config: str,
@@ -181,23 +236,23 @@ def _copy_state(system_context: SystemContext, internal_pacman: bool) -> None:
     outside = _db_directory(system_context, False)
     inside = _db_directory(system_context, True)
     debug('Copying configuration file.')
-    shutil.copyfile(_config_file(system_context, not internal_pacman),
-                    _config_file(system_context, internal_pacman))
+    copy_file(_config_file(system_context, not internal_pacman),
+              _config_file(system_context, internal_pacman))
 
     debug('Inside: {}, outside: {}'.format(inside, outside))
     if internal_pacman:
         shutil.rmtree(inside)
         info('Copy pacman DB into the filesystem.')
-        shutil.copytree(outside, inside)
+        copy_tree(outside, inside)
         info('Copy pacman GPG data into the filesystem.')
         shutil.rmtree(_gpg_directory(system_context, True))
-        shutil.copytree(_gpg_directory(system_context, False),
-                        _gpg_directory(system_context, True))
+        copy_tree(_gpg_directory(system_context, False),
+                  _gpg_directory(system_context, True))
         debug('Removing pacman DB outside the filesystem.')
         shutil.rmtree(outside)
     else:
         debug('Copy pacman DB out of the filesystem.')
-        shutil.copytree(inside, outside)
+        copy_tree(inside, outside)
         debug('Removing pacman DB inside the filesystem.')
         shutil.rmtree(inside)
 
@@ -222,6 +277,8 @@ def pacman(system_context: SystemContext, *packages: str,
 
     assert _package_type(system_context) == 'pacman'
 
+    package_cache = _package_cache(system_context)
+
     if remove:
         info('Removing {}'.format(', '.join(packages)))
         action = ['-Rs']
@@ -233,11 +290,29 @@ def pacman(system_context: SystemContext, *packages: str,
         if assume_installed:
             action += ['--assume-installed', assume_installed]
 
-    _mount_directories_if_needed(system_context.fs_directory, pacman_in_filesystem=previous_pacstate)
-    _run_pacman(system_context, *action, *packages,
-                pacman_command=pacman_command,
-                pacman_in_filesystem=previous_pacstate)
-    _unmount_directories_if_needed(system_context.fs_directory, pacman_in_filesystem=previous_pacstate)
+        if package_cache:
+            # Download while holding the cache exclusively, so that no two
+            # pacman processes download the same package into it:
+            download_action = ['-Sw', '--needed']
+            if assume_installed:
+                download_action += ['--assume-installed', assume_installed]
+            with package_cache.downloading():
+                if system_context.package_proxy_url:
+                    _prefetch(system_context, *packages,
+                              assume_installed=assume_installed,
+                              pacman_command=pacman_command,
+                              pacman_in_filesystem=previous_pacstate)
+                _run_pacman(system_context, *download_action, *packages,
+                            pacman_command=pacman_command,
+                            pacman_in_filesystem=previous_pacstate)
+
+    with package_cache.locked(exclusive=False) if package_cache \
+            else contextlib.nullcontext():
+        _mount_directories_if_needed(system_context.fs_directory, pacman_in_filesystem=previous_pacstate)
+        _run_pacman(system_context, *action, *packages,
+                    pacman_command=pacman_command,
+                    pacman_in_filesystem=previous_pacstate)
+        _unmount_directories_if_needed(system_context.fs_directory, pacman_in_filesystem=previous_pacstate)
 
     var_lib_pacman = system_context.file_name('/var/lib/pacman')
     if os.path.isdir(var_lib_pacman):
@@ -8,56 +8,223 @@
 from ..printer import trace
 from .run import run
 
+import ctypes
+import ctypes.util
+import fcntl
+import os
 import os.path
+import struct
 import typing
 
 
+# ioctls from linux/btrfs.h:
+#  * struct btrfs_ioctl_vol_args is an __s64 fd followed by the name
+#    (4096 bytes in total),
+#  * struct btrfs_ioctl_vol_args_v2 is an __s64 fd, __u64 transid,
+#    __u64 flags, 32 bytes of (unused) qgroup data and the name
+#    (also 4096 bytes in total).
+_BTRFS_IOC_SUBVOL_CREATE = 0x5000940E
+_BTRFS_IOC_SNAP_DESTROY = 0x5000940F
+_BTRFS_IOC_SNAP_CREATE_V2 = 0x50009417
+
+_BTRFS_SUBVOL_RDONLY = 1 << 1
+
+_VOL_ARGS_SIZE = 4096
+_VOL_ARGS_NAME_OFFSET = 8
+_VOL_ARGS_V2_NAME_OFFSET = 56
+
+_BTRFS_SUPER_MAGIC = 0x9123683E
+_BTRFS_FIRST_FREE_OBJECTID = 256  # Inode number of every subvolume root
+
+
+class _StatFs(ctypes.Structure):
+    # Only f_type is of interest, the rest is padding big enough for
+    # struct statfs on all architectures.
+    _fields_ = [('f_type', ctypes.c_long),
+                ('_padding', ctypes.c_byte * 256)]
+
+
+_libc: typing.Any = None
+
+
+def _statfs_type(directory: str) -> int:
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    buf = _StatFs()
+    if _libc.statfs(os.fsencode(directory), ctypes.byref(buf)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno), directory)
+    return buf.f_type & 0xffffffff
+
+
+def _is_subvolume_root(path: str, stat_result: os.stat_result) -> bool:
+    return stat_result.st_ino == _BTRFS_FIRST_FREE_OBJECTID \
+        and _statfs_type(path) == _BTRFS_SUPER_MAGIC
+
+
+def _subvolumes_below(directory: str) -> typing.List[str]:
+    """Find all subvolumes below directory in one walk.
+
+    Symlinks are not followed. Subvolumes are returned deepest first,
+    so they can be deleted in that order."""
+    result: typing.List[str] = []
+    stack = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                if _is_subvolume_root(entry.path,
+                                      entry.stat(follow_symlinks=False)):
+                    result.append(entry.path)
+                stack.append(entry.path)
+
+    return sorted(result, key=lambda p: p.count('/'), reverse=True)
+
+
+def _vol_args(name: str, *, name_offset: int, fd: int = 0,
+              flags: int = 0) -> bytearray:
+    encoded_name = os.fsencode(name)
+    assert len(encoded_name) < _VOL_ARGS_SIZE - name_offset
+    args = bytearray(_VOL_ARGS_SIZE)
+    struct.pack_into('=q', args, 0, fd)
+    if flags:
+        struct.pack_into('=Q', args, 16, flags)
+    args[name_offset:name_offset + len(encoded_name)] = encoded_name
+    return args
+
+
+def _parent_ioctl(path: str, request: int, args: bytearray) -> None:
+    """Run an ioctl on the parent directory of path."""
+    parent = os.open(os.path.dirname(os.path.abspath(path)),
+                     os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        fcntl.ioctl(parent, request, args)
+    finally:
+        os.close(parent)
+
+
 class BtrfsHelper:
-    def __init__(self, btrfs_command):
+    """Create, snapshot and delete btrfs subvolumes.
+
+    By default the btrfs ioctls are used directly, falling back to the
+    btrfs command line tool when an ioctl fails."""
+
+    def __init__(self, btrfs_command, *, use_ioctls: bool = True):
         assert btrfs_command
         self._command = btrfs_command
+        self._use_ioctls = use_ioctls
 
     def create_subvolume(self, directory: str) -> None:
         """Create a new subvolume."""
         trace('BTRFS: Create subvolume {}.'.format(directory))
+        if self._use_ioctls:
+            try:
+                _parent_ioctl(directory, _BTRFS_IOC_SUBVOL_CREATE,
+                              _vol_args(os.path.basename(directory),
+                                        name_offset=_VOL_ARGS_NAME_OFFSET))
+                return
+            except OSError as e:
+                trace('BTRFS: ioctl failed ({}), using btrfs command.'
+                      .format(e))
         run(self._command, 'subvolume', 'create', directory, trace_output=trace)
 
     def create_snapshot(self, source: str, destination: str, *,
                         read_only: bool = False) -> None:
         """Create a new snapshot."""
-        extra_args: typing.Tuple[str, ...] = ()
-        extra_args = (*extra_args, '-r') if read_only else extra_args
-
         trace('BTRFS: Create snapshot of {} into {} ({}).'
               .format(source, destination, 'ro' if read_only else 'rw'))
+        if self._use_ioctls:
+            try:
+                source_fd = os.open(source, os.O_RDONLY | os.O_DIRECTORY)
+                try:
+                    _parent_ioctl(destination, _BTRFS_IOC_SNAP_CREATE_V2,
+                                  _vol_args(os.path.basename(destination),
+                                            name_offset=_VOL_ARGS_V2_NAME_OFFSET,
+                                            fd=source_fd,
+                                            flags=_BTRFS_SUBVOL_RDONLY
+                                            if read_only else 0))
+                    return
+                finally:
+                    os.close(source_fd)
+            except OSError as e:
+                trace('BTRFS: ioctl failed ({}), using btrfs command.'
+                      .format(e))
+
+        extra_args: typing.Tuple[str, ...] = ()
+        extra_args = (*extra_args, '-r') if read_only else extra_args
         run(self._command, 'subvolume', 'snapshot', *extra_args,
             source, destination, trace_output=trace)
 
     def delete_subvolume(self, directory: str) -> bool:
         """Delete a subvolume."""
         trace('BTRFS: Delete subvolume {}.'.format(directory))
+        if self._use_ioctls:
+            if not self.is_subvolume(directory):
+                return False
+            if self._destroy(directory):
+                return True
         return run(self._command, 'subvolume', 'delete', directory,
                    returncode=None, trace_output=None).returncode == 0
 
+    def delete_subvolumes(self, *directories: str) -> bool:
+        """Delete subvolumes in the given order.
+
+        The btrfs command is run (once for all directories) for those
+        subvolumes that could not be deleted with an ioctl."""
+        remaining = list(directories)
+        if self._use_ioctls:
+            remaining = [d for d in directories if not self._destroy(d)]
+        if not remaining:
+            return True
+
+        trace('BTRFS: Delete subvolumes {}.'.format(', '.join(remaining)))
+        return run(self._command, 'subvolume', 'delete', *remaining,
+                   returncode=None, trace_output=None).returncode == 0
+
     def delete_subvolume_recursive(self, directory: str) -> None:
         """Delete all subvolumes in a subvolume or directory."""
-        for f in os.listdir(directory):
-            child = os.path.join(directory, f)
-            if os.path.isdir(child):
-                self.delete_subvolume_recursive(child)
-
+        subvolumes = _subvolumes_below(directory)
         if self.is_subvolume(directory):
-            self.delete_subvolume(directory)
+            subvolumes.append(directory)
+        if subvolumes:
+            self.delete_subvolumes(*subvolumes)
+
+    @staticmethod
+    def _destroy(directory: str) -> bool:
+        try:
+            _parent_ioctl(directory, _BTRFS_IOC_SNAP_DESTROY,
+                          _vol_args(os.path.basename(directory),
+                                    name_offset=_VOL_ARGS_NAME_OFFSET))
+            return True
+        except OSError as e:
+            trace('BTRFS: ioctl failed ({}), using btrfs command.'
+                  .format(e))
+            return False
 
     def is_subvolume(self, directory: str) -> bool:
         """Check whether a subdirectory is a subvolume or snapshot."""
         if not os.path.isdir(directory):
             return False
+        if self._use_ioctls:
+            try:
+                return _is_subvolume_root(directory, os.stat(directory))
+            except OSError as e:
+                trace('BTRFS: stat failed ({}), using btrfs command.'
+                      .format(e))
         return run(self._command, 'subvolume', 'show', directory,
                    returncode=None, trace_output=None).returncode == 0
 
     def is_btrfs_filesystem(self, directory: str) -> bool:
         if not os.path.isdir(directory):
             return False
+        if self._use_ioctls:
+            try:
+                return _statfs_type(directory) == _BTRFS_SUPER_MAGIC
+            except OSError as e:
+                trace('BTRFS: statfs failed ({}), using btrfs command.'
+                      .format(e))
         return run(self._command, 'subvolume', 'list', directory,
                    returncode=None, trace_output=None).returncode == 0
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+"""Copy file contents onto devices, files and directory trees efficiently.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+
+import concurrent.futures
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import mmap
+import os
+import shutil
+import stat
+import typing
+
+
+_FALLOC_FL_KEEP_SIZE = 0x01
+_FALLOC_FL_PUNCH_HOLE = 0x02
+
+_FICLONE = 0x40049409
+
+_CHUNK_SIZE = 4 * 1024 * 1024
+
+_libc: typing.Any = None
+
+
+def _punch_hole(fd: int, offset: int, length: int) -> bool:
+    """Zero a range of fd without writing data (if supported)."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _libc.fallocate64.argtypes = (ctypes.c_int, ctypes.c_int,
+                                      ctypes.c_int64, ctypes.c_int64)
+    return _libc.fallocate64(fd, _FALLOC_FL_PUNCH_HOLE | _FALLOC_FL_KEEP_SIZE,
+                             offset, length) == 0
+
+
+def _data_segments(fd: int, size: int) \
+        -> typing.Iterator[typing.Tuple[int, int]]:
+    """Yield (offset, length) of all ranges of fd that are not holes."""
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # Only a hole is left
+            if e.errno != errno.EINVAL:
+                raise
+            yield offset, size - offset  # No SEEK_DATA support
+            return
+        end = os.lseek(fd, start, os.SEEK_HOLE)
+        yield start, end - start
+        offset = end
+
+
+def _open_target(target: str, direct: bool) -> int:
+    flags = os.O_WRONLY | os.O_CREAT | os.O_CLOEXEC
+    if direct:
+        try:
+            return os.open(target, flags | os.O_DIRECT, 0o644)
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+            trace('O_DIRECT not supported for "{}".'.format(target))
+    return os.open(target, flags, 0o644)
+
+
+def _drop_direct(fd: int) -> None:
+    """Allow unaligned writes to fd again."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    if flags & os.O_DIRECT:
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+
+
+class _Copier:
+    def __init__(self, source_fd: int, target_fd: int, *,
+                 target_offset: int, chunk_size: int) -> None:
+        self._source_fd = source_fd
+        self._target_fd = target_fd
+        self._target_offset = target_offset
+        self._chunk_size = chunk_size
+        self._can_punch_holes = True
+
+        # mmap memory is page aligned, as O_DIRECT needs it:
+        self._buffer = mmap.mmap(-1, chunk_size)
+        self._zeros = bytes(chunk_size)
+
+        self.written = 0
+        self.skipped = 0
+
+    def close(self) -> None:
+        self._buffer.close()
+
+    def zero(self, offset: int, length: int) -> None:
+        """Make sure the target is zero in the given range."""
+        self.skipped += length
+        if self._can_punch_holes:
+            if _punch_hole(self._target_fd, self._target_offset + offset,
+                           length):
+                return
+            trace('Punching holes failed ({}), writing zeros.'
+                  .format(os.strerror(ctypes.get_errno())))
+            self._can_punch_holes = False
+            _drop_direct(self._target_fd)  # self._zeros is not aligned
+
+        while length > 0:
+            count = min(length, self._chunk_size)
+            self._write(offset, self._zeros[:count])
+            offset += count
+            length -= count
+
+    def copy(self, offset: int, length: int) -> None:
+        """Copy data, skipping chunks that are all zero."""
+        end = offset + length
+        while offset < end:
+            count = min(end - offset, self._chunk_size)
+            with memoryview(self._buffer) as buffer, buffer[:count] as view:
+                read = os.preadv(self._source_fd, [view], offset)
+                assert read == count
+                # Comparing bytes is a lot faster than comparing memoryviews:
+                if self._buffer[:count] == self._zeros[:count]:
+                    self.zero(offset, count)
+                else:
+                    self._write(offset, view)
+                    self.written += count
+            offset += count
+
+    def _write(self, offset: int, data: typing.Any) -> None:
+        if len(data) % 512:
+            _drop_direct(self._target_fd)
+        written = os.pwritev(self._target_fd, [data],
+                             self._target_offset + offset)
+        assert written == len(data)
+
+
+def _copy_range(source_fd: int, target_fd: int,
+                offset: int, length: int, *, target_offset: int) -> None:
+    """Copy inside the kernel: copy_file_range or sendfile."""
+    end = offset + length
+    use_copy_file_range = True
+    while offset < end:
+        count = min(end - offset, 1024 * 1024 * 1024)
+        copied = 0
+        if use_copy_file_range:
+            try:
+                copied = os.copy_file_range(source_fd, target_fd, count,
+                                            offset, target_offset + offset)
+            except OSError as e:
+                if e.errno not in (errno.EINVAL, errno.EXDEV, errno.ENOSYS,
+                                   errno.EOPNOTSUPP):
+                    raise
+                use_copy_file_range = False
+        if not use_copy_file_range:
+            os.lseek(target_fd, target_offset + offset, os.SEEK_SET)
+            copied = os.sendfile(target_fd, source_fd, offset, count)
+        assert copied > 0
+        offset += copied
+
+
+def copy_to_device(source: str, target: str, *, offset: int = 0,
+                   skip_zeros: bool = True, direct: bool = False,
+                   chunk_size: int = _CHUNK_SIZE) -> None:
+    """Copy the contents of source onto target, starting at offset.
+
+    target is a block device or a file. A file target is extended if
+    necessary, but never shrunk. Holes in source are not copied,
+    neither are chunks that are all zero with skip_zeros: The target is
+    zeroed by punching holes (discarding the data on block devices) where
+    possible, which keeps sparse targets (like qcow2 images) small.
+
+    Without skip_zeros the data segments are copied without going
+    through user space (copy_file_range or sendfile). With direct the
+    target is written with O_DIRECT, bypassing the page cache."""
+    assert chunk_size % mmap.PAGESIZE == 0
+    assert offset % 512 == 0
+
+    source_fd = os.open(source, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        size = os.fstat(source_fd).st_size
+        target_fd = _open_target(target, direct and skip_zeros)
+        try:
+            trace('Copying "{}" ({} bytes) to "{}" at {}.'
+                  .format(source, size, target, offset))
+            copier = _Copier(source_fd, target_fd, target_offset=offset,
+                             chunk_size=chunk_size)
+            try:
+                position = 0
+                for (start, length) in _data_segments(source_fd, size):
+                    if start > position:
+                        copier.zero(position, start - position)
+                    if skip_zeros:
+                        copier.copy(start, length)
+                    else:
+                        _copy_range(source_fd, target_fd, start, length,
+                                    target_offset=offset)
+                    position = start + length
+                if position < size:
+                    copier.zero(position, size - position)
+            finally:
+                copier.close()
+
+            target_stat = os.fstat(target_fd)
+            if stat.S_ISREG(target_stat.st_mode) \
+                    and target_stat.st_size < offset + size:
+                os.ftruncate(target_fd, offset + size)
+            os.fsync(target_fd)
+            trace('... {} bytes written, {} bytes skipped as zeros.'
+                  .format(copier.written, copier.skipped))
+        finally:
+            os.close(target_fd)
+    finally:
+        os.close(source_fd)
+
+
+def _clone(source_fd: int, target_fd: int) -> bool:
+    """Share all data of source_fd with target_fd (if supported)."""
+    try:
+        fcntl.ioctl(target_fd, _FICLONE, source_fd)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY,
+                           errno.EINVAL):
+            raise
+        return False
+    return True
+
+
+def copy_file(source: str, target: str, *, follow_symlinks: bool = True,
+              metadata: bool = False) -> None:
+    """Copy the file source to target, replacing the contents of target.
+
+    On file systems supporting it (like btrfs) the data is shared between
+    both files (reflinked). Otherwise it is copied inside the kernel,
+    keeping holes. With metadata, permissions and timestamps of source
+    are set on target, too. Without follow_symlinks a symbolic link
+    source is copied as a link."""
+    if not follow_symlinks and os.path.islink(source):
+        os.symlink(os.readlink(source), target)
+        return
+    source_stat = os.stat(source)
+    if stat.S_ISDIR(source_stat.st_mode):
+        raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR),
+                                source)
+    if not stat.S_ISREG(source_stat.st_mode):
+        raise OSError('"{}" is not a regular file.'.format(source))
+    mode = stat.S_IMODE(source_stat.st_mode)
+    try:
+        if os.path.samestat(source_stat, os.stat(target)):
+            raise shutil.SameFileError('"{}" and "{}" are the same file.'
+                                       .format(source, target))
+    except FileNotFoundError:
+        pass
+
+    source_fd = os.open(source, os.O_RDONLY | os.O_CLOEXEC)
+    try:
+        target_fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+                            | os.O_CLOEXEC, mode if metadata else 0o666)
+        try:
+            if not _clone(source_fd, target_fd):
+                for (start, length) in _data_segments(source_fd,
+                                                      source_stat.st_size):
+                    _copy_range(source_fd, target_fd, start, length,
+                                target_offset=0)
+                os.ftruncate(target_fd, source_stat.st_size)
+            if metadata:
+                os.fchmod(target_fd, mode)
+                os.utime(target_fd, ns=(source_stat.st_atime_ns,
+                                        source_stat.st_mtime_ns))
+        finally:
+            os.close(target_fd)
+    finally:
+        os.close(source_fd)
+
+
+def concatenate(target_fd: int, offset: int, *sources: str) -> int:
+    """Copy sources one after the other into target_fd, starting at offset.
+
+    The data is copied inside the kernel. Return the offset after the
+    last source."""
+    for source in sources:
+        source_fd = os.open(source, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            size = os.fstat(source_fd).st_size
+            _copy_range(source_fd, target_fd, 0, size, target_offset=offset)
+        finally:
+            os.close(source_fd)
+        offset += size
+    return offset
+
+
+def _copy_directory_metadata(source: str, target: str) -> None:
+    source_stat = os.stat(source)
+    os.chmod(target, stat.S_IMODE(source_stat.st_mode))
+    os.utime(target, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+
+
+def copy_tree(source: str, target: str, *, symlinks: bool = False,
+              jobs: int = 0) -> None:
+    """Copy the directory source with all its contents into target.
+
+    target is created if needed, existing files in it get overwritten.
+    Files are copied with copy_file (keeping permissions and timestamps),
+    up to jobs (default: number of CPUs) at a time. With symlinks set,
+    symbolic links are copied as links, otherwise what they point to is
+    copied."""
+    trace('Copying tree "{}" to "{}".'.format(source, target))
+    directories: typing.List[typing.Tuple[str, str]] = []
+    futures: typing.List[concurrent.futures.Future] = []
+
+    with concurrent.futures.ThreadPoolExecutor(
+            jobs or os.cpu_count() or 1) as executor:
+        def walk(source_directory: str, target_directory: str) -> None:
+            if not os.path.isdir(target_directory):
+                os.mkdir(target_directory)
+            directories.append((source_directory, target_directory))
+            with os.scandir(source_directory) as it:
+                entries = list(it)
+            for entry in entries:
+                target_path = os.path.join(target_directory, entry.name)
+                if symlinks and entry.is_symlink():
+                    if os.path.lexists(target_path):
+                        os.unlink(target_path)
+                    os.symlink(os.readlink(entry.path), target_path)
+                elif entry.is_dir():
+                    walk(entry.path, target_path)
+                else:
+                    futures.append(executor.submit(copy_file, entry.path,
+                                                   target_path,
+                                                   metadata=True))
+
+        walk(source, target)
+        for future in futures:
+            future.result()
+
+    # Copying the contents changed the directory timestamps:
+    for (source_directory, target_directory) in reversed(directories):
+        _copy_directory_metadata(source_directory, target_directory)
@@ -7,8 +7,10 @@
 
 from ...binarymanager import Binaries
 from ...systemcontext import SystemContext
+from ..packagecache import PackageCache
 from ..run import run
 
+import contextlib
 import os
 import os.path
 import shutil
@@ -60,6 +62,13 @@ def _apt_cache_directory(system_context: SystemContext, internal: bool = False)
     return os.path.join(system_context.cache_directory, 'apt')
 
 
+def _package_cache(system_context: SystemContext) \
+        -> typing.Optional[PackageCache]:
+    if not system_context.package_cache_directory:
+        return None
+    return PackageCache(system_context.package_cache_directory)
+
+
 def _apt_config_directory(system_context: SystemContext, internal: bool = False) -> str:
     if internal:
         return system_context.file_name('/etc/apt')
@@ -92,12 +101,20 @@ def debootstrap(system_context: SystemContext, *, suite: str, variant: str = '',
         args.append('--include={}'.format(include))
     if exclude:
         args.append('--exclude={}'.format(exclude))
+    package_cache = _package_cache(system_context)
+    if package_cache:
+        args.append('--cache-dir={}'
+                    .format(package_cache.subdirectory('debootstrap')))
     args += [suite, target]
     if mirror:
         args.append(mirror)
 
     # Debootstrap:
-    run(debootstrap_command, *args)
+    # debootstrap downloads and installs in one go, so it needs the package
+    # cache exclusively:
+    with package_cache.downloading() if package_cache \
+            else contextlib.nullcontext():
+        run(debootstrap_command, *args)
 
     # De-dpkg-ize:
     root = system_context.fs_directory
@@ -135,6 +152,12 @@ def debootstrap(system_context: SystemContext, *, suite: str, variant: str = '',
                            .format(dpkg_state, root))
         apt_override.write('Dir::State "{}";\n'.format(apt_state))
         apt_override.write('Dir::Cache "{}";\n'.format(apt_cache))
+        if package_cache:
+            apt_archives = os.path.join(package_cache.subdirectory('apt'),
+                                        'archives')
+            os.makedirs(os.path.join(apt_archives, 'partial'), exist_ok=True)
+            apt_override.write('Dir::Cache::archives "{}";\n'
+                               .format(apt_archives))
         apt_override.write('Dir::Log "{}";\n'.format(os.path.join(apt_cache, 'log')))
         apt_override.write('Dir::State::status "{}";\n'
                            .format(os.path.join(dpkg_state, 'status')))
@@ -12,15 +12,21 @@ from ..printer import debug, trace, warn
 from .run import run
 
 import collections
+import contextlib
+import ctypes
+import ctypes.util
+import fcntl
 import json
 import math
 import os
 import os.path
-import subprocess
+import select
 from re import findall
 import stat
+import subprocess
+import threading
+import time
 import typing
-from time import sleep
 
 
 Disk \
@@ -92,6 +98,68 @@ def byte_size(size: typing.Any) -> int:
     raise ValueError()
 
 
+_IN_ATTRIB = 0x00000004
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_libc: typing.Any = None
+
+
+def _inotify_watch(directory: str) -> int:
+    """Return an inotify fd watching for new files in directory (or -1)."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    fd = _libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+    if fd < 0:
+        return -1
+    if _libc.inotify_add_watch(fd, os.fsencode(directory),
+                               _IN_CREATE | _IN_MOVED_TO | _IN_ATTRIB) < 0:
+        os.close(fd)
+        return -1
+    return fd
+
+
+def _udevadm_settle(device: str, timeout: float) -> None:
+    run('/usr/bin/udevadm', 'settle', '--timeout={}'.format(int(timeout) + 1),
+        '--exit-if-exists={}'.format(device), returncode=None)
+
+
+def wait_for_block_device(device: str, *, timeout: float = 10.0) -> bool:
+    """Wait for device to show up as a block device.
+
+    Returns as soon as the device node appears (watched via inotify,
+    falling back to "udevadm settle") or False after timeout seconds."""
+    fd = _inotify_watch(os.path.dirname(device))
+    if fd < 0:
+        trace('Can not watch for "{}", running udevadm settle.'
+              .format(device))
+        if not is_block_device(device):
+            _udevadm_settle(device, timeout)
+        return is_block_device(device)
+
+    try:
+        deadline = time.monotonic() + timeout
+        while not is_block_device(device):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                if os.path.exists(device):
+                    warn('"{}" exists but is no block device!'
+                         .format(device))
+                return False
+            if select.select([fd], [], [], remaining)[0]:
+                try:
+                    os.read(fd, 64 * 1024)  # Drain events
+                except BlockingIOError:
+                    pass
+        return True
+    finally:
+        os.close(fd)
+
+
 def _sfdisk_size(size: int) -> str:
     return '{}KiB'.format(kib_ify(size))
 
@@ -128,13 +196,7 @@ class Device:
             -> bool:
         dev = self.device(partition)
         trace('Waiting for "{}".'.format(dev))
-        for i in range(20):
-            if is_block_device(dev):
-                return True
-            elif os.path.exists(dev):
-                warn('"{}" exists but is no block device!'.format(dev))
-            sleep(0.5)
-        return False
+        return wait_for_block_device(dev)
 
 
 class NbdDevice(Device):
@@ -202,32 +264,37 @@ class NbdDevice(Device):
         assert _is_root()
         assert os.path.isfile(file_name)
 
-        if not is_block_device(_nbd_device(0)):
+        if not os.path.isdir(os.path.join(_SYS_BLOCK, 'nbd0')):
             trace('Loading nbd kernel module...')
             run('/usr/bin/modprobe', 'nbd')
 
-        for counter in range(257):
-            device = _nbd_device(counter)
-            counter += 1
-            if not is_block_device(device):
-                trace('{} is not a block device, aborting'.format(device))
-                return None
-
-            try:
-                result = run(qemu_nbd_command or '/usr/bin/qemu-nbd',
-                             '--connect={}'.format(device),
-                             '--format={}'.format(disk_format), file_name,
-                             returncode=None, timeout=5,
-                             stdout='/dev/null', stderr='/dev/null')
-            except subprocess.TimeoutExpired:
-                continue 
-
-            if result.returncode == 0:
-                trace('Device {} connected to file {}.'
-                      .format(device, file_name))
-                return device
-
-        trace('Too many nbd devices found, aborting!')
+        with _nbd_lock():
+            for device in free_nbd_devices():
+                if not wait_for_block_device(device):
+                    trace('{} is not a block device, skipping'
+                          .format(device))
+                    continue
+
+                try:
+                    result = run(qemu_nbd_command or '/usr/bin/qemu-nbd',
+                                 '--connect={}'.format(device),
+                                 '--format={}'.format(disk_format), file_name,
+                                 returncode=None, timeout=5,
+                                 stdout='/dev/null', stderr='/dev/null')
+                except subprocess.TimeoutExpired:
+                    trace('Connecting {} timed out, trying next device.'
+                          .format(device))
+                    continue
+
+                if result.returncode == 0:
+                    trace('Device {} connected to file {}.'
+                          .format(device, file_name))
+                    return device
+                # Someone outside of cleanroom might have grabbed it:
+                trace('Connecting {} failed, trying next device.'
+                      .format(device))
+
+        trace('No free nbd device found, aborting!')
         return None
 
     @staticmethod
@@ -242,6 +309,62 @@ class NbdDevice(Device):
         trace('"{}" disconnected.'.format(device))
 
 
+_SYS_BLOCK = '/sys/block'
+_NBD_LOCK_FILE = '/run/lock/cleanroom-nbd.lock'
+
+_nbd_thread_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _nbd_lock() -> typing.Iterator[None]:
+    """Serialize nbd allocation between threads and processes.
+
+    The lock is held from finding a free device till it is connected."""
+    with _nbd_thread_lock:
+        os.makedirs(os.path.dirname(_NBD_LOCK_FILE), exist_ok=True)
+        with open(_NBD_LOCK_FILE, 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+
+def _nbd_index(name: str) -> int:
+    return int(name[3:]) if name.startswith('nbd') and name[3:].isdigit() \
+        else -1
+
+
+def _read_sysfs(path: str) -> str:
+    try:
+        with open(path, 'r') as f:
+            return f.read().strip()
+    except OSError:
+        return ''
+
+
+def _nbd_is_free(sys_directory: str) -> bool:
+    """An nbd device is in use when it has a pid or a size."""
+    if os.path.exists(os.path.join(sys_directory, 'pid')):
+        return False
+    return _read_sysfs(os.path.join(sys_directory, 'size')) in ('', '0')
+
+
+def free_nbd_devices(*, sys_block: str = _SYS_BLOCK) \
+        -> typing.Iterator[str]:
+    """Yield the nbd device nodes not connected to anything.
+
+    This only looks at sysfs, so it is cheap. Hold _nbd_lock() to make
+    sure no other cleanroom process grabs the device."""
+    try:
+        names = os.listdir(sys_block)
+    except FileNotFoundError:
+        return
+    for index in sorted(i for i in (_nbd_index(n) for n in names) if i >= 0):
+        if _nbd_is_free(os.path.join(sys_block, 'nbd{}'.format(index))):
+            yield _nbd_device(index)
+
+
 def _nbd_device(counter: int) -> str:
     return '/dev/nbd' + str(counter)
 
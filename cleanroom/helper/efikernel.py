@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""Assemble unified EFI kernel images from a systemd EFI stub.
+
+The kernel, initrd, command line and os-release are added as sections to
+a copy of the stub, like objcopy would do it. The section contents are
+streamed into the image inside the kernel, nothing is held in memory.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+from .datacopy import concatenate, copy_file
+
+import os
+import struct
+import typing
+
+
+_PE_MAGIC = b'PE\0\0'
+_PE32_MAGIC = 0x10b
+_PE32_PLUS_MAGIC = 0x20b
+
+_COFF_HEADER = struct.Struct('<HHIIIHH')
+_SECTION_HEADER = struct.Struct('<8sIIIIIIHHI')
+
+# Offsets into the optional header:
+_SIZE_OF_INITIALIZED_DATA = 8
+_SECTION_ALIGNMENT = 32
+_FILE_ALIGNMENT = 36
+_SIZE_OF_IMAGE = 56
+_SIZE_OF_HEADERS = 60
+_CHECKSUM = 64
+_DATA_DIRECTORIES = {_PE32_MAGIC: 96, _PE32_PLUS_MAGIC: 112}
+_SECURITY_DIRECTORY = 4
+
+# IMAGE_SCN_CNT_INITIALIZED_DATA | IMAGE_SCN_MEM_READ:
+_DATA_SECTION = 0x40000040
+
+# Section data starts at page boundaries in the file, so that the file
+# system can share blocks with the source files:
+_RAW_ALIGNMENT = 4096
+
+# Section contents: Either the data or files to concatenate.
+SectionData = typing.Union[bytes, typing.Sequence[str]]
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _section_size(data: SectionData) -> int:
+    if isinstance(data, bytes):
+        return len(data)
+    return sum(os.stat(f).st_size for f in data)
+
+
+class _PeHeaders:
+    """The headers of a PE image."""
+
+    def __init__(self, fd: int) -> None:
+        """Read the headers from fd, raise ValueError if it is no PE image."""
+        data = os.pread(fd, 4096, 0)
+        if data[:2] != b'MZ' or len(data) < 0x40:
+            raise ValueError('No DOS header.')
+        pe_offset = struct.unpack_from('<I', data, 0x3c)[0]
+        if data[pe_offset:pe_offset + 4] != _PE_MAGIC:
+            raise ValueError('No PE header.')
+
+        self._coff = pe_offset + len(_PE_MAGIC)
+        self._optional = self._coff + _COFF_HEADER.size
+        (_, self._count, _, _, _, optional_size, _) \
+            = _COFF_HEADER.unpack_from(data, self._coff)
+        self._magic = struct.unpack_from('<H', data, self._optional)[0]
+        if self._magic not in _DATA_DIRECTORIES:
+            raise ValueError('Unsupported optional header magic {:#x}.'
+                             .format(self._magic))
+        self._table = self._optional + optional_size
+
+        size = struct.unpack_from('<I', data,
+                                  self._optional + _SIZE_OF_HEADERS)[0]
+        if size > len(data):
+            data += os.pread(fd, size - len(data), len(data))
+        self.data = bytearray(data[:size])
+        if self._table + self._count * _SECTION_HEADER.size > size:
+            raise ValueError('Section table does not fit into headers.')
+
+        self.section_alignment = self._field(_SECTION_ALIGNMENT)
+        self.file_alignment = self._field(_FILE_ALIGNMENT)
+
+    def _field(self, offset: int) -> int:
+        return struct.unpack_from('<I', self.data, self._optional + offset)[0]
+
+    def _set_field(self, offset: int, value: int) -> None:
+        struct.pack_into('<I', self.data, self._optional + offset, value)
+
+    def sections(self) -> typing.List[typing.Tuple[typing.Any, ...]]:
+        return [_SECTION_HEADER.unpack_from(
+                    self.data, self._table + i * _SECTION_HEADER.size)
+                for i in range(self._count)]
+
+    def free_section_headers(self) -> int:
+        """Return how many more section headers fit into the headers."""
+        end = min([len(self.data)]
+                  + [s[4] for s in self.sections() if s[3] > 0])
+        used = self._table + self._count * _SECTION_HEADER.size
+        return max(0, (end - used) // _SECTION_HEADER.size)
+
+    def virtual_end(self) -> int:
+        """Return the end of the image in memory."""
+        return max([len(self.data)]
+                   + [s[2] + max(s[1], s[3]) for s in self.sections()])
+
+    def add_section(self, name: str, virtual_address: int, size: int,
+                    raw_offset: int, raw_size: int) -> None:
+        _SECTION_HEADER.pack_into(
+            self.data, self._table + self._count * _SECTION_HEADER.size,
+            name.encode('ascii'), size, virtual_address, raw_size,
+            raw_offset, 0, 0, 0, 0, _DATA_SECTION)
+        self._count += 1
+        struct.pack_into('<H', self.data, self._coff + 2, self._count)
+        self._set_field(_SIZE_OF_INITIALIZED_DATA,
+                        self._field(_SIZE_OF_INITIALIZED_DATA) + raw_size)
+        self._set_field(_SIZE_OF_IMAGE,
+                        _align(virtual_address + size,
+                               self.section_alignment))
+
+    def drop_checksum_and_signature(self) -> None:
+        """Both are invalid once sections were added."""
+        self._set_field(_CHECKSUM, 0)
+        directory = self._optional + _DATA_DIRECTORIES[self._magic] \
+            + _SECURITY_DIRECTORY * 8
+        if directory + 8 <= self._table:
+            struct.pack_into('<II', self.data, directory, 0, 0)
+
+
+def _add_sections(fd: int, stub: str,
+                  sections: typing.Sequence[typing.Tuple[str, SectionData]]) \
+        -> bool:
+    try:
+        headers = _PeHeaders(fd)
+    except ValueError as e:
+        trace('Can not add sections to "{}": {}'.format(stub, e))
+        return False
+    if headers.free_section_headers() < len(sections):
+        trace('No room for {} more section headers in "{}".'
+              .format(len(sections), stub))
+        return False
+    existing = {s[0].rstrip(b'\0').decode('ascii', errors='replace')
+                for s in headers.sections()}
+    if existing & {name for (name, _) in sections}:
+        trace('"{}" has some of the sections already.'.format(stub))
+        return False
+
+    virtual_end = headers.virtual_end()
+    raw_alignment = max(headers.file_alignment, _RAW_ALIGNMENT)
+    file_end = os.fstat(fd).st_size
+    for (name, data) in sections:
+        virtual_address = _align(virtual_end, headers.section_alignment)
+        raw_offset = _align(file_end, raw_alignment)
+        size = _section_size(data)
+        raw_size = _align(size, headers.file_alignment)
+        trace('Adding section {} ({} bytes) at {:#x}.'
+              .format(name, size, virtual_address))
+
+        if isinstance(data, bytes):
+            os.pwrite(fd, data, raw_offset)
+        else:
+            concatenate(fd, raw_offset, *data)
+        headers.add_section(name, virtual_address, size, raw_offset,
+                            raw_size)
+        virtual_end = virtual_address + size
+        file_end = raw_offset + raw_size
+
+    os.ftruncate(fd, file_end)
+    headers.drop_checksum_and_signature()
+    os.pwrite(fd, headers.data, 0)
+    return True
+
+
+def create_unified_kernel(output: str, stub: str,
+                          sections: typing.Sequence[
+                              typing.Tuple[str, SectionData]]) -> bool:
+    """Create output from stub with sections (name, contents) added.
+
+    New sections are placed behind all sections of the stub. Return False
+    (and create nothing) if the stub is not a PE image or has no room for
+    more section headers."""
+    copy_file(stub, output)
+    fd = os.open(output, os.O_RDWR | os.O_CLOEXEC)
+    try:
+        created = _add_sections(fd, stub, sections)
+    finally:
+        os.close(fd)
+    if not created:
+        os.remove(output)
+    return created
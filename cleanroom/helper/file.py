@@ -6,13 +6,13 @@
 
 
 from ..exceptions import GenerateError
-from ..printer import debug, info, trace, verbose
+from ..printer import debug, info, trace
 from ..systemcontext import SystemContext
+from .datacopy import copy_file, copy_tree
 from .group import GroupHelper
+from .remover import remove_matches
 from .user import UserHelper
 
-from distutils.dir_util import copy_tree
-
 import glob
 import os
 import os.path
@@ -323,7 +323,14 @@ def _file_op(system_context: typing.Optional[SystemContext],
 
 
 def _copy_op(source: str, destination: str, **kwargs: typing.Any) -> None:
-    shutil.copyfile(source, destination, **kwargs)
+    copy_file(source, destination, **kwargs)
+
+
+def _move_op(source: str, destination: str, **kwargs: typing.Any) -> None:
+    # Only copies when moving across file systems:
+    shutil.move(source, destination,
+                copy_function=lambda s, d: copy_file(s, d, metadata=True),
+                **kwargs)
 
 
 def _recursive_copy_op(source: str, destination: str, **kwargs: typing.Any) \
@@ -334,7 +341,7 @@ def _recursive_copy_op(source: str, destination: str, **kwargs: typing.Any) \
     else:
         assert not os.path.isdir(destination)
         assert not os.path.exists(destination)
-        shutil.copyfile(source, destination, **kwargs)
+        copy_file(source, destination, **kwargs)
 
 
 def copy(system_context: typing.Optional[SystemContext],
@@ -350,33 +357,22 @@ def copy(system_context: typing.Optional[SystemContext],
 def move(system_context: typing.Optional[SystemContext],
          *args: str, **kwargs: typing.Any) -> None:
     """Move files."""
-    return _file_op(system_context, shutil.move, 'Moving "{}" to "{}".',
+    return _file_op(system_context, _move_op, 'Moving "{}" to "{}".',
                     *args, **kwargs)
 
 
 def remove(system_context: typing.Optional[SystemContext],
            *files: str, recursive: bool = False, force: bool = False,
-           outside: bool = False) -> None:
-    """Delete a file inside of a system."""
-    sc = None if outside else system_context
-    for file in expand_files(sc, *files, recursive=recursive):
-        trace('Removing "{}".'.format(file))
+           outside: bool = False, jobs: int = 1) -> None:
+    """Delete files inside of a system.
 
-        if not os.path.exists(file):
-            if force:
-                continue
-            raise GenerateError('Failed to delete: "{}" does not exist.'
-                                .format(file))
-        if os.path.isdir(file) and not os.path.islink(file):
-            if recursive:
-                shutil.rmtree(file)
-            else:
-                os.rmdir(file)
-        else:
-            try:
-                os.unlink(file)
-            except Exception:
-                if not force:
-                    raise
-                else:
-                    verbose('Failed to unlink "{}".'.format(file))
+    All patterns are matched in one walk over the file system. With
+    recursive set, up to jobs directories are deleted at a time."""
+    sc = None if outside else system_context
+    root = os.path.realpath(sc.fs_directory) if sc else '/'
+    patterns = [file_name(sc, f) if sc
+                else os.path.normpath(os.path.join(os.getcwd(), f))
+                for f in files]
+    count = remove_matches(root, *patterns, recursive=recursive,
+                           force=force, jobs=jobs)
+    debug('Removed {} entries matching {}.'.format(count, files))
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Write GUID partition tables into image files.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+
+import collections
+import os
+import struct
+import typing
+import uuid
+import zlib
+
+
+SECTOR_SIZE = 512
+ALIGNMENT = 1024 * 1024
+
+_ENTRY_COUNT = 128
+_ENTRY_SIZE = 128
+_ENTRIES_SECTORS = _ENTRY_COUNT * _ENTRY_SIZE // SECTOR_SIZE
+_FIRST_USABLE_LBA = ALIGNMENT // SECTOR_SIZE  # Like sfdisk does it
+
+_HEADER_FORMAT = '<8sIIIIQQQQ16sQIII'
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_ENTRY_FORMAT = '<16s16sQQQ72s'
+
+
+GptPartition \
+    = collections.namedtuple('GptPartition', ['start', 'size',
+                                              'partition_type', 'uuid',
+                                              'name'])
+
+
+def _protective_mbr(sectors: int) -> bytes:
+    mbr = bytearray(SECTOR_SIZE)
+    struct.pack_into('<B3sB3sII', mbr, 446, 0, b'\x00\x02\x00', 0xee,
+                     b'\xff\xff\xff', 1, min(sectors - 1, 0xffffffff))
+    mbr[510:512] = b'\x55\xaa'
+    return bytes(mbr)
+
+
+def _entries(partitions: typing.Sequence[GptPartition]) -> bytes:
+    entries = bytearray(_ENTRY_COUNT * _ENTRY_SIZE)
+    for (index, p) in enumerate(partitions):
+        assert p.start % SECTOR_SIZE == 0 and p.size % SECTOR_SIZE == 0
+        struct.pack_into(_ENTRY_FORMAT, entries, index * _ENTRY_SIZE,
+                         uuid.UUID(p.partition_type).bytes_le,
+                         uuid.UUID(p.uuid).bytes_le if p.uuid
+                         else uuid.uuid4().bytes_le,
+                         p.start // SECTOR_SIZE,
+                         (p.start + p.size) // SECTOR_SIZE - 1, 0,
+                         p.name.encode('utf-16-le')[:72])
+    return bytes(entries)
+
+
+def _header(*, current_lba: int, backup_lba: int, entries_lba: int,
+            last_usable_lba: int, disk_uuid: uuid.UUID,
+            entries_crc: int) -> bytes:
+    def pack(crc: int) -> bytes:
+        return struct.pack(_HEADER_FORMAT, b'EFI PART', 0x00010000,
+                           _HEADER_SIZE, crc, 0, current_lba, backup_lba,
+                           _FIRST_USABLE_LBA, last_usable_lba,
+                           disk_uuid.bytes_le, entries_lba, _ENTRY_COUNT,
+                           _ENTRY_SIZE, entries_crc)
+
+    header = pack(zlib.crc32(pack(0)))
+    return header + bytes(SECTOR_SIZE - len(header))
+
+
+def first_usable_offset() -> int:
+    return _FIRST_USABLE_LBA * SECTOR_SIZE
+
+
+def reserved_size_at_end() -> int:
+    """Space the backup partition table needs at the end of the disk."""
+    return (_ENTRIES_SECTORS + 1) * SECTOR_SIZE
+
+
+def write_gpt(image_file: str, partitions: typing.Sequence[GptPartition], *,
+              disk_uuid: typing.Optional[uuid.UUID] = None) -> None:
+    """Write a protective MBR, the GPT and its backup into image_file.
+
+    The size of image_file must be final already."""
+    size = os.path.getsize(image_file)
+    assert size % SECTOR_SIZE == 0
+    sectors = size // SECTOR_SIZE
+    last_lba = sectors - 1
+    last_usable_lba = last_lba - _ENTRIES_SECTORS - 1
+    assert len(partitions) <= _ENTRY_COUNT
+    for p in partitions:
+        assert p.start >= first_usable_offset()
+        assert (p.start + p.size) // SECTOR_SIZE - 1 <= last_usable_lba
+
+    disk_uuid = disk_uuid or uuid.uuid4()
+    entries = _entries(partitions)
+    entries_crc = zlib.crc32(entries)
+    trace('Writing GPT with {} partitions (disk UUID {}) to "{}".'
+          .format(len(partitions), disk_uuid, image_file))
+
+    with open(image_file, 'r+b') as f:
+        f.write(_protective_mbr(sectors))
+        f.write(_header(current_lba=1, backup_lba=last_lba, entries_lba=2,
+                        last_usable_lba=last_usable_lba, disk_uuid=disk_uuid,
+                        entries_crc=entries_crc))
+        f.write(entries)
+
+        f.seek((last_usable_lba + 1) * SECTOR_SIZE)
+        f.write(entries)
+        f.write(_header(current_lba=last_lba, backup_lba=1,
+                        entries_lba=last_usable_lba + 1,
+                        last_usable_lba=last_usable_lba, disk_uuid=disk_uuid,
+                        entries_crc=entries_crc))
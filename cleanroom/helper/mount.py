@@ -5,7 +5,7 @@
 """
 
 
-from ..printer import trace, none
+from ..printer import trace
 from .run import run
 
 import re
@@ -29,22 +29,50 @@ def _map_into_chroot(directory: str, chroot: str = ''):
     return directory
 
 
-def mount_points(directory: str, chroot: typing.Optional[str] = None) \
-        -> typing.List[str]:
-    """Return a list of mount points at or below the given directory."""
+_MOUNTINFO = '/proc/self/mountinfo'
+_OCTAL_ESCAPE = re.compile(r'\\([0-7]{3})')
+
+_mount_table: typing.Optional[typing.List[str]] = None
+
+
+def _unescape(field: str) -> str:
+    """Undo the octal escapes (\\040 for space, ...) of mountinfo fields."""
+    if '\\' not in field:
+        return field
+    return _OCTAL_ESCAPE.sub(lambda m: chr(int(m.group(1), 8)), field)
+
+
+def read_mount_table(mountinfo: str = _MOUNTINFO) -> typing.List[str]:
+    """Return all mount points (in mount order) from mountinfo."""
+    with open(mountinfo, 'r') as f:
+        return [_unescape(line.split(' ', 5)[4])
+                for line in f.read().split('\n') if line]
+
+
+def invalidate_mount_table() -> None:
+    """Forget the cached mount table."""
+    global _mount_table
+    _mount_table = None
+
+
+def _mount_table_view(cached: bool) -> typing.List[str]:
+    global _mount_table
+    if not cached or _mount_table is None:
+        _mount_table = read_mount_table(_MOUNTINFO)
+    return _mount_table
+
+
+def mount_points(directory: str, chroot: typing.Optional[str] = None, *,
+                 cached: bool = False) -> typing.List[str]:
+    """Return a list of mount points at or below the given directory.
+
+    With cached the mount table is only re-read after a mount or umount
+    done through this module. Mounts done behind its back are missed."""
     assert (not directory.endswith('/'))
     directory = _map_into_chroot(directory, chroot)
 
-    pattern = re.compile('^(.*) on (.*) type (.*)$')
-    result = run('/usr/bin/mount', trace_output=none)
     sub_mounts: typing.List[str] = []
-    for line in result.stdout.split('\n'):
-        if not line:
-            continue
-        match = re.match(pattern, line)
-        assert match
-        mount_point = match.group(2)
-
+    for mount_point in _mount_table_view(cached):
         if mount_point == directory or \
                 mount_point.startswith(directory + '/'):
             trace('Mount point: {}.'.format(mount_point))
@@ -55,20 +83,44 @@ def mount_points(directory: str, chroot: typing.Optional[str] = None) \
 
 def umount(directory: str, chroot: typing.Optional[str] = None) -> None:
     """Unmount a directory."""
-    assert len(mount_points(directory)) == 1
+    assert len(mount_points(directory, chroot, cached=True)) == 1
+
+    try:
+        run('/usr/bin/umount', _map_into_chroot(directory, chroot))
+    finally:
+        invalidate_mount_table()
 
-    run('/usr/bin/umount', _map_into_chroot(directory, chroot))
+    assert len(mount_points(directory, chroot, cached=True)) == 0
 
-    assert len(mount_points(directory)) == 0
+
+def _top_level(sub_mounts: typing.List[str]) -> typing.List[str]:
+    """Return the mount points that are not below another one."""
+    result: typing.List[str] = []
+    for mount_point in sorted(set(sub_mounts)):
+        if not result or not mount_point.startswith(result[-1] + '/'):
+            result.append(mount_point)
+    return result
 
 
 def umount_all(directory: str, chroot: typing.Optional[str] = None) -> bool:
-    """Unmount all mount points below a directory."""
+    """Unmount all mount points below a directory.
+
+    Everything is unmounted recursively in one umount call. If that
+    leaves anything behind, the rest is unmounted one by one (deepest
+    first), again in one call."""
     sub_mounts = mount_points(directory, chroot=chroot)
 
     if sub_mounts:
-        for mp in sub_mounts:
-            umount(mp)
+        try:
+            run('/usr/bin/umount', '--recursive', *_top_level(sub_mounts),
+                returncode=None)
+            sub_mounts = mount_points(directory, chroot=chroot)
+            if sub_mounts:
+                trace('Recursive umount left {} mount points, retrying.'
+                      .format(len(sub_mounts)))
+                run('/usr/bin/umount', *sub_mounts, returncode=None)
+        finally:
+            invalidate_mount_table()
 
         sub_mounts = mount_points(directory, chroot=chroot)
 
@@ -77,7 +129,7 @@ def umount_all(directory: str, chroot: typing.Optional[str] = None) -> bool:
 
 def mount(volume: str, directory: str, *,
           options: str = '', fs_type: str = '', chroot: str = '') -> None:
-    assert len(mount_points(directory)) == 0
+    assert len(mount_points(directory, chroot, cached=True)) == 0
 
     args: typing.List[str] = ['-t', fs_type] if fs_type else []
     args += ['-o', options] if options else []
@@ -104,9 +156,12 @@ def mount(volume: str, directory: str, *,
 
     args += [volume, target]
 
-    run('/usr/bin/mount', *args)
+    try:
+        run('/usr/bin/mount', *args)
+    finally:
+        invalidate_mount_table()
 
-    assert len(mount_points(directory)) == 1
+    assert len(mount_points(directory, chroot, cached=True)) == 1
 
 
 class Mount:
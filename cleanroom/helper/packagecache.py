@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""A package download cache shared between all systems and runs.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import debug, trace
+
+import contextlib
+import fcntl
+import fnmatch
+import json
+import os
+import os.path
+import typing
+
+
+_STATS_FILE = 'stats.json'
+_LOCK_FILE = '.lock'
+
+# Only these files are counted and evicted. Lock files, partial downloads
+# and repository databases (needed by the package proxy when offline)
+# stay in place:
+_ENTRY_PATTERNS = ('*.pkg.tar.*', '*.deb', 'efi-kernels/*.efi')
+_SKIPPED_DIRECTORIES = ('partial',)
+
+
+def _is_cache_entry(relative_path: str) -> bool:
+    return any(fnmatch.fnmatch(relative_path, p) if '/' in p
+               else fnmatch.fnmatch(os.path.basename(relative_path), p)
+               for p in _ENTRY_PATTERNS)
+
+
+def _cache_entries(directory: str) -> typing.Dict[str, os.stat_result]:
+    """Return all package files in directory with their stat results."""
+    result: typing.Dict[str, os.stat_result] = {}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in _SKIPPED_DIRECTORIES]
+        for f in files:
+            path = os.path.join(root, f)
+            if not _is_cache_entry(os.path.relpath(path, directory)):
+                continue
+            try:
+                result[path] = os.lstat(path)
+            except FileNotFoundError:
+                pass
+    return result
+
+
+def _last_use(stat_result: os.stat_result) -> float:
+    # atime is not updated on relatime/noatime mounts, so take whatever is
+    # newer:
+    return max(stat_result.st_atime, stat_result.st_mtime)
+
+
+class PackageCache:
+    """A directory with downloaded packages shared by package managers.
+
+    Downloads into the cache and evictions from it need an exclusive lock,
+    installing packages from the cache needs a shared lock. All locks are
+    flock(2) locks on a file inside the cache, so they work across
+    processes."""
+
+    def __init__(self, directory: str, *, max_size: int = 0) -> None:
+        """Constructor.
+
+        A max_size of 0 disables eviction."""
+        assert directory
+        self._directory = directory
+        self._max_size = max_size
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def subdirectory(self, package_manager: str) -> str:
+        """Return (and create) the cache directory of a package manager."""
+        directory = os.path.join(self._directory, package_manager)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @contextlib.contextmanager
+    def locked(self, *, exclusive: bool) -> typing.Iterator[None]:
+        """Hold a lock on the cache while in the context."""
+        os.makedirs(self._directory, exist_ok=True)
+        with open(os.path.join(self._directory, _LOCK_FILE), 'a') as lock:
+            trace('Locking package cache ({}).'
+                  .format('exclusive' if exclusive else 'shared'))
+            fcntl.flock(lock.fileno(),
+                        fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+                trace('Package cache unlocked.')
+
+    @contextlib.contextmanager
+    def downloading(self) -> typing.Iterator[None]:
+        """Hold an exclusive lock and record everything that got downloaded."""
+        with self.locked(exclusive=True):
+            before = _cache_entries(self._directory)
+            try:
+                yield
+            finally:
+                after = _cache_entries(self._directory)
+                new_files = [s for (p, s) in after.items() if p not in before]
+                if new_files:
+                    debug('{} packages added to package cache.'
+                          .format(len(new_files)))
+                self._update_stats(
+                    downloaded_files=len(new_files),
+                    downloaded_bytes=sum(s.st_size for s in new_files))
+
+    def evict(self) -> None:
+        """Remove least recently used packages until the size limit is met."""
+        if self._max_size <= 0:
+            return
+
+        with self.locked(exclusive=True):
+            entries = _cache_entries(self._directory)
+            size = sum(s.st_size for s in entries.values())
+            evicted_files = 0
+            evicted_bytes = 0
+            for (path, stat_result) in sorted(entries.items(),
+                                              key=lambda e: _last_use(e[1])):
+                if size <= self._max_size:
+                    break
+                trace('Evicting "{}" from package cache.'.format(path))
+                os.remove(path)
+                size -= stat_result.st_size
+                evicted_files += 1
+                evicted_bytes += stat_result.st_size
+            self._update_stats(evicted_files=evicted_files,
+                               evicted_bytes=evicted_bytes)
+
+    def stats(self) -> typing.Dict[str, int]:
+        """Return the cumulative cache statistics and the current size."""
+        stats = self._read_stats()
+        entries = _cache_entries(self._directory)
+        stats['files'] = len(entries)
+        stats['bytes'] = sum(s.st_size for s in entries.values())
+        return stats
+
+    def _read_stats(self) -> typing.Dict[str, int]:
+        stats = {'downloaded_files': 0, 'downloaded_bytes': 0,
+                 'evicted_files': 0, 'evicted_bytes': 0}
+        stats_file = os.path.join(self._directory, _STATS_FILE)
+        if os.path.isfile(stats_file):
+            with open(stats_file, 'r') as sf:
+                stats.update(json.load(sf))
+        return stats
+
+    def _update_stats(self, **increments: int) -> None:
+        """Add increments to the stats. Requires an exclusive lock!"""
+        stats = self._read_stats()
+        for (key, value) in increments.items():
+            stats[key] = stats.get(key, 0) + value
+
+        stats_file = os.path.join(self._directory, _STATS_FILE)
+        with open(stats_file + '.tmp', 'w') as sf:
+            json.dump(stats, sf, indent=2, sort_keys=True)
+        os.replace(stats_file + '.tmp', stats_file)
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""Match and remove many files in one walk over a directory tree.
+
+All patterns of one call are compiled into one matcher. The tree is
+walked once, starting at the root and only entering directories some
+pattern can still match in. Patterns follow the rules of the glob module:
+"*", "?" and "[...]" match within one path component and do not match
+names starting with "." unless the pattern does, "**" matches any number
+of directories if recursive is set.
+
+Everything is done relative to open directory file descriptors, so
+matched entries are unlinked without resolving their path again.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..exceptions import GenerateError
+from ..printer import trace, verbose
+
+import collections
+import concurrent.futures
+import fnmatch
+import os
+import os.path
+import re
+import stat
+import typing
+
+
+_MAGIC = re.compile('[*?[]')
+
+_LITERAL = 0
+_WILDCARD = 1
+_RECURSIVE = 2
+
+_DIRECTORY_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_CLOEXEC
+
+_Component = collections.namedtuple('_Component', ['kind', 'name', 'regex'])
+
+# Index of a pattern and of the next component of it to match:
+_State = typing.Tuple[int, int]
+_Pattern = typing.Tuple[_Component, ...]
+
+
+def _is_below(path: str, directory: str) -> bool:
+    return path == directory or directory == '/' \
+        or path.startswith(directory + '/')
+
+
+def _compile(root: str, pattern: str, recursive: bool) -> _Pattern:
+    """Split pattern (a path below root) into components."""
+    pattern = os.path.normpath(pattern)
+    if not _is_below(pattern, root):
+        raise GenerateError('File path "{}" is outside of "{}".'
+                            .format(pattern, root))
+    components: typing.List[_Component] = []
+    for part in pattern[len(root):].split('/'):
+        if not part:
+            continue
+        if recursive and part == '**':
+            if not components or components[-1].kind != _RECURSIVE:
+                components.append(_Component(_RECURSIVE, part, None))
+        elif _MAGIC.search(part):
+            components.append(_Component(
+                _WILDCARD, part, re.compile(fnmatch.translate(part))))
+        else:
+            components.append(_Component(_LITERAL, part, None))
+    return tuple(components)
+
+
+def _closure(patterns: typing.Sequence[_Pattern],
+             states: typing.Iterable[_State]) -> typing.Set[_State]:
+    """Add the states reached by "**" matching no directory."""
+    result: typing.Set[_State] = set()
+    todo = list(states)
+    while todo:
+        state = todo.pop()
+        if state in result:
+            continue
+        result.add(state)
+        (p, i) = state
+        if i < len(patterns[p]) and patterns[p][i].kind == _RECURSIVE:
+            todo.append((p, i + 1))
+    return result
+
+
+def _only_recursive(pattern: _Pattern, index: int) -> bool:
+    return all(c.kind == _RECURSIVE for c in pattern[index:])
+
+
+def _advance(patterns: typing.Sequence[_Pattern],
+             states: typing.Set[_State], name: str) \
+        -> typing.Tuple[typing.Set[_State], bool, bool]:
+    """Match name in states.
+
+    Return the next states, whether name is matched and whether it is
+    matched if it is a directory: Like glob, "a/**" matches a only if
+    that is a directory."""
+    hidden = name.startswith('.')
+    result: typing.Set[_State] = set()
+    matched = False
+    matched_if_directory = False
+    for (p, i) in states:
+        component = patterns[p][i]
+        if component.kind == _RECURSIVE:
+            if not hidden:
+                result.add((p, i))
+                matched = matched or _only_recursive(patterns[p], i)
+            continue
+        if component.kind == _LITERAL:
+            if name != component.name:
+                continue
+        elif (hidden and not component.name.startswith('.')) \
+                or not component.regex.match(name):
+            continue
+        result.add((p, i + 1))
+        if i + 1 == len(patterns[p]):
+            matched = True
+        elif _only_recursive(patterns[p], i + 1):
+            matched_if_directory = True
+    return _closure(patterns, result), matched, matched_if_directory
+
+
+def _is_directory(dir_fd: int, name: str) -> bool:
+    try:
+        return stat.S_ISDIR(os.stat(name, dir_fd=dir_fd).st_mode)
+    except OSError:
+        return False
+
+
+def _entries(dir_fd: int, patterns: typing.Sequence[_Pattern],
+             states: typing.Set[_State]) \
+        -> typing.List[typing.Tuple[str, bool, bool]]:
+    """Return (name, is_symlink, is_directory) of candidate entries.
+
+    The directory is only listed if some pattern has a wildcard here."""
+    if all(patterns[p][i].kind == _LITERAL for (p, i) in states):
+        result = []
+        for name in sorted({patterns[p][i].name for (p, i) in states}):
+            try:
+                mode = os.stat(name, dir_fd=dir_fd,
+                               follow_symlinks=False).st_mode
+            except OSError:
+                continue
+            result.append((name, stat.S_ISLNK(mode), stat.S_ISDIR(mode)))
+        return result
+
+    with os.scandir(dir_fd) as it:
+        return sorted((e.name, e.is_symlink(),
+                       e.is_dir(follow_symlinks=False)) for e in it)
+
+
+def _walk(root: str, dir_fd: int, path: str,
+          patterns: typing.Sequence[_Pattern], states: typing.Set[_State],
+          prune: bool) \
+        -> typing.Generator[typing.Tuple[int, str, str, bool], None, None]:
+    """Yield (dir_fd, name, path, is_directory) for matches below dir_fd.
+
+    Matches are yielded after their contents. With prune set, matched
+    directories are not entered at all. Symbolic links are only followed
+    if they point to a directory below root and are not matched
+    themselves."""
+    for (name, is_symlink, is_directory) in _entries(dir_fd, patterns,
+                                                     states):
+        (next_states, matched, matched_if_directory) \
+            = _advance(patterns, states, name)
+        if not next_states:
+            continue
+        if matched_if_directory and not matched:
+            matched = is_directory \
+                or (is_symlink and _is_directory(dir_fd, name))
+        child_states = {(p, i) for (p, i) in next_states
+                        if i < len(patterns[p])}
+        full_path = os.path.join(path, name)
+
+        if is_symlink:
+            descend = bool(child_states) and not matched \
+                and _is_directory(dir_fd, name)
+            if descend and not _is_below(os.path.realpath(full_path), root):
+                trace('Not following "{}": It points outside of "{}".'
+                      .format(full_path, root))
+                descend = False
+        else:
+            descend = bool(child_states) and is_directory \
+                and not (matched and prune)
+
+        if descend:
+            flags = _DIRECTORY_FLAGS if is_symlink \
+                else _DIRECTORY_FLAGS | os.O_NOFOLLOW
+            child_fd = os.open(name, flags, dir_fd=dir_fd)
+            try:
+                yield from _walk(root, child_fd, full_path, patterns,
+                                 child_states, prune)
+            finally:
+                os.close(child_fd)
+        if matched:
+            yield (dir_fd, name, full_path, is_directory)
+
+
+def _matches(root: str, patterns: typing.Iterable[str], recursive: bool,
+             prune: bool) \
+        -> typing.Generator[typing.Tuple[int, str, str, bool], None, None]:
+    root = os.path.realpath(root)
+    compiled = [_compile(root, p, recursive) for p in patterns]
+    states = _closure(compiled, ((p, 0) for p in range(len(compiled))))
+    if any(i == len(compiled[p]) for (p, i) in states):
+        raise GenerateError('Refusing to match "{}" itself.'.format(root))
+    if not states:
+        return
+
+    root_fd = os.open(root, _DIRECTORY_FLAGS)
+    try:
+        yield from _walk(root, root_fd, root, compiled, states, prune)
+    finally:
+        os.close(root_fd)
+
+
+def find_matches(root: str, *patterns: str, recursive: bool = False) \
+        -> typing.Generator[str, None, None]:
+    """Yield all paths below root matching any of patterns.
+
+    Patterns are absolute paths below root."""
+    for (_, _, path, _) in _matches(root, patterns, recursive, prune=False):
+        yield path
+
+
+def _remove_tree(dir_fd: int, name: str) -> None:
+    """Remove directory name in dir_fd with all its contents."""
+    fd = os.open(name, _DIRECTORY_FLAGS | os.O_NOFOLLOW, dir_fd=dir_fd)
+    try:
+        with os.scandir(fd) as it:
+            entries = [(e.name, e.is_dir(follow_symlinks=False))
+                       for e in it]
+        for (entry, is_directory) in entries:
+            if is_directory:
+                _remove_tree(fd, entry)
+            else:
+                os.unlink(entry, dir_fd=fd)
+    finally:
+        os.close(fd)
+    os.rmdir(name, dir_fd=dir_fd)
+
+
+def _remove_tree_and_close(dir_fd: int, name: str) -> None:
+    try:
+        _remove_tree(dir_fd, name)
+    finally:
+        os.close(dir_fd)
+
+
+def remove_matches(root: str, *patterns: str, recursive: bool = False,
+                   force: bool = False, jobs: int = 1) -> int:
+    """Remove everything below root matching any of patterns.
+
+    Matched directories are removed with their contents if recursive is
+    set (up to jobs of them at a time) and have to be empty otherwise.
+    Failing to unlink a file is only an error without force.
+
+    Return the number of matches."""
+    count = 0
+    futures: typing.List[concurrent.futures.Future] = []
+    with concurrent.futures.ThreadPoolExecutor(max(jobs, 1)) as executor:
+        for (dir_fd, name, path, is_directory) \
+                in _matches(root, patterns, recursive, prune=recursive):
+            count += 1
+            if is_directory and recursive and jobs > 1:
+                # The walk closes dir_fd, so the job works on a copy:
+                futures.append(executor.submit(_remove_tree_and_close,
+                                               os.dup(dir_fd), name))
+            elif is_directory and recursive:
+                _remove_tree(dir_fd, name)
+            elif is_directory:
+                os.rmdir(name, dir_fd=dir_fd)
+            else:
+                try:
+                    os.unlink(name, dir_fd=dir_fd)
+                except OSError:
+                    if not force:
+                        raise
+                    verbose('Failed to unlink "{}".'.format(path))
+        for future in futures:
+            future.result()
+    return count
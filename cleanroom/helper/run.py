@@ -7,6 +7,7 @@
 
 from cleanroom.exceptions import GenerateError
 from cleanroom.printer import trace
+from cleanroom.profiler import count_subprocess
 
 import os
 import subprocess
@@ -78,6 +79,7 @@ def run(*args: str,
                 trace_output('>> Redirecting stderr to {}.'.format(stdout))
             stderr_fd = open(stderr, mode='w')
 
+        count_subprocess()
         completed_process = subprocess.run(args,
                                            stdout=stdout_fd or subprocess.PIPE,
                                            stderr=stdout_fd or subprocess.PIPE,
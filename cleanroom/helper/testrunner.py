@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""Run system tests concurrently and report their results.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+from ..profiler import count_subprocess
+
+import collections
+import concurrent.futures
+import json
+import os
+import os.path
+import re
+import signal
+import subprocess
+import time
+import typing
+import xml.etree.ElementTree as ElementTree
+
+
+# Characters XML 1.0 does not allow, even escaped:
+_INVALID_XML = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+TestResult = collections.namedtuple('TestResult',
+                                    ['name', 'returncode', 'duration',
+                                     'timed_out', 'log_file'])
+
+
+def passed(result: TestResult) -> bool:
+    return result.returncode == 0 and not result.timed_out
+
+
+def output(result: TestResult) -> str:
+    """Return everything the test printed (stdout and stderr)."""
+    with open(result.log_file, 'r', errors='replace') as f:
+        return f.read()
+
+
+def _run_test(test: str, *args: str, env: typing.Mapping[str, str],
+              work_directory: str, timeout: float,
+              log_file: str) -> TestResult:
+    name = os.path.basename(test)
+    trace('Running test "{}".'.format(name))
+    start = time.monotonic()
+    timed_out = False
+    # Output goes straight into the log file, so it is there even if the
+    # test hangs and never needs to fit into memory:
+    with open(log_file, 'wb') as log:
+        count_subprocess()
+        process = subprocess.Popen((test, *args), cwd=work_directory,
+                                   env=env, stdin=subprocess.DEVNULL,
+                                   stdout=log, stderr=subprocess.STDOUT,
+                                   start_new_session=True)
+        try:
+            process.wait(timeout=timeout if timeout > 0 else None)
+        except subprocess.TimeoutExpired:
+            timed_out = True
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+    duration = time.monotonic() - start
+    trace('Test "{}" finished with {} after {:.2f}s{}.'
+          .format(name, process.returncode, duration,
+                  ' (timed out)' if timed_out else ''))
+    return TestResult(name=name, returncode=process.returncode,
+                      duration=duration, timed_out=timed_out,
+                      log_file=log_file)
+
+
+def run_tests(tests: typing.Sequence[str], *args: str,
+              env: typing.Mapping[str, str], work_directory: str,
+              log_directory: str, jobs: int = 1, timeout: float = 0,
+              on_result: typing.Optional[
+                  typing.Callable[[TestResult], None]] = None) \
+        -> typing.List[TestResult]:
+    """Run all tests with args, up to jobs at a time.
+
+    Tests running for longer than timeout seconds (0 for no limit) get
+    killed and count as failed. The output of each test ends up in a
+    file in log_directory. on_result is called as tests finish.
+
+    Results are returned in the order of tests."""
+    os.makedirs(log_directory, exist_ok=True)
+    with concurrent.futures.ThreadPoolExecutor(max(jobs, 1)) as executor:
+        futures = [executor.submit(_run_test, test, *args, env=env,
+                                   work_directory=work_directory,
+                                   timeout=timeout,
+                                   log_file=os.path.join(
+                                       log_directory,
+                                       os.path.basename(test) + '.log'))
+                   for test in tests]
+        if on_result:
+            for future in concurrent.futures.as_completed(futures):
+                on_result(future.result())
+        return [f.result() for f in futures]
+
+
+def slowest(results: typing.Sequence[TestResult], count: int = 5) \
+        -> typing.List[TestResult]:
+    return sorted(results, key=lambda r: r.duration, reverse=True)[:count]
+
+
+def write_json(results: typing.Sequence[TestResult], file_name: str) -> None:
+    with open(file_name, 'w') as f:
+        json.dump([{'name': r.name, 'returncode': r.returncode,
+                    'duration': r.duration, 'timed_out': r.timed_out,
+                    'passed': passed(r), 'log_file': r.log_file}
+                   for r in results], f, indent=2)
+
+
+def write_junit(results: typing.Sequence[TestResult], file_name: str, *,
+                suite_name: str) -> None:
+    suite = ElementTree.Element(
+        'testsuite', name=suite_name, tests=str(len(results)),
+        failures=str(sum(1 for r in results if not passed(r))),
+        time='{:.3f}'.format(sum(r.duration for r in results)))
+    for result in results:
+        case = ElementTree.SubElement(suite, 'testcase', name=result.name,
+                                      classname=suite_name,
+                                      time='{:.3f}'.format(result.duration))
+        if not passed(result):
+            message = 'Timed out' if result.timed_out \
+                else 'Exit code {}'.format(result.returncode)
+            ElementTree.SubElement(case, 'failure', message=message)
+        ElementTree.SubElement(case, 'system-out').text \
+            = _INVALID_XML.sub('', output(result))
+    ElementTree.ElementTree(suite).write(file_name, encoding='utf-8',
+                                         xml_declaration=True)
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""Create dm-verity hash trees.
+
+The result is identical to what "veritysetup format" writes (format
+version 1, with superblock) when given the same salt and UUID.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from ..printer import trace
+
+import concurrent.futures
+import hashlib
+import mmap
+import os
+import struct
+import typing
+import uuid as uuid_module
+
+
+_SUPERBLOCK_FORMAT = '<8sII16s32sIIQH6x256s168x'
+_HASH_TYPE = 1  # Normal (as opposed to Chrome OS) hash format.
+
+# Number of blocks handed to one worker thread at a time:
+_CHUNK_BLOCKS = 4096
+
+
+def _next_power_of_2(value: int) -> int:
+    return 1 << (value - 1).bit_length()
+
+
+def _hash_blocks(base: typing.Any, data: typing.Any, block_size: int, *,
+                 digest_size: int, executor: typing.Optional[
+                     concurrent.futures.Executor] = None) -> bytes:
+    """Return the (padded) digests of all whole blocks in data.
+
+    base is a hash object that already got the salt."""
+    padding = b'\0' * (digest_size - base.digest_size)
+
+    def hash_chunk(start: int, end: int) -> bytes:
+        result = bytearray()
+        for offset in range(start, end, block_size):
+            digest = base.copy()
+            digest.update(data[offset:offset + block_size])
+            result += digest.digest()
+            result += padding
+        return bytes(result)
+
+    end = len(data) - len(data) % block_size
+    chunk_size = _CHUNK_BLOCKS * block_size
+    chunks = [(start, min(start + chunk_size, end))
+              for start in range(0, end, chunk_size)]
+    if executor is None or len(chunks) < 2:
+        return b''.join(hash_chunk(s, e) for (s, e) in chunks)
+    return b''.join(executor.map(lambda c: hash_chunk(*c), chunks))
+
+
+def _pack_into_blocks(digests: bytes, *, digest_size: int,
+                      block_size: int) -> bytes:
+    """Fill hash blocks with digests, padding the last one with zeros."""
+    per_block = block_size // digest_size
+    blocks = (len(digests) // digest_size + per_block - 1) // per_block
+    return digests + b'\0' * (blocks * block_size - len(digests))
+
+
+class VerityHashTree:
+    """A dm-verity hash tree.
+
+    Feed the data with update() (e.g. while writing it) or
+    update_from_file(). Data that does not fill a whole data block at the
+    end is not covered, just like with veritysetup."""
+
+    def __init__(self, *, salt: typing.Optional[bytes] = None,
+                 uuid: typing.Optional[uuid_module.UUID] = None,
+                 hash_name: str = 'sha256',
+                 data_block_size: int = 4096, hash_block_size: int = 4096,
+                 jobs: int = 0) -> None:
+        """Constructor.
+
+        A random salt and UUID are used by default. jobs is the number
+        of threads to hash with (0 for one per CPU)."""
+        self._hash_name = hash_name
+        self._salt = os.urandom(hashlib.new(hash_name).digest_size) \
+            if salt is None else salt
+        self._uuid = uuid_module.uuid4() if uuid is None else uuid
+        self._data_block_size = data_block_size
+        self._hash_block_size = hash_block_size
+        self._jobs = jobs or os.cpu_count() or 1
+
+        self._base = hashlib.new(hash_name)
+        self._base.update(self._salt)
+        self._digest_size = _next_power_of_2(self._base.digest_size)
+        assert hash_block_size >= 2 * self._digest_size
+
+        self._pending = bytearray()
+        self._data_digests: typing.List[bytes] = []
+        self._data_blocks = 0
+
+        self._levels: typing.List[bytes] = []
+        self._root_hash = b''
+
+    @property
+    def salt(self) -> bytes:
+        return self._salt
+
+    @property
+    def uuid(self) -> uuid_module.UUID:
+        return self._uuid
+
+    @property
+    def data_blocks(self) -> int:
+        return self._data_blocks
+
+    def _hash_data(self, data: typing.Any) -> None:
+        with concurrent.futures.ThreadPoolExecutor(self._jobs) as executor:
+            digests = _hash_blocks(self._base, data, self._data_block_size,
+                                   digest_size=self._digest_size,
+                                   executor=executor)
+        self._data_digests.append(digests)
+        self._data_blocks += len(data) // self._data_block_size
+
+    def update(self, data: bytes) -> None:
+        """Add data to hash."""
+        assert not self._root_hash
+        self._pending += data
+        ready = len(self._pending) - len(self._pending) % (
+            _CHUNK_BLOCKS * self._data_block_size)
+        if ready:
+            with memoryview(self._pending) as view:
+                self._hash_data(view[:ready])
+            del self._pending[:ready]
+
+    def update_from_file(self, data_file: str) -> None:
+        """Add the contents of data_file to hash."""
+        assert not self._pending
+        with open(data_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self._hash_data(data)
+
+    def root_hash(self) -> str:
+        """Finish the hash tree and return the root hash."""
+        if not self._root_hash:
+            self._finish()
+        return self._root_hash.hex()
+
+    def _finish(self) -> None:
+        if len(self._pending) >= self._data_block_size:
+            self._hash_data(bytes(self._pending))
+        self._pending = bytearray()
+        if self._data_blocks == 0:
+            raise ValueError('No data to create a hash tree for.')
+
+        digests = b''.join(self._data_digests)
+        with concurrent.futures.ThreadPoolExecutor(self._jobs) as executor:
+            # Levels are counted from the bottom, like veritysetup does.
+            # A single data block has no levels: Its hash is the root hash.
+            while self._data_blocks > 1:
+                level = _pack_into_blocks(digests,
+                                          digest_size=self._digest_size,
+                                          block_size=self._hash_block_size)
+                self._levels.append(level)
+                if len(level) == self._hash_block_size:
+                    break
+                digests = _hash_blocks(self._base, level,
+                                       self._hash_block_size,
+                                       digest_size=self._digest_size,
+                                       executor=executor)
+
+        root = digests[:self._base.digest_size] if not self._levels \
+            else _hash_blocks(self._base, self._levels[-1],
+                              self._hash_block_size,
+                              digest_size=self._base.digest_size)
+        self._root_hash = root
+        trace('Verity hash tree: {} data blocks, {} levels, root hash {}.'
+              .format(self._data_blocks, len(self._levels), root.hex()))
+
+    def superblock(self) -> bytes:
+        return struct.pack(_SUPERBLOCK_FORMAT, b'verity', 1, _HASH_TYPE,
+                           self._uuid.bytes, self._hash_name.encode('ascii'),
+                           self._data_block_size, self._hash_block_size,
+                           self._data_blocks, len(self._salt), self._salt)
+
+    def write(self, verity_file: str) -> None:
+        """Write superblock and hash tree into verity_file."""
+        self.root_hash()
+        with open(verity_file, 'wb') as f:
+            superblock = self.superblock()
+            f.write(superblock)
+            f.write(b'\0' * (self._hash_block_size - len(superblock)))
+            for level in reversed(self._levels):
+                f.write(level)
+
+
+def create_verity(data_file: str, verity_file: str, *,
+                  salt: typing.Optional[bytes] = None,
+                  uuid: typing.Optional[uuid_module.UUID] = None) \
+        -> typing.Tuple[str, str]:
+    """Write the hash tree for data_file into verity_file.
+
+    Return the UUID and the root hash."""
+    tree = VerityHashTree(salt=salt, uuid=uuid)
+    tree.update_from_file(data_file)
+    root_hash = tree.root_hash()
+    tree.write(verity_file)
+    return str(tree.uuid), root_hash
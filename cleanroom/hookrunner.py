@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Run hooks concurrently where they do not get into each others way.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .execobject import ExecObject
+from .printer import trace
+
+import concurrent.futures
+import typing
+
+
+HookPaths = typing.Optional[typing.Tuple[str, ...]]
+
+
+def static_prefix(path: str) -> str:
+    """Return the part of a glob pattern before the first wildcard."""
+    parts: typing.List[str] = []
+    for part in path.split('/'):
+        if any(c in part for c in '*?['):
+            break
+        parts.append(part)
+    return '/'.join(parts) or '/'
+
+
+def _is_below(path: str, directory: str) -> bool:
+    return path == directory or directory == '/' \
+        or path.startswith(directory + '/')
+
+
+def paths_conflict(a: HookPaths, b: HookPaths) -> bool:
+    """Check whether hooks touching paths a and b need to run in order.
+
+    None stands for unknown paths and conflicts with everything."""
+    if a is None or b is None:
+        return True
+    return any(_is_below(x, y) or _is_below(y, x) for x in a for y in b)
+
+
+def _dependencies(paths: typing.List[HookPaths]) \
+        -> typing.List[typing.Set[int]]:
+    """Return the earlier hooks each hook has to wait for."""
+    return [{i for i in range(j) if paths_conflict(paths[i], paths[j])}
+            for j in range(len(paths))]
+
+
+def run_hooks(hooks: typing.Sequence[ExecObject],
+              execute: typing.Callable[[ExecObject], None], *,
+              paths: typing.Callable[[ExecObject], HookPaths],
+              jobs: int = 1) -> None:
+    """Run execute on all hooks, using up to jobs threads.
+
+    A hook only starts once all earlier hooks with conflicting paths are
+    done, so conflicting hooks keep their order. If hooks fail, no new
+    hooks are started and the exception of the first failed hook (in
+    hook order) is raised once the running ones are done."""
+    if jobs <= 1 or len(hooks) < 2:
+        for hook in hooks:
+            execute(hook)
+        return
+
+    hook_paths = [paths(h) for h in hooks]
+    trace('Hook paths: {}.'.format(hook_paths))
+    dependencies = _dependencies(hook_paths)
+    done: typing.Set[int] = set()
+    started: typing.Set[int] = set()
+    failures: typing.Dict[int, BaseException] = {}
+
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        running: typing.Dict[concurrent.futures.Future, int] = {}
+        while True:
+            if not failures:
+                for index in range(len(hooks)):
+                    if index not in started \
+                            and dependencies[index] <= done:
+                        started.add(index)
+                        running[executor.submit(execute,
+                                                hooks[index])] = index
+            if not running:
+                break
+
+            (finished, _) = concurrent.futures.wait(
+                running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in finished:
+                index = running.pop(future)
+                exception = future.exception()
+                if exception is None:
+                    done.add(index)
+                else:
+                    failures[index] = exception
+
+    if failures:
+        raise failures[min(failures)]
+    assert len(done) == len(hooks)
@@ -10,8 +10,11 @@ FIXME: Allow for different distro ids
 
 from __future__ import annotations
 
+from .exceptions import GenerateError
 from .helper import disk
 from .helper import mount
+from .helper.datacopy import copy_to_device
+from .helper.gpt import ALIGNMENT, GptPartition, write_gpt
 from .helper.run import run as helper_run
 from .printer import info, debug, fail, success, trace, verbose
 
@@ -26,15 +29,18 @@ mib = 1024 * 1024
 
 
 class DataProvider:
-    def write_root_partition(self, target_device: str):
+    def write_root_partition(self, target_device: str, offset: int = 0):
         assert False
 
-    def write_verity_partition(self, target_device: str):
+    def write_verity_partition(self, target_device: str, offset: int = 0):
         assert False
 
     def has_linux_kernel(self):
         assert False
-        
+
+    def linux_kernel_file(self) -> str:
+        assert False
+
     def write_linux_kernel(self, target_directory: str):
         assert False
 
@@ -45,15 +51,18 @@ class FileDataProvider(DataProvider):
         self._verity_partition = verity_partition
         self._kernel_file = kernel_file 
 
-    def write_root_partition(self, target_device: str):
-        shutil.copyfile(self._root_partition, target_device)
+    def write_root_partition(self, target_device: str, offset: int = 0):
+        copy_to_device(self._root_partition, target_device, offset=offset)
 
-    def write_verity_partition(self, target_device: str):
-        shutil.copyfile(self._verity_partition, target_device)
+    def write_verity_partition(self, target_device: str, offset: int = 0):
+        copy_to_device(self._verity_partition, target_device, offset=offset)
 
     def has_linux_kernel(self):
         return self._kernel_file
 
+    def linux_kernel_file(self) -> str:
+        return self._kernel_file or ''
+
     def write_linux_kernel(self, target_directory: str):
         if self._kernel_file:
             shutil.copyfile(self._kernel_file,
@@ -74,7 +83,8 @@ RawImageConfig \
                               'min_device_size', 'efi_size', 'root_size',
                               'verity_size', 'swap_size', 'root_hash',
                               'efi_label', 'root_label', 'verity_label',
-                              'swap_label', 'extra_partitions', 'writer'])
+                              'swap_label', 'extra_partitions', 'writer',
+                              'root_fs_type'])
 
 
 def _minimum_efi_size(kernel_size: int) -> int:
@@ -145,7 +155,19 @@ def create_image(image_filename: str, image_format: str,
                  root_partition: str, verity_partition: str,
                  root_hash: str,
                  sfdisk_command: str,
-                 flock_command: str) -> None:
+                 flock_command: str,
+                 qemu_img_command: str,
+                 mkfs_vfat_command: str,
+                 mcopy_command: str,
+                 mmd_command: str,
+                 mkswap_command: str,
+                 root_fs_type: str = 'squashfs',
+                 boot_loader_file: str = '') -> None:
+    """Create an image file or write the image onto a block device.
+
+    Image files are assembled directly, block devices get partitioned
+    with sfdisk and the partitions get written to one by one. Only image
+    files need mcopy and mmd (from mtools)."""
     debug('Creating image "{}".'.format(image_filename))
 
     kernel_size = _file_size(kernel_file) if kernel_file else 0
@@ -173,27 +195,42 @@ def create_image(image_filename: str, image_format: str,
             .format(kernel_size, root_size, verity_size, min_device_size))
 
     writer = FileDataProvider(root_partition, verity_partition, kernel_file)
-    _work_on_device_node(
-        RawImageConfig(path=image_filename,
-                       disk_format=image_format,
-                       force=True, repartition=True,
-                       min_device_size=min_device_size,
-                       efi_size=efi_size, root_size=root_size,
-                       verity_size=verity_size,
-                       swap_size=swap_size,
-                       efi_label=None,
-                       root_label=os.path.basename(root_partition),
-                       verity_label=os.path.basename(verity_partition),
-                       root_hash=root_hash,
-                       swap_label=None,
-                       extra_partitions=extra_partitions,
-                       writer=writer),
-        sfdisk_command=sfdisk_command,
-        flock_command=flock_command)
+    ic = RawImageConfig(path=image_filename,
+                        disk_format=image_format,
+                        force=True, repartition=True,
+                        min_device_size=min_device_size,
+                        efi_size=efi_size, root_size=root_size,
+                        verity_size=verity_size,
+                        swap_size=swap_size,
+                        efi_label=None,
+                        root_label=os.path.basename(root_partition),
+                        verity_label=os.path.basename(verity_partition),
+                        root_hash=root_hash,
+                        swap_label=None,
+                        extra_partitions=extra_partitions,
+                        writer=writer,
+                        root_fs_type=root_fs_type)
+    if swap_size > 0 and not mkswap_command:
+        raise GenerateError('mkswap is needed to create a swap partition.')
+    if disk.is_block_device(image_filename):
+        _work_on_device_node(ic, sfdisk_command=sfdisk_command,
+                             flock_command=flock_command,
+                             mkswap_command=mkswap_command)
+    else:
+        if not mcopy_command or not mmd_command:
+            raise GenerateError('mcopy and mmd (from mtools) are needed to '
+                                'create image files.')
+        _assemble_image_file(ic, boot_loader_file=boot_loader_file,
+                             qemu_img_command=qemu_img_command,
+                             mkfs_vfat_command=mkfs_vfat_command,
+                             mcopy_command=mcopy_command,
+                             mmd_command=mmd_command,
+                             mkswap_command=mkswap_command)
 
 
 def _work_on_device_node(ic: RawImageConfig, *,
-                         sfdisk_command: str, flock_command: str):
+                         sfdisk_command: str, flock_command: str,
+                         mkswap_command: str):
     with _find_or_create_device_node(ic.path, ic.disk_format,
                                      ic.min_device_size) as device:
 
@@ -215,7 +252,7 @@ def _work_on_device_node(ic: RawImageConfig, *,
         success('Partitions created.', verbosity=2)
 
         if 'swap' in partition_devices:
-            helper_run('/usr/bin/mkswap', '-L', 'main',
+            helper_run(mkswap_command, '-L', 'main',
                        partition_devices['swap'])
         assert 'root' in partition_devices
         ic.writer.write_root_partition(partition_devices['root'])
@@ -229,7 +266,8 @@ def _work_on_device_node(ic: RawImageConfig, *,
         _prepare_efi_partition(partition_devices['efi'],
                                partition_devices['root'],
                                ic.writer.has_linux_kernel(),
-                               ic.writer.write_linux_kernel)
+                               ic.writer.write_linux_kernel,
+                               root_fs_type=ic.root_fs_type)
         success('EFI partition installed.', verbosity=2)
 
         for i in range(len(ic.extra_partitions)):
@@ -242,10 +280,9 @@ def _work_on_device_node(ic: RawImageConfig, *,
 
 def _find_or_create_device_node(path: str, disk_format: str,
                                 min_device_size: int) -> typing.ContextManager:
-    if disk.is_block_device(path):
-        _validate_size_of_block_device(path, min_device_size)
-        return disk.Device(path)
-    return _create_nbd_device(path, disk_format, min_device_size)
+    assert disk.is_block_device(path)
+    _validate_size_of_block_device(path, min_device_size)
+    return disk.Device(path)
 
 
 def _validate_size_of_block_device(path: str, min_device_size: int) -> None:
@@ -256,10 +293,151 @@ def _validate_size_of_block_device(path: str, min_device_size: int) -> None:
              .format(path, min_device_size))
 
 
-def _create_nbd_device(path: str, disk_format: str, min_device_size: int) \
-        -> disk.Device:
-    return disk.NbdDevice.new_image_file(path, min_device_size,
-                                         disk_format=disk_format)
+def _align(offset: int) -> int:
+    return disk.quantify(offset, ALIGNMENT) * ALIGNMENT
+
+
+def _partition_layout(ic: RawImageConfig) \
+        -> typing.List[typing.Tuple[str, GptPartition]]:
+    """Place the partitions like _repartition does it (via sfdisk)."""
+    root_uuid = _uuidify(ic.root_hash[:32]) if ic.root_hash else ''
+    vrty_uuid = _uuidify(ic.root_hash[32:]) if ic.root_hash else ''
+
+    partitions = [('efi', 'c12a7328-f81f-11d2-ba4b-00a0c93ec93b', '',
+                   'EFI System Partition', ic.efi_size),
+                  ('root', '4f68bce3-e8cd-4db1-96e7-fbcaf984b709', root_uuid,
+                   ic.root_label, ic.root_size),
+                  ('verity', '2c7357ed-ebd2-46d9-aec1-23d437ec2bf5', vrty_uuid,
+                   ic.verity_label, ic.verity_size)]
+    if ic.swap_size > 0:
+        partitions.append(('swap', '0657fd6d-a4ab-43c4-84e5-0933c84b4f4f', '',
+                           'swap partition', ic.swap_size))
+    for (index, ep) in enumerate(ic.extra_partitions):
+        name = 'extra{}'.format(index + 1)
+        partitions.append((name, '2d212206-b0ee-482e-9fec-e7c208bef27a', '',
+                           name if ep.label is None else ep.label, ep.size))
+
+    result: typing.List[typing.Tuple[str, GptPartition]] = []
+    start = 2 * mib
+    for (name, partition_type, partition_uuid, label, size) in partitions:
+        size = disk.quantify(size, 512) * 512
+        result.append((name, GptPartition(start=start, size=size,
+                                          partition_type=partition_type,
+                                          uuid=partition_uuid, name=label)))
+        start = _align(start + size)
+    return result
+
+
+def _assemble_image_file(ic: RawImageConfig, *, boot_loader_file: str,
+                         qemu_img_command: str, mkfs_vfat_command: str,
+                         mcopy_command: str, mmd_command: str,
+                         mkswap_command: str) -> None:
+    """Write partition table and partition contents into a raw file.
+
+    This needs neither root nor any block devices. Images in other
+    formats are converted from the raw file with qemu-img."""
+    info('Assembling image file {}.'.format(ic.path))
+    raw_file = ic.path if ic.disk_format == 'raw' else ic.path + '.raw'
+    layout = _partition_layout(ic)
+    size = max(_align(ic.min_device_size),
+               _align(layout[-1][1].start + layout[-1][1].size) + 2 * mib)
+
+    with open(raw_file, 'wb') as f:
+        f.truncate(size)
+    write_gpt(raw_file, [p for (_, p) in layout])
+    success('Partitions created.', verbosity=2)
+
+    offsets = {name: p.start for (name, p) in layout}
+    sizes = {name: p.size for (name, p) in layout}
+
+    ic.writer.write_root_partition(raw_file, offset=offsets['root'])
+    success('Root partition installed.', verbosity=2)
+    ic.writer.write_verity_partition(raw_file, offset=offsets['verity'])
+    success('Verity partition installed.', verbosity=2)
+
+    with tempfile.TemporaryDirectory(prefix='clrm_image_',
+                                     dir=os.path.dirname(
+                                         os.path.abspath(raw_file))) \
+            as tmp:
+        efi_file = os.path.join(tmp, 'efi')
+        _create_efi_partition_file(efi_file, sizes['efi'],
+                                   boot_loader_file=boot_loader_file,
+                                   kernel_file=ic.writer.linux_kernel_file(),
+                                   mkfs_vfat_command=mkfs_vfat_command,
+                                   mcopy_command=mcopy_command,
+                                   mmd_command=mmd_command)
+        copy_to_device(efi_file, raw_file, offset=offsets['efi'])
+        success('EFI partition installed.', verbosity=2)
+
+        if 'swap' in offsets:
+            swap_file = os.path.join(tmp, 'swap')
+            with open(swap_file, 'wb') as f:
+                f.truncate(sizes['swap'])
+            helper_run(mkswap_command, '-L', 'main', swap_file)
+            copy_to_device(swap_file, raw_file, offset=offsets['swap'])
+
+        for (index, ep) in enumerate(ic.extra_partitions):
+            name = 'extra{}'.format(index + 1)
+            if ep.filesystem is None:
+                continue
+            extra_file = os.path.join(tmp, name)
+            with open(extra_file, 'wb') as f:
+                f.truncate(sizes[name])
+            _prepare_extra_partition(extra_file, filesystem=ep.filesystem,
+                                     label=ep.label, contents=ep.contents)
+            copy_to_device(extra_file, raw_file, offset=offsets[name])
+        success('Extra partitions installed.', verbosity=2)
+
+    if raw_file != ic.path:
+        helper_run(qemu_img_command, 'convert', '-q', '-f', 'raw',
+                   '-O', ic.disk_format, raw_file, ic.path)
+        os.remove(raw_file)
+        success('Image converted to {}.'.format(ic.disk_format), verbosity=2)
+
+
+def _create_efi_partition_file(efi_file: str, size: int, *,
+                               boot_loader_file: str, kernel_file: str,
+                               mkfs_vfat_command: str, mcopy_command: str,
+                               mmd_command: str) -> None:
+    """Create the EFI partition contents (see _prepare_efi_partition)."""
+    with open(efi_file, 'wb') as f:
+        f.truncate(size)
+    helper_run(mkfs_vfat_command, '-n', 'EFI', efi_file)
+
+    def mkdir(*directories: str) -> None:
+        helper_run(mmd_command, '-i', efi_file,
+                   *['::{}'.format(d) for d in directories])
+
+    def copy(source: str, destination: str) -> None:
+        helper_run(mcopy_command, '-i', efi_file, source,
+                   '::{}'.format(destination))
+
+    work_directory = os.path.dirname(efi_file)
+    if not kernel_file:
+        no_boot = os.path.join(work_directory, 'no_boot.txt')
+        with open(no_boot, 'w') as f:
+            f.write('No EFI boot support installed\n')
+        copy(no_boot, 'no_boot.txt')
+        return
+
+    if not os.path.isfile(boot_loader_file):
+        fail('Boot loader "{}" not found.'.format(boot_loader_file))
+
+    mkdir('EFI', 'EFI/Boot', 'EFI/systemd', 'EFI/Linux',
+          'loader', 'loader/entries')
+    copy(boot_loader_file, 'EFI/Boot/BOOTX64.EFI')
+    copy(boot_loader_file, 'EFI/systemd/systemd-bootx64.efi')
+    trace('... boot loader installed.')
+
+    loader_conf = os.path.join(work_directory, 'loader.conf')
+    with open(loader_conf, 'w') as lc:
+        lc.write('#timeout 3\n')
+        lc.write('default linux-*\n')
+    copy(loader_conf, 'loader/loader.conf')
+    trace('... loader.conf written.')
+
+    copy(kernel_file, 'EFI/Linux/{}'.format(os.path.basename(kernel_file)))
+    trace('... kernel installed')
 
 
 def _uuidify(data: str) -> str:
@@ -339,7 +517,8 @@ def _copy_efi_file(source: str, destination: str) -> None:
 
 
 def _prepare_efi_partition(efi_dev: str, root_dev: str,
-                           has_kernel: bool, kernel_file_writer) -> None:
+                           has_kernel: bool, kernel_file_writer, *,
+                           root_fs_type: str) -> None:
     trace('Preparing EFI partition.')
     _prepare_extra_partition(efi_dev, filesystem='vfat', label='EFI')
 
@@ -350,7 +529,7 @@ def _prepare_efi_partition(efi_dev: str, root_dev: str,
 
             if has_kernel:
                 with mount.Mount(root_dev, os.path.join(mnt_point, 'root'),
-                                 fs_type='squashfs') as root_mnt:
+                                 fs_type=root_fs_type) as root_mnt:
                     trace('... boot and root are mounted.')
 
                     loader = os.path.join(root_mnt,
@@ -385,7 +564,7 @@ def _prepare_efi_partition(efi_dev: str, root_dev: str,
 
 
 def _file_to_partition(device: str, file_name: str) -> None:
-    shutil.copyfile(file_name, device)
+    copy_to_device(file_name, device)
 
 
 def _format_partition(device: str, filesystem: str, *label_args: str) -> None:
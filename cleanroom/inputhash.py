@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Calculate hashes of everything that goes into generating a system.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .execobject import ExecObject
+from .printer import trace
+
+import hashlib
+import os
+import os.path
+import string
+import typing
+
+
+def hash_file(digest: typing.Any, path: str) -> None:
+    """Feed the contents of a file into digest."""
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1024 * 1024)
+            if not data:
+                break
+            digest.update(data)
+
+
+def hash_tree(digest: typing.Any, directory: str) -> None:
+    """Feed names, link targets and file contents below directory into digest.
+
+    Nothing is added for directories that do not exist."""
+    if not os.path.isdir(directory):
+        return
+
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for f in sorted(files + [d for d in dirs
+                                 if os.path.islink(os.path.join(root, d))]):
+            path = os.path.join(root, f)
+            digest.update(os.path.relpath(path, directory).encode('utf-8'))
+            digest.update(b'\0')
+            if os.path.islink(path):
+                digest.update(b'L' + os.readlink(path).encode('utf-8'))
+            elif os.path.isfile(path):
+                digest.update(b'F')
+                hash_file(digest, path)
+            digest.update(b'\0')
+
+
+def _hash_value(digest: typing.Any, value: typing.Any) -> None:
+    digest.update(repr(value).encode('utf-8'))
+    digest.update(b'\0')
+
+
+class InputHasher:
+    """Calculate rolling hashes over the ExecObjects of a system.
+
+    The hash of a system covers the hash of its base system, the source of
+    all commands, the system helper and tests directories, every
+    ExecObject (command, args and kwargs), the command configuration in
+    the systems directory and all files in the systems directory that are
+    referenced by arguments."""
+
+    def __init__(self, *, systems_definition_directory: str,
+                 commands_digest: str) -> None:
+        """Constructor."""
+        assert systems_definition_directory
+        self._systems_definition_directory \
+            = os.path.realpath(systems_definition_directory)
+        self._commands_digest = commands_digest
+
+    def system_hashes(self, system_name: str, base_hash: str,
+                      exec_obj_list: typing.List[ExecObject]) \
+            -> typing.List[str]:
+        """Return the hashes of all prefixes of exec_obj_list.
+
+        The last entry is the hash of the complete system."""
+        seed = hashlib.sha256()
+        _hash_value(seed, base_hash)
+        _hash_value(seed, system_name)
+        _hash_value(seed, self._commands_digest)
+        hash_tree(seed, os.path.join(self._systems_definition_directory,
+                                     system_name))
+        hash_tree(seed, os.path.join(self._systems_definition_directory,
+                                     'tests'))
+
+        current = seed.hexdigest()
+        result: typing.List[str] = []
+        for exec_obj in exec_obj_list:
+            digest = hashlib.sha256(current.encode('utf-8'))
+            self._hash_exec_object(digest, system_name, exec_obj)
+            current = digest.hexdigest()
+            result.append(current)
+
+        trace('Input hash of "{}": {}.'.format(system_name, current))
+        return result
+
+    def _hash_exec_object(self, digest: typing.Any, system_name: str,
+                          exec_obj: ExecObject) -> None:
+        _hash_value(digest, exec_obj.command)
+        _hash_value(digest, tuple(exec_obj.args))
+        _hash_value(digest, sorted(exec_obj.kwargs.items()))
+
+        hash_tree(digest, os.path.join(self._systems_definition_directory,
+                                       'config', exec_obj.command))
+
+        for value in (*exec_obj.args, *exec_obj.kwargs.values()):
+            path = self._referenced_path(system_name, value)
+            if not path:
+                continue
+            _hash_value(digest, path)
+            if os.path.isdir(path):
+                hash_tree(digest, path)
+            else:
+                hash_file(digest, path)
+
+    def _referenced_path(self, system_name: str, value: typing.Any) -> str:
+        """Map an argument to a file in the systems directory (if any)."""
+        if not isinstance(value, str) or not value or '\n' in value:
+            return ''
+
+        value = string.Template(value).safe_substitute(
+            SYSTEMS_DEFINITION_DIR=self._systems_definition_directory,
+            SYSTEM_HELPER_DIR=os.path.join(self._systems_definition_directory,
+                                           system_name))
+        if '$' in value:
+            return ''
+
+        path = os.path.realpath(os.path.join(self._systems_definition_directory,
+                                             value))
+        if not path.startswith(self._systems_definition_directory + '/'):
+            return ''  # Absolute paths refer to files inside the system.
+        if not os.path.exists(path):
+            return ''
+        return path
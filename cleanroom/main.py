@@ -56,6 +56,35 @@ def _parse_commandline(*arguments: str) -> typing.Any:
                         action='store_true',
                         help='Keep temporary data in work directory.')
 
+    parser.add_argument('--jobs', dest='jobs', type=int, action='store',
+                        default=1,
+                        help='Number of systems to generate in parallel.')
+    parser.add_argument('--checkpoints', dest='checkpoints', action='store',
+                        choices=['none', 'expensive', 'all'], default='none',
+                        help='Snapshot systems after (expensive) commands '
+                        'and resume from there when generating again.')
+    parser.add_argument('--btrfs-cli', dest='btrfs_cli', action='store_true',
+                        help='Use the btrfs command line tool instead of '
+                        'btrfs ioctls.')
+    parser.add_argument('--package-cache-size', dest='package_cache_size',
+                        type=int, action='store', default=0,
+                        help='Maximum size of the shared package cache in MiB '
+                        '(0 for no limit).')
+    parser.add_argument('--profile', dest='profile', action='store',
+                        default='', metavar='<file>',
+                        help='Write resource usage of all commands into a '
+                        'JSON file and print a summary.')
+    parser.add_argument('--package-proxy-upstream',
+                        dest='package_proxy_upstream', action='store',
+                        default='', metavar='<mirror>',
+                        help='Download packages through a local caching '
+                        'proxy in front of this mirror (URL or directory, '
+                        'may contain $repo and $arch).')
+    parser.add_argument('--no-pacman-batching', dest='batch_pacman',
+                        action='store_false',
+                        help='Run every pacman command in a transaction of '
+                        'its own.')
+
     parser.add_argument(dest='systems', nargs='*', metavar='<system>',
                         help='systems to create')
 
@@ -95,7 +124,8 @@ def main(*command_arguments: str) -> None:
     preflight_check('binaries', binary_manager.preflight_check,
                     ignore_errors=args.ignore_errors)
 
-    btrfs_helper = BtrfsHelper(binary_manager.binary(Binaries.BTRFS))
+    btrfs_helper = BtrfsHelper(binary_manager.binary(Binaries.BTRFS),
+                               use_ioctls=not args.btrfs_cli)
     user_helper = UserHelper(binary_manager.binary(Binaries.USERADD),
                              binary_manager.binary(Binaries.USERMOD))
     group_helper = GroupHelper(binary_manager.binary(Binaries.GROUPADD),
@@ -133,10 +163,20 @@ def main(*command_arguments: str) -> None:
 
         systems_manager \
             = SystemsManager(command_manager, systems_directory,
-                             *args.systems)
+                             *args.systems,
+                             parser_cache_directory=work_directory
+                             .parser_cache_directory)
 
         generator = Generator(systems_manager)
         generator.generate_systems(work_directory=work_directory,
                                    command_manager=command_manager,
                                    ignore_errors=args.ignore_errors,
-                                   repository_base_directory=args.repository_base_directory)
+                                   repository_base_directory=args.repository_base_directory,
+                                   jobs=args.jobs,
+                                   checkpoint_mode=args.checkpoints,
+                                   package_cache_size=args.package_cache_size
+                                   * 1024 * 1024,
+                                   profile_file=args.profile,
+                                   batch_pacman=args.batch_pacman,
+                                   package_proxy_upstream=args
+                                   .package_proxy_upstream)
@@ -7,10 +7,15 @@
 
 from .exceptions import ParseError
 from .location import Location
-from .printer import debug
+from .printer import debug, trace
 from .commandmanager import CommandManager
 from .execobject import ExecObject
+from .tokenizer import CommandTokens, tokenize
 
+import hashlib
+import os
+import os.path
+import pickle
 import re
 import pyparsing as pp  # type: ignore
 import typing
@@ -59,6 +64,19 @@ def _generate_grammar(*, debug_parser: bool = False):
     return Grammar
 
 
+__grammar: typing.Any = None
+
+
+def _grammar(*, debug_parser: bool = False) -> typing.Any:
+    """Return the grammar, generating it only once (unless debugging)."""
+    global __grammar
+    if debug_parser:
+        return _generate_grammar(debug_parser=True)
+    if __grammar is None:
+        __grammar = _generate_grammar()
+    return __grammar
+
+
 def __map_value(value: typing.Dict[str, str]) -> typing.Any:
     if 'simple' in value:
         v = value['simple']
@@ -100,73 +118,149 @@ def _process_arguments(arguments: typing.List[typing.Dict[str, str]]) \
 
 
 class Parser:
-    """Parse a system definition file."""
+    """Parse a system definition file.
+
+    Two backends are available: "tokenizer" (the default) is a hand-written
+    single pass tokenizer, "pyparsing" uses the pyparsing grammar. Both
+    accept the same syntax.
+
+    Parse results are cached in cache_directory (if set). Cache entries are
+    keyed on the file name and are valid as long as the file contents and
+    the commands are unchanged."""
     def __init__(self, command_manager: CommandManager, *,
-                 debug_parser: bool = False) -> None:
+                 debug_parser: bool = False,
+                 cache_directory: str = '',
+                 backend: str = 'tokenizer') -> None:
         """Constructor."""
+        assert backend in ('tokenizer', 'pyparsing')
         self._command_manager = command_manager
-        self._grammar = _generate_grammar(debug_parser=debug_parser)
+        self._backend = backend
+        self._grammar = _grammar(debug_parser=debug_parser) \
+            if backend == 'pyparsing' else None
+        self._cache_directory = cache_directory
 
     def parse(self, input_file: str) \
             -> typing.Tuple[str, typing.List[ExecObject]]:
         """Parse a file."""
+        if self._cache_directory:
+            return self._cached_parse(input_file)
+
         with open(input_file, 'r') as f:
             debug('Parsing file {}...'.format(input_file))
             return self._parse_string(f.read(), input_file)
 
-    def _parse_string(self, data, input_file_name) \
+    def _cache_file(self, input_file: str) -> str:
+        return os.path.join(self._cache_directory,
+                            hashlib.sha256(input_file.encode('utf-8'))
+                            .hexdigest() + '.bin')
+
+    def _cached_parse(self, input_file: str) \
             -> typing.Tuple[str, typing.List[ExecObject]]:
-        base_system_name = ''
-        exec_obj_list: typing.List[ExecObject] = []
+        cache_file = self._cache_file(input_file)
+        commands_digest = self._command_manager.digest()
+        stat_result = os.stat(input_file)
+
+        cache_entry: typing.Dict[str, typing.Any] = {}
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, 'rb') as cf:
+                    cache_entry = pickle.load(cf)
+            except Exception as e:
+                trace('Ignoring broken parser cache entry {}: {}.'
+                      .format(cache_file, e))
+            if cache_entry.get('commands_digest') != commands_digest:
+                cache_entry = {}
+
+        # Unchanged timestamp and size: No need to look at the contents.
+        if cache_entry.get('mtime_ns') == stat_result.st_mtime_ns \
+                and cache_entry.get('size') == stat_result.st_size:
+            trace('Using cached parse result for {}.'.format(input_file))
+            return cache_entry['result']
 
-        current_location = Location(file_name=input_file_name)
+        with open(input_file, 'r') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data.encode('utf-8')).hexdigest()
 
-        try:
-            parse_result = self._grammar.parseString(data, parseAll=True)
+        if cache_entry.get('content_hash') == content_hash:
+            trace('Using cached parse result for {} (touched).'
+                  .format(input_file))
+            result = cache_entry['result']
+        else:
+            debug('Parsing file {}...'.format(input_file))
+            result = self._parse_string(data, input_file)
 
-            for c in parse_result:
-                if not c:
-                    continue
+        os.makedirs(self._cache_directory, exist_ok=True)
+        with open(cache_file + '.tmp', 'wb') as cf:
+            pickle.dump({'commands_digest': commands_digest,
+                         'mtime_ns': stat_result.st_mtime_ns,
+                         'size': stat_result.st_size,
+                         'content_hash': content_hash,
+                         'result': result}, cf)
+        os.replace(cache_file + '.tmp', cache_file)
 
-                child_dict = c.asDict()
-                arguments = child_dict.get('args', [])
-                if isinstance(arguments, dict):
-                    arguments = [arguments]
-                assert isinstance(arguments, list)
+        return result
 
-                command = child_dict.get('command', {})
-                assert len(command) == 3
+    def _parse_string(self, data, input_file_name) \
+            -> typing.Tuple[str, typing.List[ExecObject]]:
+        base_system_name = ''
+        exec_obj_list: typing.List[ExecObject] = []
 
-                command_pos = command.get('locn_start', -1)
-                command_name = command.get('value', '')
+        if self._backend == 'pyparsing':
+            commands = self._pyparsing_commands(data, input_file_name)
+        else:
+            commands = tokenize(data, input_file_name)
+
+        for (command_name, command_pos, arguments) in commands:
+            current_location \
+                = Location(file_name=input_file_name,
+                           line_number=data.count('\n', 0, command_pos) + 1,
+                           description=command_name)
+            command_info = self._command_manager.command(command_name)
+
+            if not command_info:
+                raise ParseError('Unknown command {}.'.format(command_name),
+                                 location=current_location)
+
+            (args, kwargs) = _process_arguments(arguments)
+
+            command_info.validate_func(current_location, *args, **kwargs)
+            command_dependency = command_info.dependency_func(*args, **kwargs)
+            if command_dependency:
+                if base_system_name:
+                    raise ParseError('More than one base system was '
+                                     'provided in "{}".'
+                                     .format(input_file_name))
+                base_system_name = command_dependency
+
+            exec_obj_list.append(ExecObject(location=current_location,
+                                            command=command_name,
+                                            args=args,
+                                            kwargs=kwargs))
 
-                current_location \
-                    = Location(file_name=input_file_name,
-                               line_number=pp.lineno(command_pos, data),
-                               description=command_name)
-                command_info = self._command_manager.command(command_name)
+        return base_system_name, exec_obj_list
 
-                if not command_info:
-                    raise ParseError('Unknown command {}.'.format(c),
-                                     location=current_location)
+    def _pyparsing_commands(self, data, input_file_name) \
+            -> typing.List[CommandTokens]:
+        try:
+            parse_result = self._grammar.parseString(data, parseAll=True)
+        except pp.ParseException as pe:
+            raise ParseError(str(pe), location=Location(file_name=input_file_name))
 
-                (args, kwargs) = _process_arguments(arguments)
+        result: typing.List[CommandTokens] = []
+        for c in parse_result:
+            if not c:
+                continue
 
-                command_info.validate_func(current_location, *args, **kwargs)
-                command_dependency = command_info.dependency_func(*args, **kwargs)
-                if command_dependency:
-                    if base_system_name:
-                        raise ParseError('More than one base system was '
-                                         'provided in "{}".'
-                                         .format(input_file_name))
-                    base_system_name = command_dependency
+            child_dict = c.asDict()
+            arguments = child_dict.get('args', [])
+            if isinstance(arguments, dict):
+                arguments = [arguments]
+            assert isinstance(arguments, list)
 
-                exec_obj_list.append(ExecObject(location=current_location,
-                                                command=command_name,
-                                                args=args,
-                                                kwargs=kwargs))
+            command = child_dict.get('command', {})
+            assert len(command) == 3
 
-        except pp.ParseException as pe:
-            raise ParseError(str(pe), location=current_location)
+            result.append((command.get('value', ''),
+                           command.get('locn_start', -1), arguments))
 
-        return base_system_name, exec_obj_list
+        return result
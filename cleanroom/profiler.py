@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""Measure where the time goes while generating systems.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .location import Location
+from .printer import h2, msg, trace
+
+import contextlib
+import json
+import os
+import os.path
+import resource
+import time
+import typing
+
+
+_METRICS = ('wall_time', 'child_cpu_time', 'written_bytes', 'subprocesses',)
+
+_subprocesses = 0
+
+
+def count_subprocess() -> None:
+    """Note that an external command was started."""
+    global _subprocesses
+    _subprocesses += 1
+
+
+def _sample() -> typing.Dict[str, float]:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    this_process = resource.getrusage(resource.RUSAGE_SELF)
+    return {'wall_time': time.monotonic(),
+            'child_cpu_time': children.ru_utime + children.ru_stime,
+            # Linux accounts block output in 512 byte units:
+            'written_bytes': (children.ru_oublock
+                              + this_process.ru_oublock) * 512,
+            'subprocesses': _subprocesses}
+
+
+class _Frame:
+    def __init__(self, system_name: str, command: str,
+                 location: Location, depth: int) -> None:
+        self.record: typing.Dict[str, typing.Any] \
+            = {'system': system_name, 'command': command,
+               'location': str(location), 'hook': depth > 0}
+        self.start = _sample()
+        self.nested = {m: 0 for m in _METRICS}
+
+
+class Profiler:
+    """Record resource usage of every executed command.
+
+    The numbers recorded for a command do not include the hooks that
+    command ran: Those are recorded separately. Adding up all records of
+    a system thus gives the totals for that system.
+
+    Records are saved per system into directory, so that systems
+    generated in forked worker processes can get merged into the final
+    report."""
+
+    def __init__(self, directory: str) -> None:
+        """Constructor."""
+        assert directory
+        self._directory = directory
+        self._records: typing.Dict[str, typing.List[typing.Dict[str,
+                                                                typing.Any]]] \
+            = {}
+        self._stack: typing.List[_Frame] = []
+
+    @contextlib.contextmanager
+    def measure(self, system_name: str, command: str,
+                location: Location) -> typing.Iterator[None]:
+        """Measure the command executed in the context."""
+        frame = _Frame(system_name, command, location, len(self._stack))
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            end = _sample()
+            self._stack.pop()
+
+            for metric in _METRICS:
+                total = end[metric] - frame.start[metric]
+                frame.record[metric] = total - frame.nested[metric]
+                if self._stack:
+                    self._stack[-1].nested[metric] += total
+            self._records.setdefault(system_name, []).append(frame.record)
+            trace('Profile: {}.'.format(frame.record))
+
+    def save(self, system_name: str) -> None:
+        """Save the records of system_name."""
+        os.makedirs(self._directory, exist_ok=True)
+        with open(os.path.join(self._directory, system_name + '.json'),
+                  'w') as f:
+            json.dump(self._records.get(system_name, []), f)
+
+    def records(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        """Return all saved records."""
+        result: typing.List[typing.Dict[str, typing.Any]] = []
+        if not os.path.isdir(self._directory):
+            return result
+        for file_name in sorted(os.listdir(self._directory)):
+            if not file_name.endswith('.json'):
+                continue
+            with open(os.path.join(self._directory, file_name), 'r') as f:
+                result += json.load(f)
+        return result
+
+    def write_report(self, report_file: str) -> None:
+        """Write all saved records as JSON and print a summary."""
+        records = self.records()
+        report = {'records': records,
+                  'commands': _summarize(records, 'command'),
+                  'systems': _summarize(records, 'system')}
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        h2('Profile (written to "{}")'.format(report_file))
+        _print_table('Command', report['commands'])
+        _print_table('System', report['systems'])
+
+
+def _summarize(records: typing.List[typing.Dict[str, typing.Any]],
+               key: str) -> typing.List[typing.Dict[str, typing.Any]]:
+    """Add up records by key, most expensive first."""
+    summary: typing.Dict[str, typing.Dict[str, typing.Any]] = {}
+    for record in records:
+        entry = summary.setdefault(record[key],
+                                   {key: record[key], 'calls': 0,
+                                    **{m: 0 for m in _METRICS}})
+        entry['calls'] += 1
+        for metric in _METRICS:
+            entry[metric] += record[metric]
+    return sorted(summary.values(), key=lambda e: e['wall_time'],
+                  reverse=True)
+
+
+def _print_table(title: str,
+                 summary: typing.List[typing.Dict[str, typing.Any]]) -> None:
+    key = title.lower()
+    width = max([len(title)] + [len(e[key]) for e in summary])
+    msg('{:<{}}  {:>6}  {:>10}  {:>10}  {:>10}  {:>6}'
+        .format(title, width, 'Calls', 'Wall [s]', 'CPU [s]', 'Written',
+                'Procs'))
+    for entry in summary:
+        msg('{:<{}}  {:>6}  {:>10.2f}  {:>10.2f}  {:>8.1f}MB  {:>6}'
+            .format(entry[key], width, entry['calls'], entry['wall_time'],
+                    entry['child_cpu_time'],
+                    entry['written_bytes'] / 1000 / 1000,
+                    entry['subprocesses']))
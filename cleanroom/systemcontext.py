@@ -36,7 +36,9 @@ class SystemContext:
                  systems_definition_directory: str,
                  repository_base_directory: str,
                  storage_directory: str,
-                 timestamp: str) -> None:
+                 timestamp: str,
+                 package_cache_directory: str = '',
+                 package_proxy_url: str = '') -> None:
         """Constructor."""
         assert scratch_directory
         assert systems_definition_directory
@@ -50,6 +52,8 @@ class SystemContext:
         self._system_storage_directory = os.path.join(storage_directory,
                                                       system_name)
         self._base_storage_directory = ''
+        self._package_cache_directory = package_cache_directory
+        self._package_proxy_url = package_proxy_url
 
         self._base_context: typing.Optional[SystemContext] = None
         self._hooks: typing.Dict[str, typing.List[ExecObject]] = {}
@@ -115,6 +119,20 @@ class SystemContext:
     def cache_directory(self) -> str:
         return os.path.join(self._scratch_directory, 'cache')
 
+    @property
+    def package_cache_directory(self) -> str:
+        """Directory shared by all systems to cache downloaded packages.
+
+        Empty if package managers should use the cache_directory."""
+        return self._package_cache_directory
+
+    @property
+    def package_proxy_url(self) -> str:
+        """URL of the local package proxy to download packages from.
+
+        Empty if package managers should use their configured mirrors."""
+        return self._package_proxy_url
+
     @property
     def system_storage_directory(self) -> str:
         return self._system_storage_directory
@@ -141,10 +159,7 @@ class SystemContext:
         self.set_substitution('BASE_SYSTEM_LIST',
                               ';'.join(bases) if bases else '')
 
-        self.set_substitution('SCRATCH_DIR', self.scratch_directory)
-        self.set_substitution('ROOT_DIR', self.fs_directory)
-        self.set_substitution('META_DIR', self.meta_directory)
-        self.set_substitution('CACHE_DIR', self.cache_directory)
+        self._setup_directory_substitutions()
         self.set_substitution('SYSTEMS_DEFINITION_DIR',
                               self.systems_definition_directory)
         self.set_substitution('SYSTEM_HELPER_DIR', self.system_helper_directory)
@@ -164,6 +179,12 @@ class SystemContext:
         self.set_substitution('IMAGE_OPTIONS', 'rw,subvol=/.images')
         self.set_substitution('IMAGE_DEVICE', '/dev/disk/by-label/fs_btrfs')
 
+    def _setup_directory_substitutions(self) -> None:
+        self.set_substitution('SCRATCH_DIR', self.scratch_directory)
+        self.set_substitution('ROOT_DIR', self.fs_directory)
+        self.set_substitution('META_DIR', self.meta_directory)
+        self.set_substitution('CACHE_DIR', self.cache_directory)
+
     # Handle Hooks:
     def add_hook(self, hook: str, exec_obj: ExecObject) -> None:
         """Add a hook."""
@@ -224,6 +245,25 @@ class SystemContext:
         self._hooks = base_context._hooks
         self._substitutions = base_context._substitutions
 
+    def save_state(self, state_file: str) -> None:
+        """Save timestamp, hooks and substitutions into state_file."""
+        trace('Saving system_context state into {}.'.format(state_file))
+        with open(state_file, 'wb') as sf:
+            pickle.dump((self._timestamp, self._hooks,
+                         self._hooks_that_already_ran, self._substitutions),
+                        sf)
+
+    def restore_state(self, state_file: str) -> None:
+        """Restore state saved by save_state."""
+        trace('Restoring system_context state from {}.'.format(state_file))
+        with open(state_file, 'rb') as sf:
+            (self._timestamp, self._hooks,
+             self._hooks_that_already_ran, self._substitutions) \
+                = pickle.load(sf)
+
+        # The state might have been saved in a different scratch directory:
+        self._setup_directory_substitutions()
+
     def pickle(self) -> None:
         """Pickle this system_context."""
         pickle_jar = os.path.join(self.meta_directory, 'pickle_jar.bin')
@@ -31,6 +31,7 @@ class _DependencyNode(object):
         # Tree:
         self.parent = parent
         self.children: typing.List[_DependencyNode] = []
+        self._depth = parent.depth + 1 if parent else 0
 
         # Payload:
         self.system = system
@@ -58,22 +59,24 @@ class _DependencyNode(object):
 
     @property
     def depth(self) -> int:
-        """Calculate the distance from the root node."""
-        if self.parent:
-            return self.parent.depth + 1
-        return 0
+        """Distance from the root node."""
+        return self._depth
 
 
 class SystemsManager(object):
     """Drives the generation of systems."""
 
     def __init__(self, command_manager: CommandManager,
-                 systems_definition_directory: str, *systems: str) -> None:
+                 systems_definition_directory: str, *systems: str,
+                 parser_cache_directory: str = '') -> None:
         """Constructor."""
         self._command_manager = command_manager
+        self._parser = Parser(command_manager,
+                              cache_directory=parser_cache_directory)
         assert systems_definition_directory
         self._systems_definition_directory = systems_definition_directory
         self._systems_forest: typing.List[_DependencyNode] = []
+        self._nodes: typing.Dict[str, _DependencyNode] = {}
 
         verbose('Requested systems: {}.'.format(', '.join(systems)))
         for system in systems:
@@ -98,6 +101,61 @@ class SystemsManager(object):
     def systems_definition_directory(self) -> str:
         return self._systems_definition_directory
 
+    def __contains__(self, system_name: str) -> bool:
+        return system_name in self._nodes
+
+    def _node(self, system_name: str) -> _DependencyNode:
+        node = self._nodes.get(system_name)
+        if not node:
+            raise SystemNotFoundError('System "{}" is not known.'
+                                      .format(system_name))
+        return node
+
+    def systems(self) -> typing.List[str]:
+        """Return all systems in topological order (base systems first)."""
+        return [system_name
+                for (system_name, _, _, _) in self.walk_systems_forest()]
+
+    def exec_obj_list(self, system_name: str) -> typing.List[ExecObject]:
+        """Return the ExecObjects of a system."""
+        return self._node(system_name).exec_obj_list
+
+    def base_system(self, system_name: str) -> typing.Optional[str]:
+        """Return the direct base system of a system."""
+        parent = self._node(system_name).parent
+        return parent.system if parent else None
+
+    def depth(self, system_name: str) -> int:
+        """Return the number of base systems of a system."""
+        return self._node(system_name).depth
+
+    def children(self, system_name: str) -> typing.List[str]:
+        """Return the systems directly based on a system."""
+        return [c.system for c in self._node(system_name).children]
+
+    def ancestors(self, system_name: str) -> typing.List[str]:
+        """Return all base systems of a system, nearest first."""
+        result: typing.List[str] = []
+        node = self._node(system_name).parent
+        while node:
+            result.append(node.system)
+            node = node.parent
+        return result
+
+    def descendants(self, system_name: str) -> typing.List[str]:
+        """Return all systems based (indirectly) on a system.
+
+        The result is in topological order."""
+        return [n.system for n in self._node(system_name).walk()][1:]
+
+    def subtree(self, *system_names: str) -> typing.List[str]:
+        """Return systems with all their descendants in topological order."""
+        selected: typing.Set[str] = set()
+        for system_name in system_names:
+            selected.add(system_name)
+            selected.update(self.descendants(system_name))
+        return [s for s in self.systems() if s in selected]
+
     def _print_systems_forest(self) -> None:
         """Print the systems forest."""
         base_indent = "  "
@@ -140,6 +198,7 @@ class SystemsManager(object):
         assert not base_system_name or parent_node.system == base_system_name
 
         node = _DependencyNode(system_name, parent_node, exec_obj_list)
+        self._nodes[system_name] = node
 
         if parent_node:
             parent_node.children.append(node)
@@ -151,8 +210,7 @@ class SystemsManager(object):
     def _parse_system_definition_file(self, system_file: str) \
             -> typing.Tuple[str, typing.List[ExecObject]]:
         debug('Parsing "{}".'.format(system_file))
-        system_parser = Parser(self._command_manager)
-        (base_system_name, exec_obj_list) = system_parser.parse(system_file)
+        (base_system_name, exec_obj_list) = self._parser.parse(system_file)
         if not base_system_name:
             raise ParseError('No base system was provided in "{}".'
                              .format(system_file))
@@ -174,9 +232,4 @@ class SystemsManager(object):
 
     def _find(self, system: str) -> typing.Optional[_DependencyNode]:
         """Find a system in the dependency tree."""
-        for root_node in self._systems_forest:
-            node = root_node.find(system)
-            if node:
-                return node
-
-        return None
+        return self._nodes.get(system)
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Split system definition files into commands and arguments.
+
+This is a hand-written equivalent of the pyparsing grammar in parser.py.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+from .exceptions import ParseError
+from .location import Location
+
+import re
+import typing
+
+
+Argument = typing.Dict[str, str]
+CommandTokens = typing.Tuple[str, int, typing.List[Argument]]
+
+
+_WHITESPACE = re.compile('[ \t]*')
+_COMMENT = re.compile('#[^\n]*')
+_IDENTIFIER = re.compile('[A-Za-z][A-Za-z0-9_-]*')
+_SIMPLE_ARGUMENT = re.compile(r'[A-Za-z0-9_\-+*!$%&/()\[\]{}.,;:]+')
+_SINGLE_QUOTED_ARGUMENT = re.compile(r"'((?:\\.|[^'\n\r\\])*)'")
+_DOUBLE_QUOTED_ARGUMENT = re.compile(r'"((?:\\.|[^"\n\r\\])*)"')
+
+# Backslash escapes: \t, \n, \f and \r are whitespace, any other escaped
+# character stands for itself. Multiline arguments only know the whitespace
+# escapes.
+_ESCAPE = re.compile(r'\\(?:([tnfr])|(.))')
+_MULTILINE_ESCAPE = re.compile(r'\\([tnfr])')
+
+_WHITESPACE_ESCAPES = {'t': '\t', 'n': '\n', 'f': '\f', 'r': '\r'}
+
+
+def _replace_escape(match: typing.Match) -> str:
+    if match.group(1):
+        return _WHITESPACE_ESCAPES[match.group(1)]
+    return match.group(2)
+
+
+def _unescape(value: str, pattern: typing.Pattern) -> str:
+    if '\\' not in value:
+        return value
+    return pattern.sub(_replace_escape, value)
+
+
+class _Tokenizer:
+    """Single pass over the input data.
+
+    All methods take the current position and return the position after
+    whatever they matched (or -1 if nothing matched)."""
+
+    def __init__(self, data: str) -> None:
+        self._data = data
+        self._end = len(data)
+
+    def _skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE.match(self._data, pos).end()
+
+    def end_of_line(self, pos: int, *, skip_whitespace: bool = True) -> int:
+        """Match an optional comment and a line end.
+
+        The end of the data counts as line end, but is reported as
+        position _end + 1, so that it only matches once."""
+        if pos > self._end:
+            return -1
+        if skip_whitespace:
+            pos = self._skip_whitespace(pos)
+        comment = _COMMENT.match(self._data, pos)
+        if comment:
+            pos = comment.end()
+        if pos < self._end:
+            return pos + 1 if self._data[pos] == '\n' else -1
+        return pos + 1 if pos == self._end else -1
+
+    def line_continuation(self, pos: int, *,
+                          skip_whitespace: bool = True) -> int:
+        """Match line ends followed by at least 4 whitespace characters."""
+        current = self.end_of_line(pos, skip_whitespace=skip_whitespace)
+        if current < 0:
+            return -1
+        while True:
+            next_line = self.end_of_line(current,
+                                         skip_whitespace=skip_whitespace)
+            if next_line < 0:
+                break
+            current = next_line
+
+        if current >= self._end:
+            return -1
+        indent_end = self._skip_whitespace(current)
+        return indent_end if indent_end - current >= 4 else -1
+
+    def value(self, pos: int) -> typing.Tuple[typing.Optional[Argument], int]:
+        """Match a simple or quoted value."""
+        if pos >= self._end:
+            return None, -1
+
+        data = self._data
+        first = data[pos]
+        if first == '\'' or first == '"':
+            match = (_SINGLE_QUOTED_ARGUMENT if first == '\''
+                     else _DOUBLE_QUOTED_ARGUMENT).match(data, pos)
+            if not match:
+                return None, -1
+            return {'quoted': _unescape(match.group(1), _ESCAPE)}, match.end()
+        if data.startswith('<<<<', pos):
+            end = data.find('>>>>', pos + 4)
+            if end < 0:
+                return None, -1
+            return ({'quoted': _unescape(data[pos + 4:end], _MULTILINE_ESCAPE)},
+                    end + 4)
+
+        match = _SIMPLE_ARGUMENT.match(data, pos)
+        if not match:
+            return None, -1
+        return {'simple': match.group(0)}, match.end()
+
+    def argument(self, pos: int) \
+            -> typing.Tuple[typing.Optional[Argument], int]:
+        """Match a keyword argument or a plain argument.
+
+        Keyword arguments need to be written without any whitespace around
+        the '=' and their line continuation may not be preceded by
+        whitespace either."""
+        identifier = _IDENTIFIER.match(self._data, pos)
+        if identifier and self._data.startswith('=', identifier.end()):
+            (value, end) = self.value(identifier.end() + 1)
+            if value is not None:
+                value['key'] = identifier.group(0)
+                continuation = self.line_continuation(end,
+                                                      skip_whitespace=False)
+                return value, end if continuation < 0 else continuation
+
+        (value, end) = self.value(pos)
+        if value is None:
+            return None, -1
+        continuation = self.line_continuation(end)
+        return value, end if continuation < 0 else continuation
+
+    def commands(self) -> typing.Tuple[typing.List[CommandTokens], int]:
+        """Match all commands.
+
+        Returns the commands and the position where matching stopped."""
+        result: typing.List[CommandTokens] = []
+        pos = 0
+        while True:
+            command_pos = self._skip_whitespace(pos)
+            identifier = _IDENTIFIER.match(self._data, command_pos)
+            if identifier:
+                pos = identifier.end()
+                continuation = self.line_continuation(pos)
+                if continuation >= 0:
+                    pos = continuation
+
+                arguments: typing.List[Argument] = []
+                while True:
+                    (argument, end) \
+                        = self.argument(self._skip_whitespace(pos))
+                    if argument is None:
+                        break
+                    arguments.append(argument)
+                    pos = end
+
+                result.append((identifier.group(0), command_pos, arguments))
+
+            end_of_line = self.end_of_line(pos)
+            if end_of_line < 0:
+                return result, self._skip_whitespace(pos)
+            pos = end_of_line
+            if pos > self._end:
+                return result, self._end
+
+
+def tokenize(data: str, file_name: str) -> typing.List[CommandTokens]:
+    """Split data into commands.
+
+    Return a list of (command name, position of command name, arguments)
+    tuples. Each argument is a dictionary with a 'simple' or 'quoted'
+    value and an optional 'key' for keyword arguments."""
+    (result, pos) = _Tokenizer(data).commands()
+    if pos < len(data):
+        line_number = data.count('\n', 0, pos) + 1
+        column = pos - data.rfind('\n', 0, pos)
+        raise ParseError('Unexpected "{}" in line {}, column {}.'
+                         .format(data[pos], line_number, column),
+                         location=Location(file_name=file_name))
+    return result
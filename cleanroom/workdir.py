@@ -32,6 +32,7 @@ def _clear_directory(directory: str, btrfs_helper: BtrfsHelper) -> None:
         # Fast path:-)
         btrfs_helper.delete_subvolume(os.path.join(directory, 'fs'))
         btrfs_helper.delete_subvolume(os.path.join(directory, 'meta'))
+        btrfs_helper.delete_subvolume(os.path.join(directory, 'boot'))
         btrfs_helper.delete_subvolume(os.path.join(directory, 'cache'))
         btrfs_helper.delete_subvolume(directory)
 
@@ -74,8 +75,10 @@ class WorkDir:
                                          .format(work_directory))
                 if clear_scratch_directory:
                     self.clear_scratch_directory()
+                    self._clear_job_scratch_directories()
                 if clear_storage:
                     self.clear_storage_directory()
+                    self.clear_checkpoint_directory()
         else:
             trace('Creating temporary work directory.')
             self._temp_directory = tempfile.TemporaryDirectory(prefix='clrm-',
@@ -114,10 +117,30 @@ class WorkDir:
         """Get the system directory."""
         return os.path.join(self._work_directory, 'scratch')
 
-    def clear_scratch_directory(self) -> None:
-        _clear_directory(self.scratch_directory, self._btrfs_helper)
-        self._btrfs_helper.create_subvolume(self.scratch_directory)
+    def job_scratch_directory(self, job: int) -> str:
+        """Get the scratch directory used by a parallel job.
 
+        Job 0 uses the normal scratch directory."""
+        if job == 0:
+            return self.scratch_directory
+        return os.path.join(self._work_directory, 'scratch_{}'.format(job))
+
+    def clear_scratch_directory(self, job: int = 0) -> None:
+        scratch_directory = self.job_scratch_directory(job)
+        _clear_directory(scratch_directory, self._btrfs_helper)
+        self._btrfs_helper.create_subvolume(scratch_directory)
+
+    def remove_job_scratch_directory(self, job: int) -> None:
+        """Remove the scratch directory of a parallel job."""
+        assert job > 0
+        _clear_directory(self.job_scratch_directory(job), self._btrfs_helper)
+
+    def _clear_job_scratch_directories(self) -> None:
+        with os.scandir(self._work_directory) as it:
+            for entry in it:
+                if entry.name.startswith('scratch_') \
+                        and entry.is_dir(follow_symlinks=False):
+                    _clear_directory(entry.path, self._btrfs_helper)
 
     @property
     def storage_directory(self) -> str:
@@ -136,6 +159,61 @@ class WorkDir:
         # slow path:
         _clear_directory(self.storage_directory, self._btrfs_helper)
 
+    def clear_storage_entry(self, system_name: str) -> None:
+        """Remove one system from storage."""
+        _clear_directory(os.path.join(self.storage_directory, system_name),
+                         self._btrfs_helper)
+
+    def _input_hash_file(self, system_name: str) -> str:
+        return os.path.join(self.storage_directory, system_name, 'input_hash')
+
+    def storage_input_hash(self, system_name: str) -> str:
+        """Get the input hash a system in storage was generated from.
+
+        Returns an empty string for systems that are not (completely)
+        stored."""
+        input_hash_file = self._input_hash_file(system_name)
+        if not os.path.isfile(input_hash_file):
+            return ''
+        with open(input_hash_file, 'r') as f:
+            return f.read().strip()
+
+    def set_storage_input_hash(self, system_name: str,
+                               input_hash: str) -> None:
+        """Stamp a system in storage with the hash of its inputs."""
+        with open(self._input_hash_file(system_name), 'w') as f:
+            f.write(input_hash + '\n')
+
+    @property
+    def parser_cache_directory(self) -> str:
+        """Get the directory holding parsed system definition files."""
+        return os.path.join(self._work_directory, 'parser_cache')
+
+    @property
+    def package_cache_directory(self) -> str:
+        """Get the package download cache shared by all systems."""
+        return os.path.join(self._work_directory, 'package_cache')
+
+    @property
+    def checkpoint_directory(self) -> str:
+        """Get the directory holding checkpoints of partially built systems."""
+        return os.path.join(self._work_directory, 'checkpoints')
+
+    def clear_checkpoint_directory(self) -> None:
+        if not os.path.isdir(self.checkpoint_directory):
+            return
+        with os.scandir(self.checkpoint_directory) as it:
+            for entry in it:
+                self._btrfs_helper.delete_subvolume_recursive(entry.path)
+                if os.path.isdir(entry.path):
+                    os.rmdir(entry.path)
+        os.rmdir(self.checkpoint_directory)
+
+    @property
+    def btrfs_helper(self) -> BtrfsHelper:
+        """Get the btrfs helper used for the work directory."""
+        return self._btrfs_helper
+
     @property
     def work_directory(self) -> str:
         """Get the work directory based."""
@@ -144,6 +222,7 @@ class WorkDir:
     def _setup_work_directory(self) -> None:
         _ensure_directory(self.storage_directory, self._btrfs_helper)
         _ensure_directory(self.scratch_directory, self._btrfs_helper)
+        _ensure_directory(self.package_cache_directory, self._btrfs_helper)
 
         info('WorkDir: work directory     = "{}".'
              .format(self.work_directory))
@@ -151,3 +230,5 @@ class WorkDir:
               .format(self.scratch_directory))
         debug('WorkDir: storage directory  = "{}".'
               .format(self.storage_directory))
+        debug('WorkDir: package cache      = "{}".'
+              .format(self.package_cache_directory))
@@ -7,6 +7,7 @@
 
 import pytest  # type: ignore
 import types
+import typing
 
 import os
 import sys
@@ -81,7 +82,7 @@ class DummyCommand(Command):
     pass
 
 
-_Parser_Instance = None
+_Parser_Instances: typing.Dict[str, Parser] = {}
 
 
 @pytest.fixture
@@ -101,9 +102,9 @@ def _parse_and_verify_string(parser, data, expected_base_system, expected):
     assert result == expected
 
 
-def _create_and_setup_parser(command_manager: CommandManager):
+def _create_and_setup_parser(command_manager: CommandManager, backend: str):
     """Set up method."""
-    result = Parser(command_manager, debug_parser=True)
+    result = Parser(command_manager, debug_parser=True, backend=backend)
 
     # inject for easier testing:
     result.parse_and_verify_string \
@@ -112,13 +113,14 @@ def _create_and_setup_parser(command_manager: CommandManager):
     return result
 
 
-@pytest.fixture()
-def parser(command_manager):
+@pytest.fixture(params=['tokenizer', 'pyparsing'])
+def parser(request, command_manager):
     """Return a parser."""
-    global _Parser_Instance
-    if _Parser_Instance is None:
-        _Parser_Instance = _create_and_setup_parser(command_manager)
-    return _Parser_Instance
+    backend = request.param
+    if backend not in _Parser_Instances:
+        _Parser_Instances[backend] \
+            = _create_and_setup_parser(command_manager, backend)
+    return _Parser_Instances[backend]
 
 
 @pytest.fixture()
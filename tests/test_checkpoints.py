@@ -0,0 +1,54 @@
+#!/usr/bin/python
+"""Test for checkpoints of partially generated systems.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.checkpoints import Checkpoints
+
+
+def _make_checkpoint(directory, system_name, prefix_hash, complete=True):
+    checkpoint = os.path.join(directory, system_name, prefix_hash)
+    os.makedirs(checkpoint)
+    if complete:
+        with open(os.path.join(checkpoint, 'state.bin'), 'wb') as f:
+            f.write(b'state')
+
+
+@pytest.mark.parametrize(('mode', 'command', 'expected'), [
+    pytest.param('none', 'pacstrap', False, id='none'),
+    pytest.param('expensive', 'pacstrap', True, id='expensive pacstrap'),
+    pytest.param('expensive', 'pkg_xorg', True, id='expensive pkg_'),
+    pytest.param('expensive', 'set', False, id='expensive set'),
+    pytest.param('all', 'set', True, id='all'),
+])
+def test_should_create(tmpdir, mode, command, expected):
+    checkpoints = Checkpoints(None, str(tmpdir), mode=mode)
+    assert checkpoints.should_create(command) == expected
+
+
+def test_find_longest_prefix(tmpdir):
+    _make_checkpoint(str(tmpdir), 'system', 'a')
+    _make_checkpoint(str(tmpdir), 'system', 'c')
+    checkpoints = Checkpoints(None, str(tmpdir))
+
+    assert checkpoints.find('system', ['a', 'b', 'c', 'd']) == 2
+    assert checkpoints.find('system', ['a', 'b']) == 0
+    assert checkpoints.find('system', ['x', 'y']) == -1
+    assert checkpoints.find('other', ['a', 'c']) == -1
+
+
+def test_find_ignores_partial_checkpoints(tmpdir):
+    _make_checkpoint(str(tmpdir), 'system', 'a')
+    _make_checkpoint(str(tmpdir), 'system', 'b', complete=False)
+    checkpoints = Checkpoints(None, str(tmpdir))
+
+    assert checkpoints.find('system', ['a', 'b']) == 0
@@ -0,0 +1,110 @@
+#!/usr/bin/python
+"""Test for the root filesystem options of the export command.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import cleanroom.commands.export as export
+from cleanroom.exceptions import ParseError
+
+
+@pytest.mark.parametrize(('test_input', 'expected'), [
+    pytest.param({'processors': 4, 'compression_level': 15,
+                  'block_size': '128K', 'sort_file': ''},
+                 ['-comp', 'zstd', '-processors', '4',
+                  '-Xcompression-level', '15', '-b', '128K'],
+                 id='basic'),
+    pytest.param({'processors': 1, 'compression_level': 19,
+                  'block_size': '1M', 'sort_file': '/defs/sort.txt'},
+                 ['-comp', 'zstd', '-processors', '1',
+                  '-Xcompression-level', '19', '-b', '1M',
+                  '-sort', '/defs/sort.txt'],
+                 id='sort file'),
+])
+def test_squashfs_options(test_input, expected):
+    assert export._squashfs_options(**test_input) == expected
+
+
+def test_squashfs_defaults(location):
+    cmd = export.ExportCommand()
+    cmd.validate(location, 'repo')
+    cmd._setup('repo')
+    assert cmd._squashfs_compression_level \
+        == export._SQUASHFS_COMPRESSION_LEVEL
+    assert cmd._squashfs_block_size == export._SQUASHFS_BLOCK_SIZE
+    assert '[squashfs_compression_level={}]'.format(
+        export._SQUASHFS_COMPRESSION_LEVEL) in cmd.syntax_string
+    assert '[squashfs_block_size={}]'.format(
+        export._SQUASHFS_BLOCK_SIZE) in cmd.syntax_string
+
+
+def test_benchmark_squashfs(tmpdir, system_context):
+    cmd = export.ExportCommand()
+    cmd._setup('repo')
+    runs = []
+
+    def run_mksquashfs(system_context, squash_file, *, compression_level,
+                       block_size):
+        runs.append((compression_level, block_size))
+        with open(squash_file, 'wb') as f:
+            f.write(b'x' * 1024)
+
+    cmd._run_mksquashfs = run_mksquashfs
+    cmd._benchmark_squashfs(system_context, str(tmpdir))
+
+    assert runs == list(export._SQUASHFS_BENCHMARK_SETTINGS)
+    assert not os.path.exists(str(tmpdir.join('squashfs_benchmark')))
+
+
+@pytest.mark.parametrize(('test_input', 'expected'), [
+    pytest.param({'workers': 4, 'compression': 'lz4hc',
+                  'compression_level': 0},
+                 ['-z', 'lz4hc', '--workers=4'], id='default level'),
+    pytest.param({'workers': 1, 'compression': 'lz4hc',
+                  'compression_level': 12},
+                 ['-z', 'lz4hc,12', '--workers=1'], id='lz4hc level'),
+    pytest.param({'workers': 2, 'compression': 'zstd',
+                  'compression_level': 19},
+                 ['-z', 'zstd,19', '--workers=2'], id='zstd level'),
+    pytest.param({'workers': 2, 'compression': 'lz4',
+                  'compression_level': 0},
+                 ['-z', 'lz4', '--workers=2'], id='lz4'),
+])
+def test_erofs_options(test_input, expected):
+    assert export._erofs_options(**test_input) == expected
+
+
+@pytest.mark.parametrize(('kwargs', 'valid'), [
+    pytest.param({'erofs_compression': 'lz4hc',
+                  'erofs_compression_level': 9}, True, id='lz4hc'),
+    pytest.param({'erofs_compression': 'zstd',
+                  'erofs_compression_level': 3}, True, id='zstd'),
+    pytest.param({'erofs_compression': 'lz4'}, True, id='lz4'),
+    pytest.param({'erofs_compression': 'lz4',
+                  'erofs_compression_level': 9}, False, id='lz4 level'),
+    pytest.param({'erofs_compression_level': -1}, False, id='negative'),
+])
+def test_erofs_validation(location, kwargs, valid):
+    cmd = export.ExportCommand()
+    if valid:
+        cmd.validate(location, 'repo', **kwargs)
+    else:
+        with pytest.raises(ParseError):
+            cmd.validate(location, 'repo', **kwargs)
+
+
+def test_erofs_exclude_options(tmpdir):
+    for directory in ('usr', 'etc', 'var', 'boot'):
+        tmpdir.mkdir(directory)
+    tmpdir.join('file').write('')
+    assert export._erofs_exclude_options(str(tmpdir)) \
+        == ['--exclude-path=boot', '--exclude-path=etc',
+            '--exclude-path=file', '--exclude-path=var']
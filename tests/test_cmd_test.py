@@ -0,0 +1,36 @@
+#!/usr/bin/python
+"""Test for the settings of the _test command.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import cleanroom.commands._test as _test
+from cleanroom.exceptions import GenerateError
+
+
+@pytest.mark.parametrize(('kwargs', 'substitution', 'expected'), [
+    pytest.param({}, None, 7, id='default'),
+    pytest.param({}, '3', 3, id='substitution'),
+    pytest.param({'jobs': 2}, '3', 2, id='kwargs'),
+    pytest.param({}, 'abc', None, id='no number'),
+    pytest.param({'jobs': 0}, None, None, id='too small'),
+])
+def test_int_setting(location, system_context, kwargs, substitution,
+                     expected):
+    if substitution is not None:
+        system_context.set_substitution('TEST_JOBS', substitution)
+    if expected is None:
+        with pytest.raises(GenerateError):
+            _test._int_setting(location, system_context, kwargs, 'jobs',
+                               'TEST_JOBS', 7, minimum=1)
+    else:
+        assert _test._int_setting(location, system_context, kwargs, 'jobs',
+                                  'TEST_JOBS', 7, minimum=1) == expected
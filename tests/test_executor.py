@@ -0,0 +1,97 @@
+#!/usr/bin/python
+"""Test for batching of pacman commands in the executor.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.execobject import ExecObject
+from cleanroom.executor import Executor, _batch_end
+from cleanroom.location import Location
+
+
+def _exec_obj(line, command, *args, **kwargs):
+    return ExecObject(location=Location(file_name='test.def',
+                                        line_number=line),
+                      command=command, args=args, kwargs=kwargs)
+
+
+class _CommandManager:
+    def __init__(self, failing_package=''):
+        self.calls = []
+        self._failing_package = failing_package
+
+    def command(self, name):
+        manager = self
+
+        class _Command:
+            @staticmethod
+            def execute_func(location, system_context, *args, **kwargs):
+                manager._execute(name, location, *args, **kwargs)
+
+        return _Command()
+
+    def _execute(self, name, location, *args, **kwargs):
+        self.calls.append((name, location.line_number, args))
+        if self._failing_package in args:
+            raise RuntimeError('{}: {} failed'.format(location, name))
+
+
+class _SystemContext:
+    systems_definition_directory = os.getcwd()
+
+
+@pytest.mark.parametrize(('commands', 'expected'), [
+    pytest.param([('pacman', {}), ('pacman', {}), ('set', {})], 2,
+                 id='pacman run'),
+    pytest.param([('pacman', {}), ('set', {}), ('pacman', {})], 1,
+                 id='interrupted'),
+    pytest.param([('set', {}), ('pacman', {})], 1, id='no pacman'),
+    pytest.param([('pacman', {}), ('pacman', {'remove': True})], 1,
+                 id='remove'),
+    pytest.param([('pacman', {}), ('pacman', {'overwrite': '/a/*'})], 1,
+                 id='different flags'),
+    pytest.param([('pacman', {'overwrite': '/a/*'}),
+                  ('pacman', {'overwrite': '/a/*'}),
+                  ('pacman', {'overwrite': '/a/*'})], 3, id='same flags'),
+])
+def test_batch_end(commands, expected):
+    exec_objs = [_exec_obj(i + 1, c, 'pkg', **k)
+                 for (i, (c, k)) in enumerate(commands)]
+    assert _batch_end(exec_objs, 0) == expected
+
+
+def _executor(command_manager, batch_pacman=True):
+    return Executor(scratch_directory='/tmp/scratch',
+                    systems_definition_directory=os.getcwd(),
+                    command_manager=command_manager,
+                    repository_base_directory='', timestamp='now',
+                    batch_pacman=batch_pacman)
+
+
+def test_pacman_batch():
+    command_manager = _CommandManager()
+    _executor(command_manager)._execute_pacman_batch(
+        _SystemContext(), [_exec_obj(1, 'pacman', 'a', 'b'),
+                           _exec_obj(2, 'pacman', 'b', 'c')])
+    assert command_manager.calls == [('pacman', 1, ('a', 'b', 'c'))]
+
+
+def test_pacman_batch_failure():
+    command_manager = _CommandManager(failing_package='c')
+    with pytest.raises(RuntimeError) as e:
+        _executor(command_manager)._execute_pacman_batch(
+            _SystemContext(), [_exec_obj(1, 'pacman', 'a'),
+                               _exec_obj(2, 'pacman', 'b', 'c'),
+                               _exec_obj(3, 'pacman', 'd')])
+    assert str(e.value) == 'test.def:2: pacman failed'
+    assert command_manager.calls == [('pacman', 1, ('a', 'b', 'c', 'd')),
+                                     ('pacman', 1, ('a',)),
+                                     ('pacman', 2, ('b', 'c'))]
@@ -0,0 +1,155 @@
+#!/usr/bin/python
+"""Test for the parallel generation of systems.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.generator import Generator
+
+
+class _SystemsManager:
+    def __init__(self, systems):
+        self._systems = systems
+
+    def walk_systems_forest(self):
+        for (system_name, base_system_name) in self._systems:
+            yield system_name, base_system_name, [], 0
+
+
+class _WorkDir:
+    def __init__(self, directory):
+        self._directory = directory
+        self.storage_directory = os.path.join(directory, 'storage')
+        self.package_cache_directory = os.path.join(directory, 'cache')
+        os.makedirs(self.storage_directory)
+
+    def job_scratch_directory(self, job):
+        return os.path.join(self._directory, 'scratch_{}'.format(job))
+
+    def clear_scratch_directory(self, job=0):
+        os.makedirs(self.job_scratch_directory(job), exist_ok=True)
+
+    def remove_job_scratch_directory(self, job):
+        os.rmdir(self.job_scratch_directory(job))
+
+    def storage_input_hash(self, system_name):
+        with open(os.path.join(self.storage_directory, system_name,
+                               'input_hash'), 'r') as f:
+            return f.read()
+
+    def set_storage_input_hash(self, system_name, input_hash):
+        with open(os.path.join(self.storage_directory, system_name,
+                               'input_hash'), 'w') as f:
+            f.write(input_hash)
+
+    def clear_storage_entry(self, system_name):
+        os.remove(os.path.join(self.storage_directory, system_name,
+                               'input_hash'))
+        os.rmdir(os.path.join(self.storage_directory, system_name))
+
+
+class _Executor:
+    """Log start and end of every system into a file shared by all jobs."""
+
+    def __init__(self, log_file, failing):
+        self._log_file = log_file
+        self._failing = failing
+
+    def _log(self, *args):
+        with open(self._log_file, 'a') as f:
+            f.write(' '.join(args) + '\n')
+
+    def run(self, system_name, base_system_name, exec_obj_list, *,
+            storage_directory, prefix_hashes):
+        self._log('start', system_name)
+        time.sleep(0.2)
+        if system_name in self._failing:
+            raise GenerateError('{} failed.'.format(system_name))
+        os.makedirs(os.path.join(storage_directory, system_name))
+        self._log('end', system_name)
+
+
+def _generate(tmpdir, monkeypatch, systems, *, failing=(), stored=None,
+              ignore_errors=True, jobs=2):
+    log_file = str(tmpdir.join('log'))
+    open(log_file, 'w').close()
+    monkeypatch.setattr(Generator, '_executor',
+                        lambda self, **kwargs: _Executor(log_file, failing))
+
+    work_directory = _WorkDir(str(tmpdir.mkdir('work')))
+    for (system_name, input_hash) in (stored or {}).items():
+        os.makedirs(os.path.join(work_directory.storage_directory,
+                                 system_name))
+        work_directory.set_storage_input_hash(system_name, input_hash)
+    result = Generator(_SystemsManager(systems))._generate_in_parallel(
+        work_directory=work_directory, command_manager=None,
+        repository_base_directory='', timestamp='20190101.0101',
+        input_hashes={s: ['hash_' + s] for (s, _) in systems},
+        checkpoints=None, profiler=None, batch_pacman=False,
+        package_proxy_url='', ignore_errors=ignore_errors, jobs=jobs)
+
+    with open(log_file, 'r') as f:
+        log = [tuple(line.split()) for line in f]
+    scratch = sorted(d for d in os.listdir(str(tmpdir.join('work')))
+                     if d.startswith('scratch_'))
+    return result, log, scratch
+
+
+_SYSTEMS = [('base', None), ('one', 'base'), ('two', 'base'),
+            ('three', 'one'), ('other', None)]
+
+
+def test_generate_in_parallel(tmpdir, monkeypatch):
+    (result, log, scratch) = _generate(tmpdir, monkeypatch, _SYSTEMS)
+    assert result == (0, 5)
+    assert sorted(s for (event, s) in log if event == 'end') \
+        == sorted(s for (s, _) in _SYSTEMS)
+    for (system_name, base_system_name) in _SYSTEMS:
+        if base_system_name:
+            assert log.index(('end', base_system_name)) \
+                < log.index(('start', system_name))
+    # Independent systems ran side by side:
+    assert log.index(('start', 'other')) < log.index(('end', 'base'))
+    # Only the scratch directory of job 0 is kept:
+    assert scratch == ['scratch_0']
+
+
+def test_generate_in_parallel_up_to_date(tmpdir, monkeypatch):
+    (result, log, _) = _generate(tmpdir, monkeypatch,
+                                 [('base', None), ('one', 'base'),
+                                  ('other', None)],
+                                 stored={'base': 'hash_base',
+                                         'other': 'outdated'})
+    assert result == (0, 3)
+    assert ('start', 'base') not in log
+    assert ('end', 'one') in log
+    assert ('end', 'other') in log
+
+
+def test_generate_in_parallel_ignore_errors(tmpdir, monkeypatch):
+    (result, log, scratch) = _generate(tmpdir, monkeypatch, _SYSTEMS,
+                                       failing=('one',))
+    assert result == (2, 5)
+    assert ('start', 'three') not in log
+    assert ('end', 'two') in log
+    assert ('end', 'other') in log
+    assert scratch == ['scratch_0']
+
+
+def test_generate_in_parallel_stops_on_error(tmpdir, monkeypatch):
+    with pytest.raises(GenerateError):
+        _generate(tmpdir, monkeypatch, _SYSTEMS, failing=('base',),
+                  ignore_errors=False, jobs=1)
+    assert [s for (event, s) in
+            [tuple(line.split()) for line in tmpdir.join('log').readlines()]
+            if event == 'start'] == ['base']
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+"""Test for the btrfs helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import struct
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.btrfs import (BtrfsHelper, _subvolumes_below, _vol_args,
+                                    _VOL_ARGS_NAME_OFFSET,
+                                    _VOL_ARGS_V2_NAME_OFFSET,
+                                    _BTRFS_SUBVOL_RDONLY)
+
+
+def test_vol_args():
+    args = _vol_args('subvolume', name_offset=_VOL_ARGS_NAME_OFFSET, fd=42)
+    assert len(args) == 4096
+    assert struct.unpack_from('=q', args, 0) == (42,)
+    assert args[8:18] == b'subvolume\0'
+
+
+def test_vol_args_v2():
+    args = _vol_args('snapshot', name_offset=_VOL_ARGS_V2_NAME_OFFSET, fd=7,
+                     flags=_BTRFS_SUBVOL_RDONLY)
+    assert len(args) == 4096
+    assert struct.unpack_from('=qQQ', args, 0) == (7, 0, _BTRFS_SUBVOL_RDONLY)
+    assert args[56:65] == b'snapshot\0'
+
+
+def test_not_btrfs(tmpdir):
+    btrfs = BtrfsHelper('/bin/false')
+    if btrfs.is_btrfs_filesystem(str(tmpdir)):
+        pytest.skip('Temporary directory is on btrfs.')
+
+    os.makedirs(os.path.join(str(tmpdir), 'directory'))
+
+    assert not btrfs.is_subvolume(str(tmpdir))
+    assert not btrfs.is_subvolume(os.path.join(str(tmpdir), 'directory'))
+    assert not btrfs.is_subvolume(os.path.join(str(tmpdir), 'missing'))
+
+
+def test_no_subvolumes_below(tmpdir):
+    btrfs = BtrfsHelper('/bin/false')
+    if btrfs.is_btrfs_filesystem(str(tmpdir)):
+        pytest.skip('Temporary directory is on btrfs.')
+
+    os.makedirs(os.path.join(str(tmpdir), 'a/b/c'))
+    os.symlink('..', os.path.join(str(tmpdir), 'a/b/loop'))
+
+    assert _subvolumes_below(str(tmpdir)) == []
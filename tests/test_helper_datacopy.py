@@ -0,0 +1,179 @@
+#!/usr/bin/python
+"""Test for the datacopy helper in cleanroom.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import shutil
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.datacopy import (concatenate, copy_file, copy_to_device,
+                                       copy_tree)
+
+
+_MIB = 1024 * 1024
+
+
+def _write_source(file_name: str) -> bytes:
+    """Data, a hole, data, zeros, data and a hole at the end."""
+    with open(file_name, 'wb') as f:
+        f.write(b'a' * _MIB)
+        f.seek(3 * _MIB)
+        f.write(b'b' * 1000)
+        f.write(bytes(2 * _MIB))
+        f.write(b'c' * 3000)
+        f.truncate(10 * _MIB)
+    with open(file_name, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize(('skip_zeros', 'direct'), [
+    pytest.param(True, False, id='skip zeros'),
+    pytest.param(True, True, id='skip zeros, direct'),
+    pytest.param(False, False, id='in kernel'),
+])
+def test_copy_to_device(tmpdir, skip_zeros, direct):
+    source = str(tmpdir.join('source'))
+    data = _write_source(source)
+
+    target = str(tmpdir.join('target'))
+    with open(target, 'wb') as f:
+        f.write(b'x' * 12 * _MIB)  # Garbage that needs to get overwritten
+
+    copy_to_device(source, target, offset=_MIB, skip_zeros=skip_zeros,
+                   direct=direct, chunk_size=_MIB)
+
+    with open(target, 'rb') as f:
+        assert f.read() == b'x' * _MIB + data + b'x' * _MIB
+
+
+def test_copy_keeps_target_sparse(tmpdir):
+    source = str(tmpdir.join('source'))
+    data = _write_source(source)
+    target = str(tmpdir.join('target'))
+
+    copy_to_device(source, target, chunk_size=_MIB)
+
+    with open(target, 'rb') as f:
+        assert f.read() == data
+    # 1MiB + 2 partially written MiB of data, everything else is a hole:
+    assert os.stat(target).st_blocks * 512 <= 3 * _MIB
+
+
+@pytest.mark.parametrize('metadata', [False, True])
+def test_copy_file(tmpdir, metadata):
+    source = str(tmpdir.join('source'))
+    data = _write_source(source)
+    os.chmod(source, 0o750)
+    os.utime(source, ns=(1000000000, 2000000000))
+    target = str(tmpdir.join('target'))
+    with open(target, 'wb') as f:
+        f.write(b'x' * 12 * _MIB)
+
+    copy_file(source, target, metadata=metadata)
+
+    with open(target, 'rb') as f:
+        assert f.read() == data
+    assert os.stat(target).st_blocks <= os.stat(source).st_blocks
+    if metadata:
+        assert os.stat(target).st_mode & 0o777 == 0o750
+        assert os.stat(target).st_mtime_ns == 2000000000
+    else:
+        assert os.stat(target).st_mtime_ns != 2000000000
+
+
+def test_copy_file_symlink(tmpdir):
+    tmpdir.join('file').write('contents')
+    os.symlink('file', str(tmpdir.join('link')))
+
+    copy_file(str(tmpdir.join('link')), str(tmpdir.join('copy')))
+    assert not tmpdir.join('copy').islink()
+    assert tmpdir.join('copy').read() == 'contents'
+
+    copy_file(str(tmpdir.join('link')), str(tmpdir.join('link_copy')),
+              follow_symlinks=False)
+    assert os.readlink(str(tmpdir.join('link_copy'))) == 'file'
+
+
+def test_copy_file_special(tmpdir):
+    os.mkfifo(str(tmpdir.join('fifo')))
+    with pytest.raises(OSError):
+        copy_file(str(tmpdir.join('fifo')), str(tmpdir.join('copy')))
+
+
+def test_copy_file_same_file(tmpdir):
+    tmpdir.join('file').write('12345')
+    os.link(str(tmpdir.join('file')), str(tmpdir.join('hardlink')))
+    for target in ('file', 'hardlink'):
+        with pytest.raises(shutil.SameFileError):
+            copy_file(str(tmpdir.join('file')), str(tmpdir.join(target)))
+    assert tmpdir.join('file').read() == '12345'
+
+
+def _tree(directory):
+    result = {}
+    for (base, dirs, files) in os.walk(directory):
+        for name in dirs + files:
+            path = os.path.join(base, name)
+            key = os.path.relpath(path, directory)
+            if os.path.islink(path):
+                result[key] = ('link', os.readlink(path))
+            elif os.path.isdir(path):
+                result[key] = ('dir', os.stat(path).st_mode & 0o777,
+                               os.stat(path).st_mtime_ns)
+            else:
+                with open(path, 'rb') as f:
+                    result[key] = ('file', os.stat(path).st_mode & 0o777,
+                                   os.stat(path).st_mtime_ns, f.read())
+    return result
+
+
+@pytest.mark.parametrize('symlinks', [False, True])
+def test_copy_tree(tmpdir, symlinks):
+    source = tmpdir.mkdir('source')
+    for i in range(20):
+        source.ensure('dir{}/sub/file{}'.format(i % 3, i)).write(str(i))
+    source.join('dir0/mode').write('x')
+    os.chmod(str(source.join('dir0/mode')), 0o600)
+    os.chmod(str(source.join('dir1')), 0o700)
+    os.symlink('dir0/mode', str(source.join('link')))
+    for path in (source.join('dir0/sub'), source.join('dir1')):
+        os.utime(str(path), ns=(1000000000, 2000000000))
+
+    target = tmpdir.mkdir('target')
+    target.ensure('dir0/mode').write('overwritten')
+    target.ensure('extra').write('kept')
+
+    copy_tree(str(source), str(target), symlinks=symlinks, jobs=4)
+
+    expected = _tree(str(source))
+    if not symlinks:
+        expected['link'] = expected['dir0/mode']
+    result = _tree(str(target))
+    assert result.pop('extra')[3] == b'kept'
+    assert result == expected
+
+
+def test_concatenate(tmpdir):
+    parts = []
+    for i in range(3):
+        tmpdir.join('part{}'.format(i)).write_binary(bytes([65 + i]) * 5000)
+        parts.append(str(tmpdir.join('part{}'.format(i))))
+    tmpdir.join('empty').write_binary(b'')
+    target = str(tmpdir.join('target'))
+    tmpdir.join('target').write_binary(b'header')
+
+    fd = os.open(target, os.O_WRONLY)
+    try:
+        assert concatenate(fd, 6, parts[0], str(tmpdir.join('empty')),
+                           *parts[1:]) == 15006
+    finally:
+        os.close(fd)
+    assert tmpdir.join('target').read_binary() \
+        == b'header' + b'A' * 5000 + b'B' * 5000 + b'C' * 5000
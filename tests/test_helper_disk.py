@@ -8,7 +8,10 @@
 import pytest  # type: ignore
 
 import os
+import stat
 import sys
+import threading
+import time
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
                                                 '..')))
 
@@ -90,3 +93,53 @@ def test_partitioner(tmpdir) -> None:
 
         assert partitioner.is_partitioned()
         assert partitioner.label() == 'gpt'
+
+
+def test_wait_for_block_device_timeout(tmpdir) -> None:
+    device = str(tmpdir.join('not_a_device'))
+    with open(device, 'w') as f:
+        f.write('Test')
+
+    start = time.monotonic()
+    assert not disk.wait_for_block_device(device, timeout=0.3)
+    assert time.monotonic() - start >= 0.3
+
+
+@pytest.mark.skipif(os.geteuid() != 0, reason='Needs root for mknod')
+def test_wait_for_block_device(tmpdir) -> None:
+    device = str(tmpdir.join('loop'))
+    timer = threading.Timer(0.2, lambda: os.mknod(device, 0o600
+                                                  | stat.S_IFBLK,
+                                                  os.makedev(7, 0)))
+    timer.start()
+
+    start = time.monotonic()
+    assert disk.wait_for_block_device(device, timeout=5)
+    assert time.monotonic() - start < 2
+    timer.join()
+
+
+def _fake_nbd(sys_block, index: int, *, size: str = '0',
+              pid: str = '') -> None:
+    directory = sys_block.mkdir('nbd{}'.format(index))
+    directory.join('size').write(size + '\n')
+    if pid:
+        directory.join('pid').write(pid + '\n')
+
+
+def test_free_nbd_devices(tmpdir) -> None:
+    sys_block = tmpdir.mkdir('block')
+    sys_block.mkdir('sda')
+    _fake_nbd(sys_block, 0, size='1048576', pid='1234')
+    _fake_nbd(sys_block, 1)
+    _fake_nbd(sys_block, 2, size='1048576')
+    _fake_nbd(sys_block, 10)
+    _fake_nbd(sys_block, 3, pid='42')
+
+    assert list(disk.free_nbd_devices(sys_block=str(sys_block))) \
+        == ['/dev/nbd1', '/dev/nbd10']
+
+
+def test_free_nbd_devices_no_module(tmpdir) -> None:
+    assert list(disk.free_nbd_devices(
+        sys_block=str(tmpdir.join('missing')))) == []
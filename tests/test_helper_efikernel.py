@@ -0,0 +1,131 @@
+#!/usr/bin/python
+"""Test for assembling unified EFI kernels.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import shutil
+import struct
+import subprocess
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.efikernel import create_unified_kernel
+
+
+_OPTIONAL_HEADER = struct.Struct('<HBBIIIIIQIIHHHHHHIIIIHHQQQQII')
+_SECTION_HEADER = struct.Struct('<8sIIIIIIHHI')
+
+
+def _write_stub(file_name, *, header_size=0x400):
+    """Write a minimal PE32+ EFI application with one .text section."""
+    optional = _OPTIONAL_HEADER.pack(
+        0x20b, 0, 0, 0x200, 0, 0, 0x1000, 0x1000, 0, 0x1000, 0x200,
+        0, 0, 0, 0, 0, 0, 0, 0x2000, header_size, 0x1234, 10, 0,
+        0, 0, 0, 0, 0, 16) + struct.pack('<32I', *([0] * 8 + [0x3000, 8]
+                                                     + [0] * 22))
+    headers = b'MZ' + bytes(0x3a) + struct.pack('<I', 0x40) \
+        + b'PE\0\0' + struct.pack('<HHIIIHH', 0x8664, 1, 0, 0, 0,
+                                  len(optional), 0x22) \
+        + optional \
+        + _SECTION_HEADER.pack(b'.text', 0x10, 0x1000, 0x200, header_size,
+                               0, 0, 0, 0, 0x60000020)
+    with open(file_name, 'wb') as f:
+        f.write(headers.ljust(header_size, b'\0'))
+        f.write(b'\xc3' * 0x10 + bytes(0x1f0))
+
+
+def _sections(file_name):
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    pe = struct.unpack_from('<I', data, 0x3c)[0]
+    (_, count, _, _, _, optional_size, _) \
+        = struct.unpack_from('<HHIIIHH', data, pe + 4)
+    optional = _OPTIONAL_HEADER.unpack_from(data, pe + 24)
+    table = pe + 24 + optional_size
+    result = {}
+    for i in range(count):
+        (name, size, address, raw_size, raw_offset, *_) \
+            = _SECTION_HEADER.unpack_from(data, table + i * 40)
+        result[name.rstrip(b'\0').decode('ascii')] \
+            = (address, size, raw_offset, raw_size,
+               data[raw_offset:raw_offset + size])
+    security = struct.unpack_from('<II', data, pe + 24 + 112 + 4 * 8)
+    return result, optional, security, len(data)
+
+
+def test_create_unified_kernel(tmpdir):
+    stub = str(tmpdir.join('stub.efi'))
+    _write_stub(stub)
+    tmpdir.join('os-release').write('ID=test\n')
+    tmpdir.join('vmlinuz').write_binary(b'kernel' * 1000)
+    tmpdir.join('initrd1').write_binary(b'first' * 777)
+    tmpdir.join('initrd2').write_binary(b'second' * 3333)
+    output = str(tmpdir.join('linux.efi'))
+
+    assert create_unified_kernel(
+        output, stub,
+        [('.osrel', [str(tmpdir.join('os-release'))]),
+         ('.cmdline', b'root=/dev/sda1\0\0'),
+         ('.linux', [str(tmpdir.join('vmlinuz'))]),
+         ('.initrd', [str(tmpdir.join('initrd1')),
+                      str(tmpdir.join('initrd2'))])])
+
+    (sections, optional, security, size) = _sections(output)
+    assert list(sections) == ['.text', '.osrel', '.cmdline', '.linux',
+                              '.initrd']
+    assert sections['.text'][4] == b'\xc3' * 0x10
+    assert sections['.osrel'][4] == b'ID=test\n'
+    assert sections['.cmdline'][4] == b'root=/dev/sda1\0\0'
+    assert sections['.linux'][4] == b'kernel' * 1000
+    assert sections['.initrd'][4] == b'first' * 777 + b'second' * 3333
+
+    end = 0x2000
+    for name in ('.osrel', '.cmdline', '.linux', '.initrd'):
+        (address, section_size, raw_offset, raw_size, _) = sections[name]
+        assert address >= end and address % 0x1000 == 0
+        assert raw_offset % 0x200 == 0 and raw_size % 0x200 == 0
+        assert raw_size >= section_size
+        end = address + section_size
+    assert size == sections['.initrd'][2] + sections['.initrd'][3]
+    assert optional[18] == (end + 0xfff) // 0x1000 * 0x1000  # SizeOfImage
+    assert optional[20] == 0  # CheckSum
+    assert security == (0, 0)
+
+
+@pytest.mark.skipif(not shutil.which('objdump'), reason='Needs objdump')
+def test_create_unified_kernel_objdump(tmpdir):
+    stub = str(tmpdir.join('stub.efi'))
+    _write_stub(stub)
+    output = str(tmpdir.join('linux.efi'))
+    assert create_unified_kernel(output, stub,
+                                 [('.cmdline', b'quiet\0\0'),
+                                  ('.linux', [stub])])
+
+    headers = subprocess.run(['objdump', '-h', output], check=True,
+                             stdout=subprocess.PIPE).stdout.decode('utf-8')
+    assert '.cmdline' in headers
+    assert '.linux' in headers
+
+
+@pytest.mark.parametrize('contents', [
+    pytest.param(None, id='no room for headers'),
+    pytest.param(b'not a PE image', id='no PE image'),
+])
+def test_create_unified_kernel_unsupported(tmpdir, contents):
+    stub = str(tmpdir.join('stub.efi'))
+    if contents is None:
+        _write_stub(stub, header_size=0x200)
+    else:
+        tmpdir.join('stub.efi').write_binary(contents)
+    output = str(tmpdir.join('linux.efi'))
+
+    assert not create_unified_kernel(output, stub,
+                                     [('.osrel', b'1'), ('.cmdline', b'2'),
+                                      ('.linux', b'3'), ('.initrd', b'4')])
+    assert not os.path.exists(output)
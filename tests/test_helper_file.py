@@ -167,3 +167,19 @@ def test_dir_to_dir_move(populated_system_context: SystemContext) -> None:
     filehelper.move(populated_system_context, '/usr/bin', '/home')
     assert not os.path.isfile(os.path.join(fs, 'usr/bin/ls'))
     assert _read_file(os.path.join(fs, 'home/bin/ls')) == '/usr/bin/ls'
+
+
+def test_remove(populated_system_context: SystemContext) -> None:
+    fs = populated_system_context.fs_directory
+    filehelper.remove(populated_system_context, '/usr/*/l*', '/home',
+                      recursive=True, jobs=2)
+    assert not os.path.exists(os.path.join(fs, 'usr/bin/ls'))
+    assert not os.path.exists(os.path.join(fs, 'usr/lib/libz'))
+    assert os.path.isdir(os.path.join(fs, 'usr/lib'))
+    assert not os.path.exists(os.path.join(fs, 'home'))
+    assert os.path.isfile(os.path.join(fs, 'usr/bin/grep'))
+
+
+def test_remove_outside_root(populated_system_context: SystemContext) -> None:
+    with pytest.raises(cleanroom.exceptions.GenerateError):
+        filehelper.remove(populated_system_context, '/../*', recursive=True)
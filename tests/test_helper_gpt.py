@@ -0,0 +1,83 @@
+#!/usr/bin/python
+"""Test for the GPT helper in cleanroom.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import os
+import struct
+import sys
+import uuid
+import zlib
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.gpt import GptPartition, write_gpt
+
+
+_MIB = 1024 * 1024
+_DISK_UUID = uuid.UUID('01234567-89ab-cdef-0123-456789abcdef')
+_PARTITIONS = [
+    GptPartition(start=2 * _MIB, size=_MIB,
+                 partition_type='c12a7328-f81f-11d2-ba4b-00a0c93ec93b',
+                 uuid='', name='EFI System Partition'),
+    GptPartition(start=3 * _MIB, size=4 * _MIB,
+                 partition_type='4f68bce3-e8cd-4db1-96e7-fbcaf984b709',
+                 uuid='11111111-2222-3333-4444-555555555555',
+                 name='root'),
+]
+
+
+def _read_header(data: bytes, lba: int):
+    header = data[lba * 512:lba * 512 + 92]
+    fields = struct.unpack('<8sIIIIQQQQ16sQIII', header)
+    unchecked = header[:16] + b'\0\0\0\0' + header[20:]
+    assert zlib.crc32(unchecked) == fields[3]
+    return fields
+
+
+def _check_partition_table(data: bytes, header) -> None:
+    entries_lba = header[10]
+    entries = data[entries_lba * 512:entries_lba * 512 + 128 * 128]
+    assert zlib.crc32(entries) == header[13]
+    for (index, p) in enumerate(_PARTITIONS):
+        (type_uuid, partition_uuid, first, last, _, name) \
+            = struct.unpack_from('<16s16sQQQ72s', entries, index * 128)
+        assert uuid.UUID(bytes_le=type_uuid) == uuid.UUID(p.partition_type)
+        if p.uuid:
+            assert uuid.UUID(bytes_le=partition_uuid) == uuid.UUID(p.uuid)
+        assert first * 512 == p.start
+        assert (last + 1) * 512 == p.start + p.size
+        assert name.decode('utf-16-le').rstrip('\0') == p.name
+    assert entries[len(_PARTITIONS) * 128:] \
+        == bytes(128 * (128 - len(_PARTITIONS)))
+
+
+def test_write_gpt(tmpdir):
+    image = str(tmpdir.join('image'))
+    with open(image, 'wb') as f:
+        f.truncate(10 * _MIB)
+
+    write_gpt(image, _PARTITIONS, disk_uuid=_DISK_UUID)
+
+    with open(image, 'rb') as f:
+        data = f.read()
+    last_lba = len(data) // 512 - 1
+
+    assert data[510:512] == b'\x55\xaa'
+    assert data[450] == 0xee
+
+    primary = _read_header(data, 1)
+    backup = _read_header(data, last_lba)
+    assert primary[0] == b'EFI PART'
+    assert (primary[5], primary[6]) == (1, last_lba)
+    assert (backup[5], backup[6]) == (last_lba, 1)
+    assert uuid.UUID(bytes_le=primary[9]) == _DISK_UUID
+    assert primary[7:10] == backup[7:10]
+
+    _check_partition_table(data, primary)
+    _check_partition_table(data, backup)
+
+    # Partition contents are untouched:
+    assert data[2 * _MIB:7 * _MIB] == bytes(5 * _MIB)
@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""Test for the mount helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+import cleanroom.helper.mount as mount
+
+
+_MOUNTINFO = '''\
+22 1 0:21 / / rw,relatime shared:1 - btrfs /dev/sda2 rw
+23 22 0:5 / /dev rw,nosuid shared:2 - devtmpfs devtmpfs rw
+24 22 0:22 / /var/lib/cleanroom/work rw shared:3 - btrfs /dev/sda3 rw
+25 24 0:4 / /var/lib/cleanroom/work/fs/proc rw - proc proc rw
+26 24 0:5 / /var/lib/cleanroom/work/fs/dev rw - devtmpfs udev rw
+27 26 0:23 / /var/lib/cleanroom/work/fs/dev/pts rw - devpts devpts rw
+28 24 0:24 / /var/lib/cleanroom/work/fs-other rw - tmpfs tmp rw
+29 22 0:25 / /mnt/with\\040space\\011tab rw - tmpfs tmp rw
+'''
+
+
+@pytest.fixture
+def mountinfo(tmpdir, monkeypatch):
+    path = str(tmpdir.join('mountinfo'))
+    with open(path, 'w') as f:
+        f.write(_MOUNTINFO)
+    monkeypatch.setattr(mount, '_MOUNTINFO', path)
+    mount.invalidate_mount_table()
+    yield path
+    mount.invalidate_mount_table()
+
+
+def test_read_mount_table(mountinfo):
+    table = mount.read_mount_table(mountinfo)
+    assert len(table) == 8
+    assert table[0] == '/'
+    assert table[-1] == '/mnt/with space\ttab'
+
+
+def test_read_mount_table_proc():
+    assert '/' in mount.read_mount_table()
+
+
+def test_mount_points(mountinfo):
+    assert mount.mount_points('/var/lib/cleanroom/work/fs') \
+        == ['/var/lib/cleanroom/work/fs/dev/pts',
+            '/var/lib/cleanroom/work/fs/proc',
+            '/var/lib/cleanroom/work/fs/dev']
+
+
+def test_mount_points_chroot(mountinfo):
+    assert mount.mount_points('/dev', chroot='/var/lib/cleanroom/work/fs') \
+        == ['/var/lib/cleanroom/work/fs/dev/pts',
+            '/var/lib/cleanroom/work/fs/dev']
+
+
+def test_mount_points_escaped(mountinfo):
+    assert mount.mount_points('/mnt/with space\ttab') \
+        == ['/mnt/with space\ttab']
+
+
+def test_mount_points_cached(mountinfo):
+    assert mount.mount_points('/mnt', cached=True) \
+        == ['/mnt/with space\ttab']
+
+    with open(mountinfo, 'w') as f:
+        f.write(_MOUNTINFO.split('\n')[0] + '\n')
+
+    assert mount.mount_points('/mnt', cached=True) \
+        == ['/mnt/with space\ttab']
+    assert mount.mount_points('/mnt') == []
+
+    mount.invalidate_mount_table()
+    assert mount.mount_points('/mnt', cached=True) == []
+
+
+def test_top_level():
+    assert mount._top_level(['/a/b/c', '/a/b', '/a/bc', '/d', '/a/b']) \
+        == ['/a/b', '/a/bc', '/d']
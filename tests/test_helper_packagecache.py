@@ -0,0 +1,90 @@
+#!/usr/bin/python
+"""Test for the shared package cache.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.packagecache import PackageCache
+
+
+def _add_package(directory, name, size, last_use):
+    path = os.path.join(directory, name)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    os.utime(path, (last_use, last_use))
+
+
+def test_downloading_stats(tmpdir):
+    cache = PackageCache(str(tmpdir))
+    pacman = cache.subdirectory('pacman')
+    _add_package(pacman, 'old.pkg.tar.zst', 10, 1000)
+
+    with cache.downloading():
+        _add_package(pacman, 'a.pkg.tar.zst', 100, 2000)
+        _add_package(pacman, 'b.pkg.tar.zst', 20, 2000)
+
+    stats = cache.stats()
+    assert stats['downloaded_files'] == 2
+    assert stats['downloaded_bytes'] == 120
+    assert stats['files'] == 3
+    assert stats['bytes'] == 130
+
+
+def test_evict_least_recently_used(tmpdir):
+    cache = PackageCache(str(tmpdir), max_size=100)
+    pacman = cache.subdirectory('pacman')
+    _add_package(pacman, 'oldest.pkg.tar.zst', 100, 1000)
+    _add_package(pacman, 'middle.pkg.tar.zst', 100, 2000)
+    _add_package(pacman, 'newest.pkg.tar.zst', 50, 3000)
+
+    cache.evict()
+
+    assert sorted(os.listdir(pacman)) == ['newest.pkg.tar.zst']
+    stats = cache.stats()
+    assert stats['evicted_files'] == 2
+    assert stats['evicted_bytes'] == 200
+
+
+def test_evict_without_limit(tmpdir):
+    cache = PackageCache(str(tmpdir))
+    pacman = cache.subdirectory('pacman')
+    _add_package(pacman, 'a.pkg.tar.zst', 100, 1000)
+
+    cache.evict()
+
+    assert os.listdir(pacman) == ['a.pkg.tar.zst']
+
+
+def test_evict_only_packages(tmpdir):
+    cache = PackageCache(str(tmpdir), max_size=1)
+    pacman = cache.subdirectory('pacman')
+    _add_package(pacman, 'a.pkg.tar.zst', 100, 1000)
+    _add_package(pacman, 'a.pkg.tar.zst.sig', 10, 1000)
+    databases = cache.subdirectory('pacman-databases')
+    _add_package(databases, 'core.db', 100, 1000)
+    apt = cache.subdirectory('apt')
+    _add_package(apt, 'b.deb', 100, 1000)
+    _add_package(apt, 'lock', 0, 1000)
+    os.makedirs(os.path.join(apt, 'partial'))
+    _add_package(os.path.join(apt, 'partial'), 'c.deb', 50, 1000)
+    kernels = cache.subdirectory('efi-kernels')
+    _add_package(kernels, '0123.efi', 100, 1000)
+    _add_package(kernels, 'notes.txt', 10, 1000)
+
+    assert cache.stats()['files'] == 4
+    cache.evict()
+
+    assert os.listdir(pacman) == []
+    assert os.listdir(databases) == ['core.db']
+    assert sorted(os.listdir(apt)) == ['lock', 'partial']
+    assert os.listdir(os.path.join(apt, 'partial')) == ['c.deb']
+    assert os.listdir(kernels) == ['notes.txt']
+    assert cache.stats()['evicted_files'] == 4
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+"""Test for the pacman package proxy.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import asyncio
+import os
+import socket
+import sys
+import urllib.error
+import urllib.request
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.archlinux.packageproxy import (PackageProxy, prefetch,
+                                                     proxy_config)
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _get(url):
+    with urllib.request.urlopen(url) as response:
+        return response.read()
+
+
+@pytest.fixture
+def mirror(tmpdir):
+    mirror = str(tmpdir.mkdir('mirror'))
+    _write(os.path.join(mirror, 'core/os/x86_64/core.db'), b'core db')
+    _write(os.path.join(mirror, 'core/os/x86_64/a-1-1-any.pkg.tar.zst'),
+           b'a' * 3 * 1024 * 1024)
+    _write(os.path.join(mirror, 'extra/os/x86_64/b-1-1-any.pkg.tar.zst'),
+           b'b')
+    _write(os.path.join(mirror, 'extra/os/x86_64/c-1-1-any.pkg.tar.zst'),
+           b'c')
+    return mirror
+
+
+@pytest.fixture
+def proxy(tmpdir, mirror):
+    packages = str(tmpdir.mkdir('packages'))
+    databases = str(tmpdir.mkdir('databases'))
+    with PackageProxy(mirror, package_directory=packages,
+                      database_directory=databases) as proxy:
+        yield proxy, packages, databases
+
+
+def test_package(proxy, mirror):
+    (package_proxy, packages, _) = proxy
+    url = package_proxy.url + '/core/x86_64/a-1-1-any.pkg.tar.zst'
+    assert _get(url) == b'a' * 3 * 1024 * 1024
+    assert os.listdir(packages) == ['a-1-1-any.pkg.tar.zst']
+
+    # Served from the store from now on:
+    os.remove(os.path.join(mirror, 'core/os/x86_64/a-1-1-any.pkg.tar.zst'))
+    assert _get(url) == b'a' * 3 * 1024 * 1024
+
+
+def test_database(proxy, mirror):
+    (package_proxy, _, databases) = proxy
+    url = package_proxy.url + '/core/x86_64/core.db'
+    assert _get(url) == b'core db'
+    assert os.path.isfile(os.path.join(databases, 'core/x86_64/core.db'))
+
+    # Databases are only fetched once per proxy lifetime:
+    _write(os.path.join(mirror, 'core/os/x86_64/core.db'), b'new core db')
+    assert _get(url) == b'core db'
+
+
+def test_database_refresh(tmpdir, mirror):
+    packages = str(tmpdir.mkdir('packages'))
+    databases = str(tmpdir.mkdir('databases'))
+    _write(os.path.join(databases, 'core/x86_64/core.db'), b'old core db')
+    _write(os.path.join(databases, 'gone/x86_64/gone.db'), b'gone db')
+
+    with PackageProxy(mirror, package_directory=packages,
+                      database_directory=databases) as package_proxy:
+        assert _get(package_proxy.url + '/core/x86_64/core.db') \
+            == b'core db'
+        # Upstream lost it, so the stored one is used:
+        assert _get(package_proxy.url + '/gone/x86_64/gone.db') \
+            == b'gone db'
+
+
+@pytest.mark.parametrize('path', [
+    pytest.param('/core/x86_64/missing.pkg.tar.zst', id='missing'),
+    pytest.param('/core/x86_64/../../../etc/passwd', id='dotdot'),
+    pytest.param('/core/a-1-1-any.pkg.tar.zst', id='short'),
+])
+def test_not_found(proxy, path):
+    (package_proxy, packages, _) = proxy
+    with pytest.raises(urllib.error.HTTPError) as e:
+        _get(package_proxy.url + path)
+    assert e.value.code == 404
+    assert os.listdir(packages) == []
+
+
+def test_upstream_template(tmpdir, mirror):
+    packages = str(tmpdir.mkdir('packages'))
+    with PackageProxy('file://' + mirror + '/$repo/os/$arch',
+                      package_directory=packages,
+                      database_directory=str(tmpdir.mkdir('databases'))) \
+            as package_proxy:
+        assert _get(package_proxy.url + '/extra/x86_64/b-1-1-any.pkg.tar.zst') \
+            == b'b'
+
+
+def test_prefetch(proxy):
+    (package_proxy, packages, _) = proxy
+    urls = [package_proxy.url + '/core/x86_64/a-1-1-any.pkg.tar.zst',
+            package_proxy.url + '/extra/x86_64/b-1-1-any.pkg.tar.zst',
+            package_proxy.url + '/extra/x86_64/c-1-1-any.pkg.tar.zst',
+            'file:///var/cache/pacman/pkg/d-1-1-any.pkg.tar.zst', '']
+    assert prefetch(package_proxy.url, urls)
+    assert sorted(os.listdir(packages)) \
+        == ['a-1-1-any.pkg.tar.zst', 'b-1-1-any.pkg.tar.zst',
+            'c-1-1-any.pkg.tar.zst']
+
+
+def test_prefetch_failure(proxy):
+    (package_proxy, packages, _) = proxy
+    assert not prefetch(package_proxy.url,
+                        [package_proxy.url
+                         + '/extra/x86_64/b-1-1-any.pkg.tar.zst',
+                         package_proxy.url
+                         + '/extra/x86_64/missing.pkg.tar.zst'])
+    assert os.listdir(packages) == ['b-1-1-any.pkg.tar.zst']
+
+
+def test_prefetch_unreachable():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        url = 'http://127.0.0.1:{}'.format(s.getsockname()[1])
+    assert not prefetch(url, [url + '/extra/x86_64/b-1-1-any.pkg.tar.zst'])
+
+
+def test_start_failure(tmpdir, monkeypatch):
+    def start_server(*args, **kwargs):
+        raise OSError('No sockets today')
+
+    monkeypatch.setattr(asyncio, 'start_server', start_server)
+    package_proxy = PackageProxy(str(tmpdir), package_directory=str(tmpdir),
+                                 database_directory=str(tmpdir))
+    with pytest.raises(OSError, match='No sockets today'):
+        package_proxy.start()
+    package_proxy.stop()
+
+
+def test_proxy_config():
+    config = '''\
+[options]
+HoldPkg = pacman glibc
+Include = /etc/pacman.d/options
+
+[core]
+Include = /etc/pacman.d/mirrorlist
+
+[extra]
+SigLevel = Required
+Server = https://mirror.example.com/$repo/os/$arch
+Server = https://other.example.com/$repo/os/$arch
+
+[local]
+Server = file:///srv/repo
+'''
+    assert proxy_config(config, 'http://127.0.0.1:1234') == '''\
+[options]
+HoldPkg = pacman glibc
+Include = /etc/pacman.d/options
+
+[core]
+Server = http://127.0.0.1:1234/$repo/$arch
+
+[extra]
+Server = http://127.0.0.1:1234/$repo/$arch
+SigLevel = Required
+
+[local]
+Server = file:///srv/repo
+'''
@@ -0,0 +1,160 @@
+#!/usr/bin/python
+"""Test for the bulk remove helper.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import glob
+import os
+import random
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.exceptions import GenerateError
+from cleanroom.helper.remover import find_matches, remove_matches
+
+
+_TREE = ('a/one.txt', 'a/two.txt', 'a/.hidden', 'a/x/three.txt',
+         'a/x/y/four.txt', 'a/.dot/five.txt', 'b/one.txt', 'b/c/one.so',
+         'b/c/two.a', 'b/[c]/odd', 'c.txt', '.top/file')
+
+
+def _create_tree(directory, files=_TREE):
+    for f in files:
+        path = os.path.join(directory, f)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as fd:
+            fd.write(f)
+    return directory
+
+
+def _contents(directory):
+    result = set()
+    for (base, dirs, files) in os.walk(directory):
+        for name in dirs + files:
+            result.add(os.path.relpath(os.path.join(base, name), directory))
+    return result
+
+
+def _glob(root, patterns, recursive):
+    result = set()
+    for pattern in patterns:
+        for match in glob.iglob(os.path.join(root, pattern),
+                                recursive=recursive):
+            # glob yields "a/" for "a/**" without checking a if a has no
+            # wildcards, even if a is a file or missing:
+            if match.endswith('/') and not os.path.isdir(match):
+                continue
+            result.add(os.path.normpath(match))
+    return result
+
+
+def _find(root, patterns, recursive):
+    return set(find_matches(root, *(os.path.join(root, p) for p in patterns),
+                            recursive=recursive))
+
+
+@pytest.mark.parametrize('recursive', [False, True])
+@pytest.mark.parametrize('patterns', [
+    pytest.param(('a/*',), id='star'),
+    pytest.param(('a/*.txt',), id='suffix'),
+    pytest.param(('a/.*',), id='hidden'),
+    pytest.param(('*/one.*',), id='middle'),
+    pytest.param(('*',), id='top'),
+    pytest.param(('b/c/two.?',), id='question mark'),
+    pytest.param(('b/[bc]/*',), id='brackets'),
+    pytest.param(('b/[[]c]/*',), id='escaped bracket'),
+    pytest.param(('a/**',), id='double star'),
+    pytest.param(('**/one.*',), id='double star prefix'),
+    pytest.param(('a/**/*.txt',), id='double star middle'),
+    pytest.param(('a/**/**/y',), id='double double star'),
+    pytest.param(('a/x/y/four.txt', 'missing/*'), id='literal'),
+    pytest.param(('a/*', 'a/x/*', 'b/c'), id='overlapping'),
+])
+def test_glob_compatible(tmpdir, patterns, recursive):
+    root = _create_tree(str(tmpdir))
+    assert _find(root, patterns, recursive) \
+        == _glob(root, patterns, recursive)
+
+
+def test_glob_compatible_random(tmpdir):
+    rng = random.Random(23)
+    names = ['a', 'b', 'ab', '.a', 'b.txt', 'a.txt']
+    files = set()
+    for _ in range(200):
+        depth = rng.randint(1, 4)
+        files.add('/'.join(rng.choice(names) for _ in range(depth)))
+    # Keep only files that are not also used as directories:
+    files = {f for f in files
+             if not any(g.startswith(f + '/') for g in files)}
+    root = _create_tree(str(tmpdir), files)
+
+    components = names + ['*', '?', '*.txt', '[ab]', '.*', '**']
+    for _ in range(200):
+        pattern = '/'.join(rng.choice(components)
+                           for _ in range(rng.randint(1, 4)))
+        for recursive in (False, True):
+            if recursive and set(pattern.split('/')) == {'**'}:
+                continue  # Would match root itself
+            assert _find(root, (pattern,), recursive) \
+                == _glob(root, (pattern,), recursive), pattern
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_remove_recursive(tmpdir, jobs):
+    root = _create_tree(str(tmpdir))
+    count = remove_matches(root, os.path.join(root, 'a/*'),
+                           os.path.join(root, 'b/c'),
+                           os.path.join(root, 'b/c/one.so'),
+                           recursive=True, jobs=jobs)
+    assert count == 4
+    assert _contents(root) == {'a', 'a/.hidden', 'a/.dot', 'a/.dot/five.txt',
+                               'b', 'b/one.txt', 'b/[c]', 'b/[c]/odd',
+                               'c.txt', '.top', '.top/file'}
+
+
+def test_remove_not_recursive(tmpdir):
+    root = _create_tree(str(tmpdir))
+    remove_matches(root, os.path.join(root, 'b/c/*'),
+                   os.path.join(root, 'b/c'))
+    assert 'b/c' not in _contents(root)
+
+    with pytest.raises(OSError):
+        remove_matches(root, os.path.join(root, 'a/x'))
+    assert 'a/x/three.txt' in _contents(root)
+
+
+def test_remove_symlinks(tmpdir):
+    root = _create_tree(str(tmpdir.mkdir('root')))
+    outside = _create_tree(str(tmpdir.mkdir('outside')))
+    os.symlink(outside, os.path.join(root, 'escape'))
+    os.symlink('a', os.path.join(root, 'inside'))
+    os.symlink('missing', os.path.join(root, 'b/broken'))
+
+    remove_matches(root, os.path.join(root, '*/one.txt'),
+                   os.path.join(root, 'b/broken'), recursive=True)
+    assert os.path.exists(os.path.join(outside, 'a/one.txt'))
+    assert os.path.exists(os.path.join(outside, 'b/one.txt'))
+    assert not os.path.exists(os.path.join(root, 'a/one.txt'))
+    assert not os.path.exists(os.path.join(root, 'b/one.txt'))
+    assert not os.path.lexists(os.path.join(root, 'b/broken'))
+
+    remove_matches(root, os.path.join(root, '*'), recursive=True)
+    assert os.path.exists(os.path.join(outside, 'a/x/three.txt'))
+    assert _contents(root) == {'.top', '.top/file'}
+
+
+@pytest.mark.parametrize('pattern', [
+    pytest.param('/', id='root'),
+    pytest.param('/**', id='double star'),
+    pytest.param('/../outside', id='outside'),
+])
+def test_remove_refused(tmpdir, pattern):
+    root = _create_tree(str(tmpdir))
+    with pytest.raises(GenerateError):
+        remove_matches(root, root + pattern, recursive=True)
+    assert 'c.txt' in _contents(root)
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+"""Test for the system test runner.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import json
+import os
+import sys
+import time
+import xml.etree.ElementTree as ElementTree
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.testrunner import (output, passed, run_tests, slowest,
+                                         write_json, write_junit)
+
+
+def _test_script(directory, name, script):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n' + script)
+    os.chmod(path, 0o755)
+    return path
+
+
+def _run(tmpdir, tests, **kwargs):
+    return run_tests(tests, 'system', env={'PATH': '/usr/bin:/bin'},
+                     work_directory=str(tmpdir),
+                     log_directory=str(tmpdir.join('logs')), **kwargs)
+
+
+def test_results(tmpdir):
+    tests = [_test_script(str(tmpdir), 'ok', 'echo "ok $1"\n'),
+             _test_script(str(tmpdir), 'fails',
+                          'echo out; echo err >&2; exit 3\n')]
+    results = _run(tmpdir, tests, jobs=2)
+
+    assert [r.name for r in results] == ['ok', 'fails']
+    assert passed(results[0])
+    assert output(results[0]) == 'ok system\n'
+    assert not passed(results[1])
+    assert results[1].returncode == 3
+    assert output(results[1]) == 'out\nerr\n'
+
+
+def test_parallel(tmpdir):
+    tests = [_test_script(str(tmpdir), 'sleep{}'.format(i), 'sleep 0.5\n')
+             for i in range(4)]
+    start = time.monotonic()
+    results = _run(tmpdir, tests, jobs=4)
+    assert time.monotonic() - start < 1.5
+    assert all(passed(r) for r in results)
+
+
+def test_timeout(tmpdir):
+    tests = [_test_script(str(tmpdir), 'hangs',
+                          'echo started\nsleep 30 &\nwait\n')]
+    start = time.monotonic()
+    results = _run(tmpdir, tests, timeout=1)
+    assert time.monotonic() - start < 10
+    assert results[0].timed_out
+    assert not passed(results[0])
+    assert output(results[0]) == 'started\n'
+
+
+def test_on_result(tmpdir):
+    tests = [_test_script(str(tmpdir), 't{}'.format(i), 'exit 0\n')
+             for i in range(3)]
+    reported = []
+    _run(tmpdir, tests, jobs=2, on_result=lambda r: reported.append(r.name))
+    assert sorted(reported) == ['t0', 't1', 't2']
+
+
+def test_reports(tmpdir):
+    tests = [_test_script(str(tmpdir), 'ok', 'echo fine\n'),
+             _test_script(str(tmpdir), 'fails', 'printf "bad\\001"; exit 1\n')]
+    results = _run(tmpdir, tests)
+    assert slowest(results, 1)[0].duration \
+        == max(r.duration for r in results)
+
+    json_file = str(tmpdir.join('results.json'))
+    write_json(results, json_file)
+    with open(json_file, 'r') as f:
+        data = json.load(f)
+    assert [(d['name'], d['passed']) for d in data] \
+        == [('ok', True), ('fails', False)]
+
+    junit_file = str(tmpdir.join('junit.xml'))
+    write_junit(results, junit_file, suite_name='system')
+    suite = ElementTree.parse(junit_file).getroot()
+    assert suite.get('tests') == '2'
+    assert suite.get('failures') == '1'
+    cases = suite.findall('testcase')
+    assert cases[0].find('failure') is None
+    assert cases[1].find('failure').get('message') == 'Exit code 1'
+    assert cases[1].find('system-out').text == 'bad'
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+"""Test for the verity helper in cleanroom.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import uuid
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.verity import create_verity, VerityHashTree
+
+
+_SALT = bytes(range(32))
+_UUID = uuid.UUID('12345678-1234-5678-1234-567812345678')
+
+
+def _data(blocks: int) -> bytes:
+    return b''.join(hashlib.sha256(str(i).encode('utf-8')).digest() * 128
+                    for i in range(blocks))
+
+
+def _reference_root_hash(data: bytes) -> str:
+    """Straight-forward dm-verity root hash calculation."""
+    def hash_blocks(blocks):
+        return [hashlib.sha256(_SALT + b).digest() for b in blocks]
+
+    hashes = hash_blocks(data[i:i + 4096] for i in range(0, len(data), 4096))
+    while len(hashes) > 1:
+        hashes = hash_blocks(b''.join(hashes[i:i + 128]).ljust(4096, b'\0')
+                             for i in range(0, len(hashes), 128))
+    return hashes[0].hex()
+
+
+@pytest.mark.parametrize('blocks', [1, 2, 128, 129, 128 * 128 + 1])
+def test_root_hash(tmpdir, blocks):
+    data_file = str(tmpdir.join('data'))
+    data = _data(blocks)
+    with open(data_file, 'wb') as f:
+        f.write(data)
+
+    verity_file = str(tmpdir.join('verity'))
+    (uuid_str, root_hash) = create_verity(data_file, verity_file,
+                                          salt=_SALT, uuid=_UUID)
+
+    assert uuid_str == str(_UUID)
+    assert root_hash == _reference_root_hash(data)
+
+    with open(verity_file, 'rb') as f:
+        superblock = f.read(4096)
+    assert superblock[:8] == b'verity\0\0'
+    assert struct.unpack_from('<IIQH', superblock, 64) \
+        == (4096, 4096, blocks, len(_SALT))
+    assert superblock[512:] == b'\0' * (4096 - 512)
+
+
+def test_streaming(tmpdir):
+    data = _data(5000) + b'incomplete block'
+    data_file = str(tmpdir.join('data'))
+    with open(data_file, 'wb') as f:
+        f.write(data)
+
+    streamed = VerityHashTree(salt=_SALT, uuid=_UUID)
+    for i in range(0, len(data), 100000):
+        streamed.update(data[i:i + 100000])
+    from_file = VerityHashTree(salt=_SALT, uuid=_UUID)
+    from_file.update_from_file(data_file)
+
+    assert streamed.root_hash() == from_file.root_hash()
+    assert streamed.data_blocks == 5000
+    streamed.write(str(tmpdir.join('streamed')))
+    from_file.write(str(tmpdir.join('from_file')))
+    with open(str(tmpdir.join('streamed')), 'rb') as s, \
+            open(str(tmpdir.join('from_file')), 'rb') as f:
+        assert s.read() == f.read()
+
+
+@pytest.mark.skipif(not shutil.which('veritysetup'),
+                    reason='veritysetup not available')
+def test_veritysetup(tmpdir):
+    data_file = str(tmpdir.join('data'))
+    with open(data_file, 'wb') as f:
+        f.write(_data(1000))
+
+    expected_file = str(tmpdir.join('expected'))
+    result = subprocess.run(['veritysetup', 'format', '--salt', _SALT.hex(),
+                             '--uuid', str(_UUID), data_file, expected_file],
+                            stdout=subprocess.PIPE, check=True)
+    verity_file = str(tmpdir.join('verity'))
+    (_, root_hash) = create_verity(data_file, verity_file,
+                                   salt=_SALT, uuid=_UUID)
+
+    assert [line[10:].strip()
+            for line in result.stdout.decode('utf-8').split('\n')
+            if line.startswith('Root hash:')] == [root_hash]
+    with open(expected_file, 'rb') as e, open(verity_file, 'rb') as v:
+        assert e.read() == v.read()
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+"""Test for running hooks concurrently.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import random
+import sys
+import threading
+import time
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.execobject import ExecObject
+from cleanroom.hookrunner import paths_conflict, run_hooks, static_prefix
+from cleanroom.location import Location
+
+
+@pytest.mark.parametrize(('path', 'expected'), [
+    pytest.param('/usr/share/doc', '/usr/share/doc', id='plain'),
+    pytest.param('/usr/share/doc/*', '/usr/share/doc', id='star'),
+    pytest.param('/usr/lib/systemd/system/*/foo.service',
+                 '/usr/lib/systemd/system', id='middle'),
+    pytest.param('/usr/lib/lib[abc].so', '/usr/lib', id='brackets'),
+    pytest.param('/*', '/', id='root'),
+])
+def test_static_prefix(path, expected):
+    assert static_prefix(path) == expected
+
+
+@pytest.mark.parametrize(('a', 'b', 'expected'), [
+    pytest.param(('/usr/share/doc',), ('/usr/share/man',), False,
+                 id='disjoint'),
+    pytest.param(('/usr/share/doc',), ('/usr/share/doc',), True, id='same'),
+    pytest.param(('/usr/share',), ('/usr/share/doc',), True, id='parent'),
+    pytest.param(('/usr/share/doc',), ('/usr/share',), True, id='child'),
+    pytest.param(('/usr/share/doc',), ('/usr/share/docs',), False,
+                 id='common string prefix'),
+    pytest.param(('/',), ('/usr',), True, id='root'),
+    pytest.param(('/a', '/b'), ('/c', '/b/d'), True, id='many'),
+    pytest.param(None, ('/usr',), True, id='unknown'),
+    pytest.param((), ('/usr',), False, id='nothing'),
+])
+def test_paths_conflict(a, b, expected):
+    assert paths_conflict(a, b) == expected
+
+
+def _hook(index, paths):
+    return ExecObject(location=Location(file_name='test.def',
+                                        line_number=index + 1),
+                      command='test', args=(index,), kwargs={},
+                      paths=paths)
+
+
+def _hooks():
+    """Hooks appending their index to log files in their paths."""
+    rng = random.Random(42)
+    directories = ['a', 'b', 'c', 'a/x', 'a/y', 'd']
+    hooks = []
+    for index in range(60):
+        if index % 17 == 0:
+            hooks.append(_hook(index, None))
+        else:
+            hooks.append(_hook(index, tuple(rng.sample(directories,
+                                                       rng.randint(1, 2)))))
+    return hooks
+
+
+def _execute(directory, hook):
+    time.sleep(random.random() / 1000)
+    for path in hook.paths if hook.paths is not None else ('all',):
+        file_name = os.path.join(directory, path.replace('/', '_'))
+        with open(file_name, 'a') as f:
+            f.write('{} {}\n'.format(hook.args[0], path))
+
+
+def _snapshot(directory):
+    result = {}
+    for name in sorted(os.listdir(directory)):
+        with open(os.path.join(directory, name), 'r') as f:
+            result[name] = f.read()
+    return result
+
+
+def _conflicts_in_order(hooks, order):
+    position = {index: i for (i, index) in enumerate(order)}
+    for later in range(len(hooks)):
+        for earlier in range(later):
+            if paths_conflict(hooks[earlier].paths, hooks[later].paths) \
+                    and position[earlier] > position[later]:
+                return False
+    return True
+
+
+def test_run_hooks_deterministic(tmpdir):
+    hooks = _hooks()
+    sequential = tmpdir.mkdir('sequential')
+    run_hooks(hooks, lambda h: _execute(str(sequential), h),
+              paths=lambda h: h.paths, jobs=1)
+    expected = _snapshot(str(sequential))
+
+    for run in range(10):
+        parallel = tmpdir.mkdir('parallel{}'.format(run))
+        order = []
+        lock = threading.Lock()
+
+        def execute(hook):
+            _execute(str(parallel), hook)
+            with lock:
+                order.append(hook.args[0])
+
+        run_hooks(hooks, execute, paths=lambda h: h.paths, jobs=8)
+        assert sorted(order) == list(range(len(hooks)))
+        assert _conflicts_in_order(hooks, order)
+        assert _snapshot(str(parallel)) == expected
+
+
+def test_run_hooks_concurrently():
+    barrier = threading.Barrier(3, timeout=5)
+    hooks = [_hook(i, ('/dir{}'.format(i),)) for i in range(3)]
+
+    # Only passes if all three hooks run at the same time:
+    run_hooks(hooks, lambda h: barrier.wait(), paths=lambda h: h.paths,
+              jobs=3)
+
+
+def test_run_hooks_failure():
+    hooks = [_hook(0, ('/a',)), _hook(1, ('/b',)), _hook(2, ('/a',)),
+             _hook(3, ('/b',))]
+    executed = []
+
+    def execute(hook):
+        executed.append(hook.args[0])
+        if hook.args[0] in (0, 1):
+            raise RuntimeError('hook {} failed'.format(hook.args[0]))
+
+    with pytest.raises(RuntimeError) as e:
+        run_hooks(hooks, execute, paths=lambda h: h.paths, jobs=4)
+    assert str(e.value) == 'hook 0 failed'
+    assert sorted(executed) == [0, 1]
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+"""Test for laying out and assembling image files.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import struct
+import sys
+import uuid
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.imager import (ExtraPartition, FileDataProvider,
+                              RawImageConfig, _assemble_image_file,
+                              _partition_layout)
+
+
+_MIB = 1024 * 1024
+_ROOT_HASH = '0123456789abcdef' * 4
+
+
+def _config(path='', *, swap_size=0, extra_partitions=(), writer=None,
+            root_size=5 * _MIB + 100, verity_size=100 * 1024):
+    return RawImageConfig(path=path, disk_format='raw', force=True,
+                          repartition=True, min_device_size=0,
+                          efi_size=3 * _MIB, root_size=root_size,
+                          verity_size=verity_size, swap_size=swap_size,
+                          root_hash=_ROOT_HASH, efi_label=None,
+                          root_label='root_label',
+                          verity_label='verity_label', swap_label=None,
+                          extra_partitions=list(extra_partitions),
+                          writer=writer, root_fs_type='squashfs')
+
+
+_BASE_LAYOUT = [('efi', 2 * _MIB, 3 * _MIB),
+                ('root', 5 * _MIB, 5 * _MIB + 512),  # Rounded to sectors
+                ('verity', 11 * _MIB, 100 * 1024)]
+
+
+@pytest.mark.parametrize(('swap_size', 'extra_partitions', 'expected'), [
+    pytest.param(0, [], _BASE_LAYOUT, id='minimal'),
+    pytest.param(4 * _MIB, [],
+                 _BASE_LAYOUT + [('swap', 12 * _MIB, 4 * _MIB)], id='swap'),
+    pytest.param(0, [ExtraPartition(size=2 * _MIB, filesystem='ext4',
+                                    label='data', contents=''),
+                     ExtraPartition(size=_MIB, filesystem=None, label=None,
+                                    contents='')],
+                 _BASE_LAYOUT + [('extra1', 12 * _MIB, 2 * _MIB),
+                                 ('extra2', 14 * _MIB, _MIB)],
+                 id='extra partitions'),
+])
+def test_partition_layout(swap_size, extra_partitions, expected):
+    layout = _partition_layout(_config(swap_size=swap_size,
+                                       extra_partitions=extra_partitions))
+    assert [(name, p.start, p.size) for (name, p) in layout] == expected
+
+    partitions = dict(layout)
+    assert partitions['root'].uuid == str(uuid.UUID(_ROOT_HASH[:32]))
+    assert partitions['verity'].uuid == str(uuid.UUID(_ROOT_HASH[32:]))
+    assert partitions['root'].name == 'root_label'
+    if len(extra_partitions) == 2:
+        assert partitions['extra1'].name == 'data'
+        assert partitions['extra2'].name == 'extra2'
+
+
+def _logging_command(directory, name):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\necho "{} $*" >> "{}"\n'
+                .format(name, os.path.join(directory, 'calls')))
+    os.chmod(path, 0o755)
+    return path
+
+
+def test_assemble_image_file(tmpdir):
+    root_data = os.urandom(5 * _MIB + 100)
+    verity_data = os.urandom(100 * 1024)
+    tmpdir.join('root').write_binary(root_data)
+    tmpdir.join('verity').write_binary(verity_data)
+    tmpdir.join('linux.efi').write_binary(b'kernel')
+    tmpdir.join('systemd-bootx64.efi').write_binary(b'boot')
+    image = str(tmpdir.join('image.img'))
+    ic = _config(image, swap_size=4 * _MIB, writer=FileDataProvider(
+        str(tmpdir.join('root')), str(tmpdir.join('verity')),
+        str(tmpdir.join('linux.efi'))))
+
+    tools = str(tmpdir.mkdir('tools'))
+    _assemble_image_file(
+        ic, boot_loader_file=str(tmpdir.join('systemd-bootx64.efi')),
+        qemu_img_command=_logging_command(tools, 'qemu-img'),
+        mkfs_vfat_command=_logging_command(tools, 'mkfs.vfat'),
+        mcopy_command=_logging_command(tools, 'mcopy'),
+        mmd_command=_logging_command(tools, 'mmd'),
+        mkswap_command=_logging_command(tools, 'mkswap'))
+
+    layout = dict(_partition_layout(ic))
+    with open(image, 'rb') as f:
+        data = f.read()
+    assert len(data) % _MIB == 0
+    assert len(data) >= layout['swap'].start + layout['swap'].size \
+        + 2 * _MIB
+
+    root = layout['root']
+    assert data[root.start:root.start + len(root_data)] == root_data
+    verity = layout['verity']
+    assert data[verity.start:verity.start + len(verity_data)] == verity_data
+
+    assert data[512:520] == b'EFI PART'
+    entries_lba = struct.unpack_from('<Q', data, 512 + 72)[0]
+    for (index, name) in enumerate(('efi', 'root', 'verity')):
+        (_, _, first, last, _, _) = struct.unpack_from(
+            '<16s16sQQQ72s', data, entries_lba * 512 + index * 128)
+        assert first * 512 == layout[name].start
+        assert (last + 1) * 512 == layout[name].start + layout[name].size
+
+    calls = tmpdir.join('tools', 'calls').readlines()
+    assert calls[0].startswith('mkfs.vfat -n EFI ')
+    assert any(c.startswith('mmd ') for c in calls)
+    assert any(c.rstrip().endswith('::EFI/Linux/linux.efi') for c in calls)
+    assert any(c.startswith('mkswap -L main ') for c in calls)
+    assert not any(c.startswith('qemu-img') for c in calls)
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+"""Test for the input hashing of systems.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.execobject import ExecObject
+from cleanroom.inputhash import InputHasher
+from cleanroom.location import Location
+
+
+def _exec_obj(command, *args, **kwargs):
+    return ExecObject(location=Location(file_name='<test>', line_number=1),
+                      command=command, args=args, kwargs=kwargs)
+
+
+@pytest.fixture()
+def hasher(tmpdir):
+    return InputHasher(systems_definition_directory=str(tmpdir),
+                       commands_digest='commands')
+
+
+def test_input_hash_is_stable(hasher):
+    commands = [_exec_obj('based_on', 'scratch'), _exec_obj('pacman', 'vim')]
+    first = hasher.system_hashes('test', '', commands)
+    second = hasher.system_hashes('test', '', commands)
+
+    assert len(first) == 2
+    assert first == second
+
+
+def test_input_hash_prefixes(hasher):
+    old = hasher.system_hashes('test', '',
+                               [_exec_obj('based_on', 'scratch'),
+                                _exec_obj('pacman', 'vim')])
+    new = hasher.system_hashes('test', '',
+                               [_exec_obj('based_on', 'scratch'),
+                                _exec_obj('pacman', 'vim', 'emacs')])
+
+    assert old[0] == new[0]
+    assert old[1] != new[1]
+
+
+@pytest.mark.parametrize(('system_name', 'base_hash', 'kwargs'), [
+    pytest.param('other', '', {}, id='system name'),
+    pytest.param('test', 'base', {}, id='base hash'),
+    pytest.param('test', '', {'remove': True}, id='kwargs'),
+])
+def test_input_hash_changes(hasher, system_name, base_hash, kwargs):
+    reference = hasher.system_hashes('test', '',
+                                     [_exec_obj('pacman', 'vim')])
+    result = hasher.system_hashes(system_name, base_hash,
+                                  [_exec_obj('pacman', 'vim', **kwargs)])
+
+    assert reference[-1] != result[-1]
+
+
+def test_input_hash_referenced_file(tmpdir, hasher):
+    config = os.path.join(str(tmpdir), 'pacstrap.conf')
+    commands = [_exec_obj('pacstrap', 'base', config='pacstrap.conf')]
+
+    with open(config, 'w') as f:
+        f.write('first')
+    first = hasher.system_hashes('test', '', commands)
+
+    with open(config, 'w') as f:
+        f.write('second')
+    second = hasher.system_hashes('test', '', commands)
+
+    assert first != second
+
+
+def test_input_hash_ignores_files_inside_system(tmpdir, hasher):
+    commands = [_exec_obj('remove', '/etc/passwd')]
+    assert hasher._referenced_path('test', '/etc/passwd') == ''
+    assert hasher.system_hashes('test', '', commands) \
+        == hasher.system_hashes('test', '', commands)
@@ -8,6 +8,7 @@
 import pytest  # type: ignore
 import typing
 
+import glob
 import os
 import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
@@ -16,6 +17,8 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
 from cleanroom.command import Command
 from cleanroom.exceptions import ParseError
 from cleanroom.location import Location
+from cleanroom.parser import Parser
+from cleanroom.tokenizer import tokenize
 
 
 class DummyCommand(Command):
@@ -622,3 +625,47 @@ def test_parse_errors(parser, test_input):
     _setup_commands(parser)
     with pytest.raises(ParseError):
         parser.parse_and_verify_string(test_input, '', [])
+
+
+def test_parse_cache(parser, tmpdir):
+    """Test caching of parse results."""
+    _setup_commands(parser)
+    cached_parser = Parser(parser._command_manager,
+                           cache_directory=os.path.join(str(tmpdir), 'cache'))
+
+    def_file = os.path.join(str(tmpdir), 'test.def')
+    with open(def_file, 'w') as f:
+        f.write('test1 arg\n')
+
+    (_, exec_obj_list) = cached_parser.parse(def_file)
+    assert [(e.command, e.args) for e in exec_obj_list] == [(CMD1, ('arg',))]
+
+    def fail(*args):
+        assert False, 'File was parsed again.'
+
+    cached_parser._parse_string = fail
+    (_, exec_obj_list) = cached_parser.parse(def_file)
+    assert [(e.command, e.args) for e in exec_obj_list] == [(CMD1, ('arg',))]
+
+    # Touching the file does not invalidate the cache:
+    os.utime(def_file, (0, 0))
+    (_, exec_obj_list) = cached_parser.parse(def_file)
+    assert [(e.command, e.args) for e in exec_obj_list] == [(CMD1, ('arg',))]
+
+    del cached_parser._parse_string
+    with open(def_file, 'w') as f:
+        f.write('test2 other\n')
+    (_, exec_obj_list) = cached_parser.parse(def_file)
+    assert [(e.command, e.args) for e in exec_obj_list] == [(CMD2, ('other',))]
+
+
+@pytest.mark.parametrize('def_file', sorted(
+    glob.glob(os.path.join(os.path.dirname(__file__), '../examples/*.def'))))
+def test_backends_agree(command_manager, def_file):
+    """Test that both backends tokenize the example systems identically."""
+    with open(def_file, 'r') as f:
+        data = f.read()
+
+    pyparsing_parser = Parser(command_manager, backend='pyparsing')
+    assert tokenize(data, def_file) \
+        == pyparsing_parser._pyparsing_commands(data, def_file)
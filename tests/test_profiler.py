@@ -0,0 +1,54 @@
+#!/usr/bin/python
+"""Test for the Profiler class in cleanroom.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import json
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.helper.run import run
+from cleanroom.location import Location
+from cleanroom.profiler import Profiler
+
+
+def test_nested_commands(tmpdir):
+    profiler = Profiler(str(tmpdir.join('profile')))
+    location = Location(file_name='test.def', line_number=1)
+
+    with profiler.measure('system', 'outer', location):
+        run('/usr/bin/true', trace_output=None)
+        with profiler.measure('system', 'inner', location):
+            run('/usr/bin/true', trace_output=None)
+            run('/usr/bin/true', trace_output=None)
+    profiler.save('system')
+
+    records = profiler.records()
+    assert [(r['command'], r['hook'], r['subprocesses'])
+            for r in records] == [('inner', True, 2), ('outer', False, 1)]
+    assert all(r['wall_time'] >= 0 for r in records)
+
+
+def test_report(tmpdir):
+    profiler = Profiler(str(tmpdir.join('profile')))
+    location = Location(file_name='test.def', line_number=1)
+    for system in ('a', 'b'):
+        for command in ('cmd1', 'cmd2', 'cmd1'):
+            with profiler.measure(system, command, location):
+                pass
+        profiler.save(system)
+
+    report_file = str(tmpdir.join('report.json'))
+    profiler.write_report(report_file)
+
+    with open(report_file, 'r') as f:
+        report = json.load(f)
+    assert len(report['records']) == 6
+    assert sorted((e['command'], e['calls'])
+                  for e in report['commands']) == [('cmd1', 4), ('cmd2', 2)]
+    assert sorted((e['system'], e['calls'])
+                  for e in report['systems']) == [('a', 3), ('b', 3)]
@@ -0,0 +1,72 @@
+#!/usr/bin/python
+"""Test for the SystemsManager class in cleanroom.
+
+@author: Tobias Hunger <tobias.hunger@gmail.com>
+"""
+
+
+import pytest  # type: ignore
+
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..')))
+
+from cleanroom.exceptions import SystemNotFoundError
+from cleanroom.systemsmanager import SystemsManager
+
+
+_SYSTEMS = {
+    'type-a': 'scratch',
+    'type-b': 'type-a',
+    'type-c': 'type-a',
+    'system-d': 'type-b',
+    'system-e': 'scratch',
+}
+
+
+@pytest.fixture()
+def systems_manager(tmpdir, command_manager):
+    for (system, base) in _SYSTEMS.items():
+        with open(os.path.join(str(tmpdir), system + '.def'), 'w') as f:
+            f.write('based_on {}\n'.format(base))
+    return SystemsManager(command_manager, str(tmpdir),
+                          'system-d', 'type-c', 'system-e')
+
+
+def test_systems(systems_manager):
+    systems = systems_manager.systems()
+    assert sorted(systems) == sorted(_SYSTEMS.keys())
+    for system in systems:
+        base = systems_manager.base_system(system)
+        assert base == (None if _SYSTEMS[system] == 'scratch'
+                        else _SYSTEMS[system])
+        if base:
+            assert systems.index(base) < systems.index(system)
+
+
+def test_ancestors(systems_manager):
+    assert systems_manager.ancestors('system-d') == ['type-b', 'type-a']
+    assert systems_manager.ancestors('type-a') == []
+    assert systems_manager.depth('system-d') == 2
+    assert systems_manager.depth('type-a') == 0
+
+
+def test_descendants(systems_manager):
+    assert sorted(systems_manager.children('type-a')) == ['type-b', 'type-c']
+    assert sorted(systems_manager.descendants('type-a')) \
+        == ['system-d', 'type-b', 'type-c']
+    assert systems_manager.descendants('system-e') == []
+
+
+def test_subtree(systems_manager):
+    assert systems_manager.subtree('type-b', 'system-e') \
+        == [s for s in systems_manager.systems()
+            if s in ('type-b', 'system-d', 'system-e')]
+
+
+def test_unknown_system(systems_manager):
+    assert 'type-a' in systems_manager
+    assert 'unknown' not in systems_manager
+    with pytest.raises(SystemNotFoundError):
+        systems_manager.ancestors('unknown')